@@ -1,5 +1,14 @@
+from TabFuncFlow.utils.table_utils import *
+
+
 def f_select_row_col(row_list, col_list, df_table):
+    """
+    Select rows (by position) and columns (by name) of a DataFrame or a Table; the result has the input's type.
+    On an invalid selection the input is returned unchanged.
+    """
     try:
+        if isinstance(df_table, Table):
+            return df_table.select(row_list, col_list)
         row_list = row_list if row_list else slice(None)
         col_list = col_list if col_list else df_table.columns
         return df_table.iloc[row_list][col_list].reset_index(drop=True)
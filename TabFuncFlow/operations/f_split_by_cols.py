@@ -1,4 +1,10 @@
+from TabFuncFlow.utils.table_utils import *
+
+
 def f_split_by_cols(col_groups, df_table):
+    """
+    Split a DataFrame or a Table into sub-tables of the given column groups, of the input's type.
+    """
     subtables = []
 
     if col_groups is None:
@@ -11,7 +17,10 @@ def f_split_by_cols(col_groups, df_table):
         raise ValueError(f"Missing Cols: {missing_cols}")
 
     for i, cols in enumerate(col_groups):
-        sub_df = df_table.iloc[:][cols].reset_index(drop=True)
+        if isinstance(df_table, Table):
+            sub_df = df_table.select(cols=cols)
+        else:
+            sub_df = df_table.iloc[:][cols].reset_index(drop=True)
         subtables.append(sub_df)
 
     return subtables
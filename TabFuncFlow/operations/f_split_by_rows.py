@@ -1,4 +1,10 @@
+from TabFuncFlow.utils.table_utils import *
+
+
 def f_split_by_rows(row_groups, df_table):
+    """
+    Split a DataFrame or a Table into sub-tables of the given row groups, of the input's type.
+    """
     subtables = []
 
     if row_groups is None:
@@ -11,7 +17,10 @@ def f_split_by_rows(row_groups, df_table):
         raise ValueError(f"Missing Rows: {missing_rows}")
 
     for i, rows in enumerate(row_groups):
-        sub_df = df_table.iloc[rows].reset_index(drop=True)
+        if isinstance(df_table, Table):
+            sub_df = df_table.select(rows=rows)
+        else:
+            sub_df = df_table.iloc[rows].reset_index(drop=True)
         subtables.append(sub_df)
 
     return subtables
@@ -10,6 +10,9 @@ from TabFuncFlow.steps_pk_summary.s_pk_match_patient_info import *
 from TabFuncFlow.steps_pk_summary.s_pk_split_by_cols import *
 from TabFuncFlow.steps_pk_summary.s_pk_get_parameter_value import *
 from TabFuncFlow.steps_pk_summary.s_pk_refine_patient_info import *
+from TabFuncFlow.utils.exec_utils import *
+from TabFuncFlow.utils.checkpoint_utils import *
+from TabFuncFlow.utils.preflight_utils import *
 import re
 import itertools
 from difflib import get_close_matches
@@ -67,7 +70,7 @@ def clean_llm_reasoning(text: str) -> str:
     return result if result.endswith("\n") else result + "\n"
 
 
-def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, initial_wait=2, use_color=True, clean_reasoning=False):
+def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, initial_wait=2, use_color=True, clean_reasoning=False, max_workers=4, checkpoint_dir=None, preflight=False, preflight_llm=None, prompt_slicing=False):
     """
     PK Summary Pipeline 250227
     Summarizes pharmacokinetic (PK) data from a given markdown table.
@@ -79,6 +82,11 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     :param initial_wait: Initial delay before retrying (in seconds), which doubles on each failure.
     :param use_color: Better-looking print output.
     :param clean_reasoning: When printing output, hide the parsing-related parts in the reasoning.
+    :param max_workers: Maximum number of independent LLM steps (or per-sub-table calls) running at the same time.
+    :param checkpoint_dir: If set, the output of every LLM step is saved there, and a re-run on the same table resumes from the first incomplete step.
+    :param preflight: Classify the table before any LLM step (see classify_pk_table) and stop early if it is not a PK table. Off by default; run_batch --preflight classifies the tables itself and reports the skipped ones.
+    :param preflight_llm: A cheap model asked when the rule-based pre-flight label is uncertain, e.g. "gemini_15_flash".
+    :param prompt_slicing: In Steps 9-13, show each sub-table's prompt only the main table columns it needs (its own columns and those that are not another parameter value) instead of the whole main table. Experimental and off by default: its effect on accuracy has not been benchmarked yet; compare run_benchmark reports with and without --prompt-slicing (--compare) before relying on it.
     :return:
     """
     if use_color:
@@ -90,6 +98,10 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
         COLOR_START = ""
         COLOR_END = ""
 
+    md_table = as_table(md_table)
+    checkpoint = StepCheckpoint(checkpoint_dir, "pk_summary", md_table, description, llm, {
+        "preflight": preflight, "preflight_llm": preflight_llm, "prompt_slicing": prompt_slicing,
+    })
     step_list = []
     res_list = []
     content_list = []
@@ -102,27 +114,49 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print("=" * 64)
     step_name = "Pre-launch Inspection"
     print(COLOR_START+step_name+COLOR_END)
-    print(COLOR_START+"Usage:"+COLOR_END, 0)
+    if preflight:
+        table_label, res_preflight, content_preflight, usage_preflight, truncated_preflight = checkpoint.run(
+            "preflight", lambda: classify_pk_table(md_table, description, preflight_llm, max_retries, initial_wait))
+    else:
+        table_label, res_preflight, content_preflight, usage_preflight, truncated_preflight = None, True, "Automatic execution.\n", 0, False
+    print(COLOR_START+"Usage:"+COLOR_END, usage_preflight)
     print(COLOR_START+"Result:"+COLOR_END)
     print("Markdown Table:")
     print(display_md_table(md_table))
     print("Description:")
     print(description)
+    if table_label is not None:
+        print("Table Type:", table_label)
     print(COLOR_START + "Reasoning:" + COLOR_END)
-    print("Automatic execution.\n")
+    print(content_preflight)
     step_list.append(step_name)
-    res_list.append(True)
-    content_list.append("Automatic execution.\n")
-    content_list_clean.append("Automatic execution.\n")
-    usage_list.append(0)
-    truncated_list.append(False)
+    res_list.append(res_preflight)
+    content_list.append(content_preflight)
+    content_list_clean.append(clean_llm_reasoning(content_preflight))
+    usage_list.append(usage_preflight)
+    truncated_list.append(truncated_preflight)
+    if table_label == "not_pk":
+        print("Not a PK table, skipping the remaining steps.")
+        return None
+    """
+    Steps 1-6 as a dependency graph: Steps 1, 2 and 4 only need the input table, so they run
+    concurrently together with their dependents; results are reported below in step order.
+    """
+    dag_results = run_dag(checkpoint.wrap_nodes({
+        "drug_info": ([], lambda r: s_pk_extract_drug_info(md_table, description, llm, max_retries, initial_wait)),
+        "patient_info": ([], lambda r: s_pk_extract_patient_info(md_table, description, llm, max_retries, initial_wait)),
+        "patient_info_refined": (["patient_info"], lambda r: s_pk_refine_patient_info(md_table, description, r["patient_info"][0], llm, max_retries, initial_wait)),
+        "summary_only_info": ([], lambda r: s_pk_delete_individual(md_table, llm, max_retries, initial_wait)),
+        "aligned_info": (["summary_only_info"], lambda r: s_pk_align_parameter(r["summary_only_info"][0], llm, max_retries, initial_wait)),
+        "mapping_info": (["aligned_info"], lambda r: s_pk_get_col_mapping(r["aligned_info"][0], llm, max_retries, initial_wait)),
+    }), max_workers=max_workers)
     """
     Step 1: Drug Information Extraction
     """
     print("=" * 64)
     step_name = "Drug Information Extraction"
     print(COLOR_START+step_name+COLOR_END)
-    drug_info = s_pk_extract_drug_info(md_table, description, llm, max_retries, initial_wait)
+    drug_info = dag_results["drug_info"]
     if drug_info is None:
         return None
     md_table_drug, res_drug, content_drug, usage_drug, truncated_drug = drug_info
@@ -144,7 +178,7 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print("=" * 64)
     step_name = "Population Information Extraction"
     print(COLOR_START+step_name+COLOR_END)
-    patient_info = s_pk_extract_patient_info(md_table, description, llm, max_retries, initial_wait)
+    patient_info = dag_results["patient_info"]
     if patient_info is None:
         return None
     md_table_patient, res_patient, content_patient, usage_patient, truncated_patient = patient_info
@@ -232,7 +266,7 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print("=" * 64)
     step_name = "Population Information Refinement"
     print(COLOR_START+step_name+COLOR_END)
-    patient_info_refined = s_pk_refine_patient_info(md_table, description, md_table_patient, llm, max_retries, initial_wait)
+    patient_info_refined = dag_results["patient_info_refined"]
     if patient_info_refined is None:
         return None
     md_table_patient_refined, res_patient_refined, content_patient_refined, usage_patient_refined, truncated_patient_refined = patient_info_refined
@@ -254,7 +288,7 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print("=" * 64)
     step_name = "Individual Data Deletion"
     print(COLOR_START+step_name+COLOR_END)
-    summary_only_info = s_pk_delete_individual(md_table, llm, max_retries, initial_wait)
+    summary_only_info = dag_results["summary_only_info"]
     if summary_only_info is None:
         return None
     md_table_summary, res_summary, content_summary, usage_summary, truncated_summary = summary_only_info
@@ -276,7 +310,7 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print("=" * 64)
     step_name = "Parameter Type Alignment"
     print(COLOR_START+step_name+COLOR_END)
-    aligned_info = s_pk_align_parameter(md_table_summary, llm, max_retries, initial_wait)
+    aligned_info = dag_results["aligned_info"]
     if aligned_info is None:
         return None
     md_table_aligned, res_aligned, content_aligned, usage_aligned, truncated_aligned = aligned_info
@@ -298,7 +332,7 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print("=" * 64)
     step_name = "Column Header Categorization"
     print(COLOR_START+step_name+COLOR_END)
-    mapping_info = s_pk_get_col_mapping(md_table_aligned, llm, max_retries, initial_wait)
+    mapping_info = dag_results["mapping_info"]
     if mapping_info is None:
         return None
     col_mapping, res_mapping, content_mapping, usage_mapping, truncated_mapping = mapping_info
@@ -333,9 +367,9 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
         need_split_col = True
     if parameter_unit_count == 1 and parameter_type_count == 1:
         need_get_unit = False
-    if markdown_to_dataframe(md_table_drug).shape[0] == 1:
+    if as_table(md_table_drug).shape[0] == 1:
         need_match_drug = False
-    if markdown_to_dataframe(md_table_patient).shape[0] == 1:
+    if as_table(md_table_patient).shape[0] == 1:
         need_match_patient = False
     print("=" * 64)
     step_name = "Rough Task Allocation"
@@ -363,7 +397,7 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     step_name = "Sub-table Creation"
     print(COLOR_START + step_name + COLOR_END)
     if need_split_col:
-        split_returns = s_pk_split_by_cols(md_table_aligned, col_mapping, llm, max_retries, initial_wait)
+        split_returns = checkpoint.run("split", lambda: s_pk_split_by_cols(md_table_aligned, col_mapping, llm, max_retries, initial_wait))
         if split_returns is None:
             return None
         md_table_list, res_split, content_split, usage_split, truncated_split = split_returns
@@ -380,20 +414,19 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
 
     _md_table_list = []
     for md in md_table_list:
-        df = markdown_to_dataframe(md)
-        cols_to_drop = [col for col in df.columns if col_mapping.get(col) == "Uncategorized"]
-        df.drop(columns=cols_to_drop, inplace=True)
-        _md_table_list.append(dataframe_to_markdown(df))
+        table = as_table(md)
+        cols_to_keep = [col for col in table.columns if col_mapping.get(col) != "Uncategorized"]
+        _md_table_list.append(table.select(cols=cols_to_keep) if cols_to_keep else Table(""))
     # md_table_list = _md_table_list
     __md_table_list = []
     for md in _md_table_list:
-        df = markdown_to_dataframe(md)
-        cols_to_split = [col for col in df.columns if col_mapping.get(col) == "Parameter value"]
-        common_cols = [col for col in df.columns if col not in cols_to_split]
+        table = as_table(md)
+        cols_to_split = [col for col in table.columns if col_mapping.get(col) == "Parameter value"]
+        common_cols = [col for col in table.columns if col not in cols_to_split]
         for col in cols_to_split:
-            if col in df.columns:
-                selected_cols = [c for c in df.columns if c in common_cols or c == col]
-                __md_table_list.append(dataframe_to_markdown(df[selected_cols].copy()))
+            if col in table.columns:
+                selected_cols = [c for c in table.columns if c in common_cols or c == col]
+                __md_table_list.append(table.select(cols=selected_cols))
     md_table_list = __md_table_list
     print(COLOR_START + "Usage:" + COLOR_END)
     print(usage_split)
@@ -404,37 +437,65 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     print(COLOR_START + "Reasoning:" + COLOR_END)
     print(content_split)
     """
+    Steps 9, 11, 12 and 13 need one LLM call per sub-table and do not depend on each other,
+    so all of these calls are fanned out together on a bounded pool and gathered back by
+    sub-table index below.
+    """
+    fan_out_tasks = {}
+    seen_parameter_types = set()
+    context_columns = [col for col in as_table(md_table_aligned).columns if col_mapping.get(col) != "Parameter value"]
+    tokens_saved = 0
+    for i, md in enumerate(md_table_list):
+        table = as_table(md)
+        col_name_of_parameter_type = [col for col in table.columns if col_mapping.get(col) == "Parameter type"][0]
+        col_name_of_parameter_unit_list = [col for col in table.columns if col_mapping.get(col) == "Parameter unit"]
+        md_main = slice_main_table(md_table_aligned, table.columns + context_columns) if prompt_slicing else md_table_aligned
+        n_tasks = len(fan_out_tasks)
+        if col_name_of_parameter_type not in seen_parameter_types:
+            seen_parameter_types.add(col_name_of_parameter_type)
+            if len(col_name_of_parameter_unit_list) != 1:
+                fan_out_tasks[("unit", col_name_of_parameter_type)] = (
+                    lambda md=md, md_main=md_main: s_pk_get_parameter_type_and_unit(md_main, col_mapping, md, description, llm, max_retries, initial_wait))
+        if need_match_drug:
+            fan_out_tasks[("drug", i)] = (
+                lambda md=md, md_main=md_main: s_pk_match_drug_info(md_main, description, md, md_table_drug, llm, max_retries, initial_wait))
+        if need_match_patient:
+            fan_out_tasks[("patient", i)] = (
+                lambda md=md, md_main=md_main: s_pk_match_patient_info(md_main, description, md, md_table_patient, llm, max_retries, initial_wait))
+        fan_out_tasks[("value", i)] = (
+            lambda md=md, md_main=md_main: s_pk_get_parameter_value(md_main, description, md, llm, max_retries, initial_wait))
+        if prompt_slicing:
+            tokens_saved += record_prompt_slicing(md_table_aligned, md_main, len(fan_out_tasks) - n_tasks)
+    if prompt_slicing:
+        print(f"Prompt slicing: ~{tokens_saved} main table prompt tokens saved over {len(fan_out_tasks)} sub-table calls.")
+    fan_out_results = run_fan_out(checkpoint.wrap_tasks(fan_out_tasks), max_workers=max_workers)
+    """
     Step 9: Unit Extraction
     """
     type_unit_list = []
     type_unit_cache = {}
     round = 0
     for md in md_table_list:
-        df = markdown_to_dataframe(md)
-        col_name_of_parameter_type = [col for col in df.columns if col_mapping.get(col) == "Parameter type"][0]
-        col_name_of_parameter_unit_list = [col for col in df.columns if col_mapping.get(col) == "Parameter unit"]
+        table = as_table(md)
+        col_name_of_parameter_type = [col for col in table.columns if col_mapping.get(col) == "Parameter type"][0]
+        col_name_of_parameter_unit_list = [col for col in table.columns if col_mapping.get(col) == "Parameter unit"]
         if col_name_of_parameter_type in type_unit_cache.keys():
             type_unit_list.append(type_unit_cache[col_name_of_parameter_type])
         else:
             if len(col_name_of_parameter_unit_list) == 1:
                 # print(col_name_of_parameter_unit_list)
                 selected_cols = [col_name_of_parameter_type, col_name_of_parameter_unit_list[0]]
-                df_selected = df[selected_cols].copy()
-                if df_selected is None or df_selected.empty:
+                table_selected = table.select(cols=selected_cols)
+                if not table_selected:
                     raise ValueError(
-                        "df_selected is None or empty. Please check the input DataFrame and selected columns.")
-                df_selected = df_selected.rename(
-                    columns={col_name_of_parameter_type: "Parameter type",
-                             col_name_of_parameter_unit_list[0]: "Parameter unit"}
-                )
-
-                type_unit_list.append(dataframe_to_markdown(df_selected))
+                        "table_selected is empty. Please check the input table and selected columns.")
+                type_unit_list.append(Table.from_cells(["Parameter type", "Parameter unit"], table_selected.rows))
             else:
                 print("=" * 64)
                 step_name = "Unit Extraction" + f" (Trial {str(round)})"
                 round += 1
                 print(COLOR_START + step_name + COLOR_END)
-                unit_info = s_pk_get_parameter_type_and_unit(md_table_aligned, col_mapping, md, description, llm, max_retries, initial_wait)
+                unit_info = fan_out_results[("unit", col_name_of_parameter_type)]
                 if unit_info is None:
                     return None
                 tuple_type_unit, res_type_unit, content_type_unit, usage_type_unit, truncated_type_unit = unit_info
@@ -479,17 +540,16 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     round = 0
     if need_match_drug is False:
         for md in md_table_list:
-            df = markdown_to_dataframe(md)
-            row_num = df.shape[0]
-            df_expanded = pd.concat([markdown_to_dataframe(md_table_drug)] * row_num, ignore_index=True)
-            drug_list.append(dataframe_to_markdown(df_expanded))
+            row_num = as_table(md).shape[0]
+            table_drug = as_table(md_table_drug)
+            drug_list.append(Table.from_cells(table_drug.columns, table_drug.rows * row_num))
     else:
-        for md in md_table_list:
+        for i in range(len(md_table_list)):
             print("=" * 64)
             step_name = "Drug Matching" + f" (Trial {str(round)})"
             round += 1
             print(COLOR_START + step_name + COLOR_END)
-            drug_match_info = s_pk_match_drug_info(md_table_aligned, description, md, md_table_drug, llm, max_retries, initial_wait)
+            drug_match_info = fan_out_results[("drug", i)]
             if drug_match_info is None:
                 return None
             drug_match_list, res_drug_match, content_drug_match, usage_drug_match, truncated_drug_match = drug_match_info
@@ -536,18 +596,17 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     round = 0
     if need_match_patient is False:
         for md in md_table_list:
-            df = markdown_to_dataframe(md)
-            row_num = df.shape[0]
+            row_num = as_table(md).shape[0]
             # df_expanded = pd.concat([markdown_to_dataframe(md_table_patient)] * row_num, ignore_index=True)
-            df_expanded = pd.concat([markdown_to_dataframe(md_table_patient_refined)] * row_num, ignore_index=True)  # 这
-            patient_list.append(dataframe_to_markdown(df_expanded))
+            table_patient = as_table(md_table_patient_refined)  # 这
+            patient_list.append(Table.from_cells(table_patient.columns, table_patient.rows * row_num))
     else:
-        for md in md_table_list:
+        for i in range(len(md_table_list)):
             print("=" * 64)
             step_name = "Population Matching" + f" (Trial {str(round)})"
             round += 1
             print(COLOR_START + step_name + COLOR_END)
-            patient_match_info = s_pk_match_patient_info(md_table_aligned, description, md, md_table_patient, llm, max_retries, initial_wait)
+            patient_match_info = fan_out_results[("patient", i)]
             if patient_match_info is None:
                 return None
             patient_match_list, res_patient_match, content_patient_match, usage_patient_match, truncated_patient_match = patient_match_info
@@ -597,12 +656,12 @@ def p_pk_summary(md_table, description, llm="gemini_15_pro", max_retries=5, init
     """
     value_list = []
     round = 0
-    for md in md_table_list:
+    for i in range(len(md_table_list)):
         print("=" * 64)
         step_name = "Parameter Value Extraction" + f" (Trial {str(round)})"
         round += 1
         print(COLOR_START + step_name + COLOR_END)
-        value_info = s_pk_get_parameter_value(md_table_aligned, description, md, llm, max_retries, initial_wait)
+        value_info = fan_out_results[("value", i)]
         if value_info is None:
             return None
         md_value, res_value, content_value, usage_value, truncated_value = value_info
@@ -0,0 +1,280 @@
+import argparse
+import contextlib
+import os
+import re
+import sqlite3
+import sys
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from TabFuncFlow.utils.table_utils import *
+
+
+"""
+Queue states: pending -> running -> done | failed.
+Tasks left "running" by a killed run are put back to "pending" on the next start.
+"""
+QUEUE_STATES = ["pending", "running", "done", "failed"]
+
+
+def find_tables(input_dir):
+    """
+    Walk a directory tree shaped like <set>/<pmid>/<n>.html (+ <n>.json), or <pmid>/<n>.html.
+
+    :return: List of (set_name, pmid, table_id, html_path), sorted. set_name is the path from input_dir
+             to the PMID directory with "_" as separator, or "" when the PMID directories are directly under input_dir.
+    """
+    tables = []
+    for root, _, files in os.walk(input_dir):
+        set_dir = os.path.relpath(os.path.dirname(root), input_dir)
+        set_name = "" if set_dir in (".", os.pardir) else set_dir.replace(os.sep, "_")
+        for file in files:
+            match = re.match(r"(\d+)\.html$", file)
+            if match:
+                tables.append((set_name, os.path.basename(root), match.group(1), os.path.join(root, file)))
+    return sorted(tables, key=lambda t: (t[0], t[1], int(t[2]), t[3]))
+
+
+def output_name(set_name, pmid, table_id=None):
+    """
+    File name stem of a table (or, without table_id, of a PMID); the set name keeps PMIDs of different sets apart.
+    """
+    name = f"pmid{pmid}" if table_id is None else f"pmid{pmid}_table{table_id}"
+    return f"{set_name}_{name}" if set_name else name
+
+
+class BatchQueue(object):
+    """
+    Persistent work queue (SQLite) of the tables of one batch run.
+    Only the driver process writes to it; workers just return their results.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "html_path TEXT PRIMARY KEY, set_name TEXT, pmid TEXT, table_id TEXT, status TEXT, attempts INTEGER DEFAULT 0, "
+            "usage INTEGER, output TEXT, error TEXT, updated REAL)"
+        )
+        self.conn.commit()
+
+    def add(self, tables):
+        """
+        Add tables not seen before; finished tables keep their state.
+
+        :return: Number of new tasks.
+        """
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO tasks (html_path, set_name, pmid, table_id, status, updated) "
+            "VALUES (?, ?, ?, ?, 'pending', ?)",
+            [(html_path, set_name, pmid, table_id, time.time()) for set_name, pmid, table_id, html_path in tables],
+        )
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def recover(self, retry_failed=False):
+        """
+        Put back tasks interrupted by a killed run (and optionally failed tasks) to "pending".
+        """
+        states = ("running", "failed") if retry_failed else ("running",)
+        self.conn.execute(
+            f"UPDATE tasks SET status = 'pending' WHERE status IN ({', '.join('?' * len(states))})", states
+        )
+        self.conn.commit()
+
+    def pending(self):
+        return self.conn.execute(
+            "SELECT set_name, pmid, table_id, html_path FROM tasks WHERE status = 'pending' "
+            "ORDER BY set_name, pmid, CAST(table_id AS INTEGER)"
+        ).fetchall()
+
+    def start(self, html_path):
+        self.conn.execute(
+            "UPDATE tasks SET status = 'running', attempts = attempts + 1, updated = ? WHERE html_path = ?",
+            (time.time(), html_path),
+        )
+        self.conn.commit()
+
+    def finish(self, html_path, usage, output, error):
+        self.conn.execute(
+            "UPDATE tasks SET status = ?, usage = ?, output = ?, error = ?, updated = ? WHERE html_path = ?",
+            ("failed" if error else "done", usage, output, error, time.time(), html_path),
+        )
+        self.conn.commit()
+
+    def counts(self):
+        counts = dict.fromkeys(QUEUE_STATES, 0)
+        counts.update(dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()))
+        return counts
+
+    def done_outputs(self):
+        return self.conn.execute(
+            "SELECT set_name, pmid, output, usage FROM tasks WHERE status = 'done' AND output IS NOT NULL"
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def process_table(pipeline, set_name, pmid, table_id, html_path, raw_dir, log_dir, llm, max_retries, initial_wait,
+                  max_workers, preflight=False, preflight_llm=None, prompt_slicing=False):
+    """
+    Run one table in a worker process. The pipeline's printout goes to a per-table log file.
+    With preflight, the table is classified first (see classify_pk_table): a table that is not about PK is
+    done without output, and with pipeline "auto" the label chooses the pipeline.
+
+    :return: (html_path, usage, output csv path or None, error message or None)
+    """
+    from TabFuncFlow.utils.preflight_utils import classify_pk_table
+
+    log_path = os.path.join(log_dir, output_name(set_name, pmid, table_id) + ".log")
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        try:
+            md_table = single_html_table_to_markdown(get_html_content_from_file(html_path))
+            caption, footnote = get_caption_and_footnote_from_file(html_path[:-len(".html")] + ".json")
+            description = (caption or "") + (footnote or "")
+            preflight_usage = 0
+            if preflight or pipeline == "auto":
+                table_label, _, content, preflight_usage, _ = classify_pk_table(
+                    md_table, description, preflight_llm, max_retries, initial_wait)
+                print(f"Pre-flight label: {table_label}\n{content}")
+                if table_label == "not_pk":
+                    return html_path, preflight_usage or 0, None, None
+                if pipeline == "auto":
+                    pipeline = table_label
+            if pipeline == "pk_individual":
+                from TabFuncFlow.pipelines.p_pk_individual import p_pk_individual as run_pipeline
+            else:
+                from TabFuncFlow.pipelines.p_pk_summary import p_pk_summary as run_pipeline
+            outputs = run_pipeline(md_table, description, llm, max_retries=max_retries, initial_wait=initial_wait,
+                                   use_color=False, max_workers=max_workers, preflight=False,
+                                   prompt_slicing=prompt_slicing)
+            if outputs is None:
+                return html_path, preflight_usage or 0, None, "Pipeline stopped early."
+            df_result, _, _, _, _, usage_list, _ = outputs
+            usage = sum(u for u in usage_list if u) + (preflight_usage or 0)
+            output = os.path.join(raw_dir, f"{output_name(set_name, pmid, table_id)}_usage{usage}.csv")
+            tmp_output = output + ".tmp"
+            df_result.to_csv(tmp_output)
+            os.replace(tmp_output, output)
+            return html_path, usage, output, None
+        except Exception as e:
+            traceback.print_exc()
+            return html_path, 0, None, f"{type(e).__name__}: {e}"
+
+
+def merge_csv_files(outputs, output_dir):
+    """
+    Merge the per-table CSV files of each PMID into merged/[<set>_]pmid<id>_usage<total>.csv,
+    preserving 'N/A' and adding an unlabeled zero-based index as the first column.
+
+    :param outputs: List of (set_name, pmid, csv path, usage) of finished tables.
+    :param output_dir: Directory of the merged files; stale merged files of the same PMID are replaced.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pmid_data = defaultdict(list)
+    pmid_usage = defaultdict(int)
+    for set_name, pmid, path, usage in sorted(outputs, key=lambda o: o[2]):
+        df = pd.read_csv(path, keep_default_na=False, na_values=[""])
+        if "Unnamed: 0" in df.columns:
+            df.set_index("Unnamed: 0", inplace=True)
+            df.index.name = None
+        pmid_data[(set_name, pmid)].append(df)
+        pmid_usage[(set_name, pmid)] += usage
+
+    for (set_name, pmid), df_list in pmid_data.items():
+        df_combined = pd.concat(df_list)
+        df_combined.insert(0, '', range(len(df_combined)))
+        name = output_name(set_name, pmid)
+        for file in os.listdir(output_dir):
+            if re.match(rf"{re.escape(name)}_usage\d+\.csv$", file):
+                os.remove(os.path.join(output_dir, file))
+        output_file = f"{name}_usage{pmid_usage[(set_name, pmid)]}.csv"
+        df_combined.to_csv(os.path.join(output_dir, output_file), index=False)
+
+
+def run_batch(input_dir, output_dir, pipeline="pk_summary", llm="gemini_15_pro", processes=4, max_retries=5,
+              initial_wait=2, max_workers=4, retry_failed=False, preflight=False, preflight_llm=None,
+              prompt_slicing=False):
+    """
+    Process every table under input_dir with a pool of worker processes.
+    Progress is kept in <output_dir>/queue.sqlite, so running the same command again after a crash
+    or kill only processes the tables that are not finished yet.
+    To share one LLM rate limit between the workers, set LLM_RATE_LIMIT_PATH (see rate_limit_utils).
+
+    :param input_dir: Directory shaped like data/html/<set>/<pmid>/<n>.html|json.
+    :param output_dir: Results directory; per-table CSV files go to raw/, per-PMID files to merged/, logs to logs/.
+    :param pipeline: "pk_summary", "pk_individual", or "auto" to choose per table from its pre-flight label.
+    :param processes: Number of worker processes.
+    :param max_workers: Concurrent LLM steps inside each worker (see p_pk_summary).
+    :param retry_failed: Process tables that failed in a previous run again.
+    :param preflight: Skip tables that are not about PK before any LLM step (see classify_pk_table). Off by default.
+    :param preflight_llm: A cheap model asked when the rule-based pre-flight label is uncertain.
+    :param prompt_slicing: Show the per-sub-table prompts only the main table columns they need (see p_pk_summary).
+                           Experimental; see run_benchmark to measure its effect first.
+    :return: Dictionary of task counts by state.
+    """
+    raw_dir = os.path.join(output_dir, "raw")
+    log_dir = os.path.join(output_dir, "logs")
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+
+    queue = BatchQueue(os.path.join(output_dir, "queue.sqlite"))
+    try:
+        added = queue.add(find_tables(input_dir))
+        queue.recover(retry_failed)
+        tasks = queue.pending()
+        print(f"{added} new tables queued, {len(tasks)} to process: {queue.counts()}")
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = []
+            for set_name, pmid, table_id, html_path in tasks:
+                queue.start(html_path)
+                futures.append(executor.submit(process_table, pipeline, set_name, pmid, table_id, html_path, raw_dir,
+                                               log_dir, llm, max_retries, initial_wait, max_workers, preflight,
+                                               preflight_llm, prompt_slicing))
+            for i, future in enumerate(as_completed(futures)):
+                html_path, usage, output, error = future.result()
+                queue.finish(html_path, usage, output, error)
+                status = f"FAILED ({error})" if error else (f"ok, usage {usage}" if output else "skipped, not a PK table")
+                print(f"[{i + 1}/{len(futures)}] {html_path}: {status}")
+
+        merge_csv_files(queue.done_outputs(), os.path.join(output_dir, "merged"))
+        counts = queue.counts()
+        print(f"Finished: {counts}")
+        return counts
+    finally:
+        queue.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a PK pipeline over a directory of HTML tables.")
+    parser.add_argument("input_dir", help="e.g. data/html/pk_summary_250218")
+    parser.add_argument("output_dir", help="e.g. data/results/results_pk_summary_250401")
+    parser.add_argument("--pipeline", default="pk_summary", choices=["pk_summary", "pk_individual", "auto"])
+    parser.add_argument("--llm", default="gemini_15_pro")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--initial-wait", type=float, default=2)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--retry-failed", action="store_true")
+    parser.add_argument("--preflight", action="store_true", help="Skip tables that are not about PK before any LLM step.")
+    parser.add_argument("--preflight-llm", default=None, help='Cheap model for uncertain pre-flight labels, e.g. "gemini_15_flash".')
+    parser.add_argument("--prompt-slicing", action="store_true",
+                        help="Experimental, not benchmarked yet: show the per-sub-table prompts only the main table "
+                             "columns they need.")
+    args = parser.parse_args(argv)
+
+    counts = run_batch(args.input_dir, args.output_dir, args.pipeline, args.llm, args.processes, args.max_retries,
+                       args.initial_wait, args.max_workers, args.retry_failed, args.preflight, args.preflight_llm,
+                       args.prompt_slicing)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import io
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import traceback
+from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.benchmark_utils import *
+from TabFuncFlow.utils.step_utils import *
+from TabFuncFlow.pipelines.p_pk_summary import p_pk_summary
+from TabFuncFlow.pipelines.p_pk_individual import p_pk_individual
+
+
+PIPELINES = {
+    "pk_summary": p_pk_summary,
+    "pk_individual": p_pk_individual,
+}
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+
+
+class LLMCallRecorder(object):
+    """
+    Collect the LLM call events of one table (see add_llm_call_listener).
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def steps(self):
+        steps = {}
+        for event in self.events:
+            stats = steps.setdefault(event["step"] or "unknown",
+                                     {"calls": 0, "latency": 0.0, "tokens": 0, "prompt_tokens": 0})
+            stats["calls"] += 1
+            stats["latency"] += event["latency"]
+            stats["tokens"] += event["usage"] or 0
+            stats["prompt_tokens"] += event["prompt_tokens"]
+        return steps
+
+
+def run_table(pipeline, md_table, description, llm, max_retries, initial_wait, max_workers, preflight=False,
+              preflight_llm=None, prompt_slicing=False):
+    """
+    Run one pipeline on one table and measure it.
+
+    :param preflight: Let the pipeline classify the table first and skip it if it is not about PK.
+
+    :return: (result DataFrame or None, record dictionary)
+    """
+    recorder = LLMCallRecorder()
+    add_llm_call_listener(recorder)
+    log = io.StringIO()
+    df_result, error = None, None
+    usage_list, step_list = [], []
+    start = time.time()
+    try:
+        with contextlib.redirect_stdout(log):
+            outputs = PIPELINES[pipeline](md_table, description, llm, max_retries=max_retries, initial_wait=initial_wait,
+                                          use_color=False, max_workers=max_workers, preflight=preflight,
+                                          preflight_llm=preflight_llm, prompt_slicing=prompt_slicing)
+        if outputs is not None:
+            df_result, step_list, _, _, _, usage_list, _ = outputs
+        elif "Not a PK table, skipping" not in log.getvalue():
+            error = "Pipeline stopped early."
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        traceback.print_exc(file=log)
+    finally:
+        remove_llm_call_listener(recorder)
+    wall_time = time.time() - start
+    record = {
+        "ok": error is None,
+        "error": error,
+        "skipped": error is None and df_result is None,
+        "wall_time": wall_time,
+        "llm_calls": len(recorder.events),
+        "cached_calls": sum(1 for e in recorder.events if e["cached"]),
+        "hedged_calls": sum(1 for e in recorder.events if e["hedged"]),
+        "retries": len(re.findall(r"Attempt \d+/\d+ failed", log.getvalue())),
+        "tokens": sum(u for u in usage_list if u) if usage_list else sum(e["usage"] or 0 for e in recorder.events),
+        "rows": 0 if df_result is None else int(df_result.shape[0]),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "steps": recorder.steps(),
+        "pipeline_steps": step_list,
+    }
+    return df_result, record
+
+
+def run_benchmark(data_dir, set_names, llm, max_retries, initial_wait, max_workers, max_tables=None, pmids=None,
+                  preflight=False, preflight_llm=None, prompt_slicing=False):
+    """
+    Run the pipelines over every table of the given benchmark sets.
+
+    :param preflight: Skip the tables that the pre-flight classifier calls "not_pk" (see classify_pk_table).
+                      The classifier is scored in the "preflight" part of the report either way.
+    :param preflight_llm: Cheap model for uncertain pre-flight labels (see classify_pk_table).
+    :param prompt_slicing: Show the per-sub-table prompts only the main table columns they need (see p_pk_summary).
+                           Experimental; run the benchmark with and without it to measure its effect.
+    :return: Report dictionary with "config", "tables", "pmids", "aggregate", "prompt_fragments", "prompt_slicing"
+             and "preflight".
+    """
+    tables, pmid_scores = [], []
+    reset_cascade_metrics()
+    reset_fast_path_metrics()
+    reset_prompt_fragment_metrics()
+    reset_prompt_slicing_metrics()
+    for set_name in set_names:
+        pipeline, _ = BENCHMARK_SETS[set_name]
+        results = {}
+        set_tables = list_benchmark_tables(data_dir, set_name)
+        if pmids:
+            set_tables = [t for t in set_tables if t[0] in pmids]
+        if max_tables is not None:
+            set_tables = set_tables[:max_tables]
+        for pmid, table_id in set_tables:
+            print(f"[{set_name}] pmid {pmid} table {table_id} ...", end=" ", flush=True)
+            md_table, description = load_benchmark_table(data_dir, set_name, pmid, table_id)
+            df_result, record = run_table(pipeline, md_table, description, llm, max_retries, initial_wait, max_workers,
+                                          preflight, preflight_llm, prompt_slicing)
+            record.update({"set": set_name, "pipeline": pipeline, "pmid": pmid, "table": table_id})
+            tables.append(record)
+            results.setdefault(pmid, []).append(df_result)
+            status = "skipped" if record["skipped"] else ("ok" if record["ok"] else "FAILED")
+            print(f"{status} {record['wall_time']:.1f}s, "
+                  f"{record['llm_calls']} calls, {record['retries']} retries, {record['tokens']} tokens")
+        for pmid, df_pred_list in results.items():
+            df_gold = load_gold(data_dir, set_name, pmid)
+            if df_gold is None:
+                continue
+            score = score_pmid(pipeline, df_gold, df_pred_list)
+            score.update({"set": set_name, "pmid": pmid})
+            pmid_scores.append(score)
+    return {
+        "config": {
+            "llm": llm,
+            "sets": set_names,
+            "max_retries": max_retries,
+            "initial_wait": initial_wait,
+            "max_workers": max_workers,
+            "max_tables": max_tables,
+            "cascade": dict(STEP_CASCADES),
+            "hedge_percentile": get_llm_hedger().percentile,
+            "preflight": preflight,
+            "preflight_llm": preflight_llm,
+            "prompt_slicing": prompt_slicing,
+        },
+        "tables": tables,
+        "pmids": pmid_scores,
+        "aggregate": aggregate_report(tables, pmid_scores),
+        "cascade": get_cascade_metrics(),
+        "fast_path": get_fast_path_metrics(),
+        "prompt_fragments": get_prompt_fragment_metrics(),
+        "prompt_slicing": get_prompt_slicing_metrics(),
+        "preflight": evaluate_preflight(data_dir, set_names, preflight_llm, pmids),
+    }
+
+
+def print_report(report):
+    aggregate = report["aggregate"]
+    print("=" * 64)
+    print(f"Tables: {aggregate['tables']} ({aggregate['failed_tables']} failed, "
+          f"{aggregate.get('skipped_tables', 0)} skipped by the pre-flight)")
+    print(f"Wall time: {aggregate['wall_time']:.1f}s, LLM calls: {aggregate['llm_calls']}, "
+          f"retries: {aggregate['retries']}, tokens: {aggregate['tokens']}, peak RSS: {aggregate['peak_rss_kb']} KB")
+    if aggregate.get("hedged_calls"):
+        print(f"Hedged LLM calls: {aggregate['hedged_calls']}")
+    print(f"Accuracy: precision {aggregate['precision']:.3f}, recall {aggregate['recall']:.3f}, F1 {aggregate['f1']:.3f}")
+    print("Per-step LLM latency:")
+    for step, stats in sorted(aggregate["steps"].items(), key=lambda s: -s[1]["latency"]):
+        print(f"  {step}: {stats['calls']} calls, {stats['latency']:.1f}s, {stats['tokens']} tokens, "
+              f"~{stats.get('prompt_tokens', 0)} prompt tokens")
+    if report.get("fast_path"):
+        print("Rule-based fast paths:")
+        for step, stats in sorted(report["fast_path"].items()):
+            print(f"  {step}: {stats['skipped']}/{stats['calls']} runs without LLM ({stats['skip_rate']:.0%}), "
+                  f"{stats['resolved']}/{stats['items']} items resolved ({stats['resolved_rate']:.0%})")
+    if report.get("prompt_fragments"):
+        print("Prompt fragments:")
+        for kind, stats in sorted(report["prompt_fragments"].items()):
+            print(f"  {kind}: {stats['renders']} renders for {stats['uses']} uses, "
+                  f"{stats['saved']} saved ({stats['hit_rate']:.0%})")
+    if report.get("prompt_slicing", {}).get("calls"):
+        stats = report["prompt_slicing"]
+        print(f"Prompt slicing: {stats['calls']} sub-table calls, main table ~{stats['full_tokens']} -> "
+              f"~{stats['sliced_tokens']} prompt tokens, {stats['saved']} saved ({stats['saved_rate']:.0%}), "
+              f"~{stats['saved'] / aggregate['tables']:.0f} per table")
+    if report.get("preflight"):
+        print_preflight(report["preflight"])
+    if report.get("cascade"):
+        print("Model cascade:")
+        for step, tiers in sorted(report["cascade"].items()):
+            for model, stats in tiers.items():
+                print(f"  {step} / {model}: {stats['calls']} calls, hit rate {stats['hit_rate']:.0%}, "
+                      f"{stats['latency'] / stats['calls']:.1f}s per call")
+
+
+def print_preflight(preflight):
+    print("Pre-flight classifier:")
+    for label, score in preflight["scores"].items():
+        precision = "n/a" if score["precision"] is None else f"{score['precision']:.3f}"
+        recall = "n/a" if score["recall"] is None else f"{score['recall']:.3f}"
+        print(f"  {label}: precision {precision}, recall {recall} ({score['n_pred']} predicted, {score['n_true']} expected)")
+    for table in preflight["tables"]:
+        if table["label"] != table["expected"]:
+            print(f"  [{table['set']}] pmid {table['pmid']} table {table['table']}: "
+                  f"{table['label']} (expected {table['expected']})")
+
+
+def print_comparison(rows):
+    print("=" * 64)
+    print("Comparison with previous report:")
+    for metric, old, new, change, regression in rows:
+        flag = "  REGRESSION" if regression else ""
+        print(f"  {metric}: {old:.4g} -> {new:.4g} ({change:+.1%}){flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the PK pipelines over the benchmark tables and report speed and accuracy.")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--sets", nargs="+", default=list(BENCHMARK_SETS), choices=list(BENCHMARK_SETS))
+    parser.add_argument("--pmids", nargs="+", default=None, help="Only run these PMIDs.")
+    parser.add_argument("--llm", default="gemini_15_pro", help='Model name, e.g. "gemini_15_pro", "chatgpt_4o" or "replay".')
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--initial-wait", type=float, default=2)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--cascade", default=None,
+                        help='Model cascade, e.g. "s_pk_align_parameter=gemini_15_flash" (see parse_step_cascade).')
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Send a duplicate LLM request when one is slower than this latency percentile, e.g. 0.95.")
+    parser.add_argument("--preflight", action="store_true",
+                        help="Classify each table before its pipeline and skip the tables that are not about PK.")
+    parser.add_argument("--preflight-llm", default=None,
+                        help='Cheap model for uncertain pre-flight table labels, e.g. "gemini_15_flash".')
+    parser.add_argument("--preflight-only", action="store_true",
+                        help="Only score the pre-flight classifier on the benchmark tables, without running the pipelines.")
+    parser.add_argument("--prompt-slicing", action="store_true",
+                        help="Experimental, not benchmarked yet: show the per-sub-table prompts only the main table "
+                             "columns they need. Compare with a report of a run without it (--compare).")
+    parser.add_argument("--max-tables", type=int, default=None, help="Only run the first N tables of each set.")
+    parser.add_argument("--output", default="benchmark_report.json", help="Where to write the JSON report.")
+    parser.add_argument("--compare", default=None, help="A previous JSON report to compare against.")
+    args = parser.parse_args(argv)
+    if args.cascade is not None:
+        configure_step_cascade(parse_step_cascade(args.cascade))
+    if args.hedge_percentile is not None:
+        configure_llm_hedger(percentile=args.hedge_percentile)
+
+    if args.preflight_only:
+        print_preflight(evaluate_preflight(args.data_dir, args.sets, args.preflight_llm, args.pmids))
+        return 0
+
+    report = run_benchmark(args.data_dir, args.sets, args.llm, args.max_retries, args.initial_wait, args.max_workers,
+                           args.max_tables, args.pmids, args.preflight, args.preflight_llm, args.prompt_slicing)
+    save_report(report, args.output)
+    print_report(report)
+    print(f"Report saved: {args.output}")
+
+    if args.compare:
+        rows = compare_reports(load_report(args.compare), report)
+        print_comparison(rows)
+        if any(regression for *_, regression in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
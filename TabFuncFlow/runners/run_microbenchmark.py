@@ -0,0 +1,129 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import pandas as pd
+from TabFuncFlow.utils.table_utils import *
+
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+
+
+def html_string_passes(html_content):
+    """
+    The HTML normalization before normalize_html_table: BeautifulSoup's html.parser, then four string passes
+    that re-split every line.
+    """
+    return deduplicate_headers(fill_empty_headers(
+        remove_empty_col_row(stack_md_table_headers(html_table_to_markdown(html_content)))))
+
+
+def dataframe_to_markdown_iterrows(df_table):
+    """
+    dataframe_to_markdown before dataframe_to_cells: one Series per row, and no escaping.
+    """
+    headers = df_table.columns.tolist()
+    lines = ['| ' + ' | '.join(headers) + ' |', '| ' + ' | '.join(['---'] * len(headers)) + ' |']
+    lines += ['| ' + ' | '.join(str(cell) for cell in row) + ' |' for _, row in df_table.iterrows()]
+    return '\n'.join(lines)
+
+
+def markdown_to_dataframe_split(md_table):
+    """
+    markdown_to_dataframe before parse_markdown_rows: splits on every pipe.
+    """
+    lines = md_table.strip().split('\n')
+    headers = [h.strip() for h in lines[0].split('|')[1:-1]]
+    rows = [[cell.strip() for cell in line.split('|')[1:-1]] for line in lines[2:]]
+    return pd.DataFrame(rows, columns=headers, dtype=str)
+
+
+def synthetic_pk_table(n_cells, n_cols=10):
+    """
+    An individual-PK-like table of about n_cells cells: a subject column, then concentrations and times.
+    """
+    n_rows = max(1, n_cells // n_cols)
+    data = {"Patient": [str(i + 1) for i in range(n_rows)]}
+    for j in range(1, n_cols):
+        data[f"C{j} (ng/mL)"] = [f"{(i * 7 + j * 13) % 1000 / 10:.1f} ± {(i + j) % 50 / 10:.1f}" for i in range(n_rows)]
+    return pd.DataFrame(data)
+
+
+def time_function(func, inputs, repeat):
+    """
+    :return: Best total time in seconds of func over all inputs, out of repeat runs.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_html(data_dir, repeat):
+    """
+    Time the HTML table normalization on the shipped data/html tables, and check that both give the same Markdown.
+    """
+    files = sorted(glob.glob(os.path.join(data_dir, "html", "**", "*.html"), recursive=True))
+    html_list = [get_html_content_from_file(f) for f in files]
+    mismatches = [f for f, html in zip(files, html_list)
+                  if html_string_passes(html) != normalize_html_table(html)]
+    before = time_function(html_string_passes, html_list, repeat)
+    after = time_function(normalize_html_table, html_list, repeat)
+    print(f"HTML normalization of {len(html_list)} tables ({'lxml' if lxml is not None else 'no lxml, string passes'}):")
+    print(f"  string passes: {before * 1000:.1f} ms")
+    print(f"  single pass:   {after * 1000:.1f} ms ({before / after:.1f}x)")
+    for f in mismatches:
+        print(f"  Output differs: {f}")
+    return not mismatches
+
+
+def benchmark_markdown(data_dir, repeat):
+    """
+    Time DataFrame <-> Markdown conversion on synthetic tables of 1k to 100k cells, and check that cells with
+    pipes, newlines and backslashes round-trip.
+    """
+    print("Markdown conversion (before -> after):")
+    for n_cells in (1000, 10000, 100000):
+        df_table = synthetic_pk_table(n_cells)
+        md_table = str(dataframe_to_markdown(df_table))
+        write_before = time_function(dataframe_to_markdown_iterrows, [df_table], repeat)
+        write_after = time_function(dataframe_to_markdown, [df_table], repeat)
+        read_before = time_function(markdown_to_dataframe_split, [md_table], repeat)
+        read_after = time_function(markdown_to_dataframe, [md_table], repeat)
+        print(f"  {df_table.size} cells: dataframe_to_markdown {write_before * 1000:.1f} -> {write_after * 1000:.1f} ms "
+              f"({write_before / write_after:.1f}x), markdown_to_dataframe {read_before * 1000:.1f} -> "
+              f"{read_after * 1000:.1f} ms ({read_before / read_after:.1f}x)")
+    df_table = pd.DataFrame({"Parameter": ["AUC|0-inf", "Cmax\nday 1", "t\\n", "a\\|b\\"], "Value": ["1", "2", "3", "4"]})
+    ok = markdown_to_dataframe(str(dataframe_to_markdown(df_table))).equals(df_table)
+    print(f"  Escaped cells round-trip: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+BENCHMARKS = {
+    "html": benchmark_html,
+    "markdown": benchmark_markdown,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the table conversion helpers on the shipped data.")
+    parser.add_argument("benchmarks", nargs="*", help=f"Benchmarks to run, from {', '.join(BENCHMARKS)} (default: all).")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--repeat", type=int, default=5, help="Report the best of N runs.")
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    ok = True
+    for name in args.benchmarks or list(BENCHMARKS):
+        ok = BENCHMARKS[name](args.data_dir, args.repeat) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
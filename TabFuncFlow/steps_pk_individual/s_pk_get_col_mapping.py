@@ -1,5 +1,6 @@
 import ast
 from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
 from TabFuncFlow.operations.f_transpose import *
 from difflib import get_close_matches
 import re
@@ -11,7 +12,7 @@ def s_pk_get_col_mapping_prompt(md_table):
     column_headers_str = 'These are all its column headers: ' + ", ".join(f'"{col}"' for col in df.columns)
     return f"""
 The following table contains pharmacokinetics (PK) data:  
-{display_md_table(md_table)}
+{prompt_table(md_table)}
 {column_headers_str}
 Carefully analyze the table and follow these steps:  
 (1) Examine all column headers and categorize each one into one of the following groups:  
@@ -27,71 +28,42 @@ Carefully analyze the table and follow these steps:
 
 def s_pk_get_col_mapping(md_table, model_name="gemini_15_pro", max_retries=5, initial_wait=1):
     msg = s_pk_get_col_mapping_prompt(md_table)
-    messages = [msg]
-    question = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
 
-    retries = 0
-    wait_time = initial_wait
-    total_usage = 0
-    all_content = []
+    def parse(content):
+        extracted_data = extract_answer(content, f"No valid column mapping found.")
 
-    while retries < max_retries:
         try:
-            res, content, usage, truncated = get_llm_response(messages, question, model=model_name)
-            content = fix_angle_brackets(content)
+            match_dict = ast.literal_eval(fix_trailing_brackets(extracted_data))
+        except Exception as e:
+            raise ValueError(f"Failed to parse column mapping: {e}") from e
 
-            total_usage += usage
-            all_content.append(f"Attempt {retries + 1}:\n{content}")
+        if not isinstance(match_dict, dict):
+            raise ValueError(f"Parsed content is not a dictionary")
 
-            content = content.replace('\n', '')
-            matches = re.findall(r'<<.*?>>', content)
+        predefined_categories = ["Patient ID", "Parameter", "Uncategorized"]
 
-            if not matches:
-                raise ValueError(f"No valid column mapping found.")
+        match_dict = {
+            fix_col_name(k, md_table): (
+                get_close_matches(v, predefined_categories, n=1)[0] if get_close_matches(v, predefined_categories, n=1) else "Uncategorized"
+            ) for k, v in match_dict.items()
+        }
 
-            extracted_data = matches[-1][2:-2]
+        if not match_dict:
+            raise ValueError(f"Column mapping extraction failed: No mappings found.")
 
-            try:
-                match_dict = ast.literal_eval(fix_trailing_brackets(extracted_data))
-            except Exception as e:
-                raise ValueError(f"Failed to parse column mapping: {e}") from e
+        expected_columns = as_table(md_table).shape[1]
+        if len(match_dict.keys()) != expected_columns:
+            raise ValueError(
+                f"Mismatch: Expected {expected_columns} columns, but got {len(match_dict.keys())} in match_dict."
+            )
 
-            if not isinstance(match_dict, dict):
-                raise ValueError(f"Parsed content is not a dictionary")
+        # parameter_type_count = list(match_dict.values()).count("Parameter type")
+        # if parameter_type_count != 1:
+        #     raise ValueError(
+        #         f"Invalid mapping: Expected 1 'Parameter type' column, but found {parameter_type_count}."
+        #     )
 
-            predefined_categories = ["Patient ID", "Parameter", "Uncategorized"]
-
-            match_dict = {
-                fix_col_name(k, md_table): (
-                    get_close_matches(v, predefined_categories, n=1)[0] if get_close_matches(v, predefined_categories, n=1) else "Uncategorized"
-                ) for k, v in match_dict.items()
-            }
-
-            if not match_dict:
-                raise ValueError(f"Column mapping extraction failed: No mappings found.")
-
-            expected_columns = markdown_to_dataframe(md_table).shape[1]
-            if len(match_dict.keys()) != expected_columns:
-                raise ValueError(
-                    f"Mismatch: Expected {expected_columns} columns, but got {len(match_dict.keys())} in match_dict."
-                )
-
-            # parameter_type_count = list(match_dict.values()).count("Parameter type")
-            # if parameter_type_count != 1:
-            #     raise ValueError(
-            #         f"Invalid mapping: Expected 1 'Parameter type' column, but found {parameter_type_count}."
-            #     )
-
-            return match_dict, res, "\n\n".join(all_content), total_usage, truncated
-
-        except (RuntimeError, ValueError) as e:
-            retries += 1
-            print(f"Attempt {retries}/{max_retries} failed: {e}")
-
-            if retries < max_retries:
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                wait_time *= 2
-
-    raise RuntimeError(f"All {max_retries} attempts failed. Unable to extract column mapping.")
+        return match_dict
 
+    return run_llm_step([msg], parse, model_name, max_retries, initial_wait,
+                        failure_message="Unable to extract column mapping.", retry_on=(RuntimeError, ValueError))
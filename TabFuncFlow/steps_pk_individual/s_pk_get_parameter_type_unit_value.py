@@ -1,5 +1,6 @@
 import ast
 from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
 from TabFuncFlow.operations.f_transpose import *
 import re
 import time
@@ -7,10 +8,7 @@ import time
 
 def s_pk_get_parameter_type_unit_value_prompt(md_table_aligned, parameter_type_list, caption):
     return f"""
-The following main table contains pharmacokinetics (PK) data:  
-{display_md_table(md_table_aligned)}
-Here is the table caption:  
-{caption}
+{main_table_prompt(md_table_aligned, caption)}
 From the main table above, I have extracted some column names which represent parameter types, as a list:  
 {parameter_type_list}
 
@@ -29,30 +27,12 @@ Carefully analyze the table and follow these steps:
 
 
 def s_pk_get_parameter_type_unit_value(md_table_aligned, parameter_type_list, caption, model_name="gemini_15_pro", max_retries=5, initial_wait=1):
-    msg = s_pk_get_parameter_type_unit_value_prompt(md_table_aligned, parameter_type_list, caption)
-    messages = [msg]
-    question = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
+    def run(parameter_types):
+        msg = s_pk_get_parameter_type_unit_value_prompt(md_table_aligned, parameter_types, caption)
+        expected_elements = len(parameter_types)
 
-    retries = 0
-    wait_time = initial_wait
-    total_usage = 0
-    all_content = []
-
-    while retries < max_retries:
-        try:
-            res, content, usage, truncated = get_llm_response(messages, question, model=model_name)
-            content = fix_angle_brackets(content)
-
-            total_usage += usage
-            all_content.append(f"Attempt {retries + 1}:\n{content}")
-
-            content = content.replace('\n', '')
-            matches = re.findall(r'<<.*?>>', content)
-
-            if not matches:
-                raise ValueError(f"No valid parameter type and unit found.")
-
-            extracted_data = matches[-1][2:-2]
+        def parse(content):
+            extracted_data = extract_answer(content, f"No valid parameter type and unit found.")
 
             try:
                 match_tuple = ast.literal_eval(fix_trailing_brackets(extracted_data))
@@ -64,27 +44,23 @@ def s_pk_get_parameter_type_unit_value(md_table_aligned, parameter_type_list, ca
                     f"Parsed content is not a valid (type, unit) tuple: {match_tuple}"
                 )
 
-            if match_tuple is None:
-                raise ValueError(f"Parameter type and unit extraction failed: No valid tuple found.")
-
-            expected_elements = len(parameter_type_list)
             if len(match_tuple[0]) != expected_elements or len(match_tuple[1]) != expected_elements:
-                messages.append("Wrong answer example:\n"+content+f"\nWhy it's wrong:\nMismatch: Expected {expected_elements} parameter types/units, but got {len(match_tuple[0])} (types) and {len(match_tuple[1])} (units). Think about why this happened, correct your approach, and try again with the right answer.")
-                raise ValueError(
-                    f"Mismatch: Expected {expected_elements} parameter types/units, but got {len(match_tuple[0])} (types) and {len(match_tuple[1])} (units)."
-                )
-
-            return match_tuple, res, "\n\n".join(all_content), total_usage, truncated
-
-        except (RuntimeError, ValueError) as e:
-            retries += 1
-            print(f"Attempt {retries}/{max_retries} failed: {e}")
+                message = f"Mismatch: Expected {expected_elements} parameter types/units, but got {len(match_tuple[0])} (types) and {len(match_tuple[1])} (units)."
+                raise StepValidationError(message, retry_feedback(message))
 
-            if retries < max_retries:
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                wait_time *= 2
+            return match_tuple
 
-    raise RuntimeError(f"All {max_retries} attempts failed. Unable to extract parameter type and unit.")
+        return run_llm_step([msg], parse, model_name, max_retries, initial_wait,
+                            failure_message="Unable to extract parameter type and unit.", retry_on=(RuntimeError, ValueError),
+                            name="s_pk_get_parameter_type_unit_value")
 
+    # Each element is answered with a type and a unit; very wide tables are asked in windows of columns.
+    chunks = plan_chunks([2 * estimate_tokens(str(p)) + 6 for p in parameter_type_list])
+    if len(chunks) == 1:
+        return run(parameter_type_list)
 
+    results, res, content, usage, truncated = run_chunks(chunks, lambda start, end: run(parameter_type_list[start:end]))
+    match_tuple = ([t for types, _ in results for t in types], [u for _, units in results for u in units])
+    if len(match_tuple[0]) != len(parameter_type_list) or len(match_tuple[1]) != len(parameter_type_list):
+        raise RuntimeError(f"Windows returned {len(match_tuple[0])} parameter types/units for {len(parameter_type_list)} elements. Unable to extract parameter type and unit.")
+    return match_tuple, res, content, usage, truncated
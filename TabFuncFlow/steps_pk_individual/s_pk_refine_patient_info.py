@@ -1,5 +1,6 @@
 import ast
 from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
 from TabFuncFlow.operations.f_transpose import *
 import re
 import time
@@ -8,12 +9,9 @@ import time
 #     - **Gestational age**: The fetal or neonatal age (or age range) at a specific point in the study. Retain the original wording whenever possible.
 def s_pk_refine_patient_info_prompt(md_table_aligned, caption, patient_md_table):
     return f"""
-The following main table contains pharmacokinetics (PK) data:  
-{display_md_table(md_table_aligned)}
-Here is the table caption:  
-{caption}
+{main_table_prompt(md_table_aligned, caption)}
 From the main table above, I have extracted the following information to create Subtable 1, where each row represents a unique combination of "Patient ID" - "Population" - "Pregnancy stage," as follows:
-{display_md_table(patient_md_table)}
+{prompt_table(patient_md_table)}
 
 Carefully analyze the tables and follow these steps to refine Subtable 1 into a more detailed Subtable 2:  
 
@@ -51,7 +49,7 @@ Carefully analyze the tables and follow these steps to refine Subtable 1 into a
 
 (5) Use **"N/A"** as the placeholder if the information **cannot** be reasonably inferred.
    
-(6) Strictly ensure that you process only rows 0 to {markdown_to_dataframe(patient_md_table).shape[0] - 1} from the Subtable 1 (which has {markdown_to_dataframe(patient_md_table).shape[0]} rows in total).   
+(6) Strictly ensure that you process only rows 0 to {prompt_row_count(patient_md_table) - 1} from the Subtable 1 (which has {prompt_row_count(patient_md_table)} rows in total).   
     - The number of processed rows must **exactly match** the number of rows in the Subtable 1—no more, no less.  
     - **The output must maintain the original row order** from Subtable 1—do not shuffle, reorder, or omit any rows. The Subject N for each row in Subtable 2 must be the same as in Subtable 1.
 """
@@ -60,83 +58,50 @@ Carefully analyze the tables and follow these steps to refine Subtable 1 into a
 
 def s_pk_refine_patient_info(md_table_aligned, caption, patient_md_table, model_name="gemini_15_pro", max_retries=5, initial_wait=1):
     msg = s_pk_refine_patient_info_prompt(md_table_aligned, caption, patient_md_table)
-    messages = [msg]
-    question = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
+    df_patient = markdown_to_dataframe(patient_md_table)
+    expected_rows = df_patient.shape[0]
 
-    retries = 0
-    wait_time = initial_wait
-    total_usage = 0
-    all_content = []
+    def parse(content):
+        extracted_data = extract_answer(content, f"No refined population information found in the content.")
 
-    while retries < max_retries:
         try:
-            res, content, usage, truncated = get_llm_response(messages, question, model=model_name)
-            content = fix_angle_brackets(content)
-
-            total_usage += usage
-            all_content.append(f"Attempt {retries + 1}:\n{content}")
-
-            content = content.replace('\n', '')
-            matches = re.findall(r'<<.*?>>', content)
-            match_angle = matches[-1] if matches else None
-
-            if match_angle:
-                try:
-                    match_list = ast.literal_eval(fix_trailing_brackets(match_angle[2:-2]))
-                    match_list = [list(t) for t in dict.fromkeys(map(tuple, match_list))]
-                except Exception as e:
-                    raise ValueError(f"Failed to parse refined population information. {e}") from e
-            else:
-                raise ValueError(f"No refined population information found in the content.")
-
-            if not match_list:
-                raise ValueError(f"Population information refinement failed: No valid entries found!")
-
-            expected_rows = markdown_to_dataframe(patient_md_table).shape[0]
-            if len(match_list) != expected_rows:
-                messages.append("Wrong answer example:\n" + content + f"\nWhy it's wrong:\nMismatch: Expected {expected_rows} rows, but got {len(match_list)} extracted matches. Think about why this happened, correct your approach, and try again with the right answer.")
-                raise ValueError(
-                    f"Mismatch: Expected {expected_rows} rows, but got {len(match_list)} extracted matches."
-                )
-
-            df_table = pd.DataFrame(match_list, columns=["Patient ID", "Population", "Pregnancy stage", "Pediatric/Gestational age"]).astype(str)
-            print("==== Automatically 'Patient ID' Comparison ====")
-            print(markdown_to_dataframe(patient_md_table)['Patient ID'].tolist(), "== Original ==")
-            print(df_table['Patient ID'].tolist(), "== Refined ==")
-            if not df_table['Patient ID'].equals(markdown_to_dataframe(patient_md_table)['Patient ID']):
-                messages.append("Wrong answer example:\n" + content + f"\nWhy it's wrong:\nThe rows in the refined Subtable 2 do not correspond to those in Subtable 1 on a one-to-one basis. Think about why this happened, correct your approach, and try again with the right answer.")
-                raise ValueError(
-                    f"The rows in the refined Subtable 2 do not correspond to those in Subtable 1 on a one-to-one basis."
-                )
-
-            # print("==== Automatically 'Patient ID' Comparison ====")
-            # original_ids = set(markdown_to_dataframe(patient_md_table)['Patient ID'])
-            # refined_ids = set(df_table['Patient ID'])
-            # print(original_ids, "== Original ==")
-            # print(refined_ids, "== Refined ==")
-
-            # if original_ids != refined_ids:
-            #     missing_ids = original_ids - refined_ids
-            #     extra_ids = refined_ids - original_ids
-            #     error_message = "The refined Subtable 2 does not contain the same 'Patient ID' values as Subtable 1."
-            #     if missing_ids:
-            #         error_message += f"\nMissing Patient IDs: {missing_ids}"
-            #     if extra_ids:
-            #         error_message += f"\nExtra Patient IDs: {extra_ids}"
-            #
-            #     messages = [msg, "Wrong answer example:\n" + content + f"\nWhy it's wrong:\n{error_message}"]
-            #     raise ValueError(error_message)
-
-            return_md_table = dataframe_to_markdown(df_table)
-
-            return return_md_table, res, "\n\n".join(all_content), total_usage, truncated
-
+            match_list = ast.literal_eval(fix_trailing_brackets(extracted_data))
+            match_list = [list(t) for t in dict.fromkeys(map(tuple, match_list))]
         except Exception as e:
-            retries += 1
-            print(f"Attempt {retries}/{max_retries} failed: {e}")
-            if retries < max_retries:
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                wait_time *= 2
-
-    raise RuntimeError(f"All {max_retries} attempts failed. Unable to refine population information.")
+            raise ValueError(f"Failed to parse refined population information. {e}") from e
+
+        if not match_list:
+            raise ValueError(f"Population information refinement failed: No valid entries found!")
+
+        expect_rows(expected_rows)(match_list)
+
+        df_table = pd.DataFrame(match_list, columns=["Patient ID", "Population", "Pregnancy stage", "Pediatric/Gestational age"]).astype(str)
+        print("==== Automatically 'Patient ID' Comparison ====")
+        print(df_patient['Patient ID'].tolist(), "== Original ==")
+        print(df_table['Patient ID'].tolist(), "== Refined ==")
+        if not df_table['Patient ID'].equals(df_patient['Patient ID']):
+            message = f"The rows in the refined Subtable 2 do not correspond to those in Subtable 1 on a one-to-one basis."
+            raise StepValidationError(message, retry_feedback(message))
+
+        # print("==== Automatically 'Patient ID' Comparison ====")
+        # original_ids = set(markdown_to_dataframe(patient_md_table)['Patient ID'])
+        # refined_ids = set(df_table['Patient ID'])
+        # print(original_ids, "== Original ==")
+        # print(refined_ids, "== Refined ==")
+
+        # if original_ids != refined_ids:
+        #     missing_ids = original_ids - refined_ids
+        #     extra_ids = refined_ids - original_ids
+        #     error_message = "The refined Subtable 2 does not contain the same 'Patient ID' values as Subtable 1."
+        #     if missing_ids:
+        #         error_message += f"\nMissing Patient IDs: {missing_ids}"
+        #     if extra_ids:
+        #         error_message += f"\nExtra Patient IDs: {extra_ids}"
+        #
+        #     messages = [msg, "Wrong answer example:\n" + content + f"\nWhy it's wrong:\n{error_message}"]
+        #     raise ValueError(error_message)
+
+        return dataframe_to_markdown(df_table)
+
+    return run_llm_step([msg], parse, model_name, max_retries, initial_wait,
+                        failure_message="Unable to refine population information.")
@@ -1,5 +1,6 @@
 import ast
 from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
 from TabFuncFlow.operations.f_transpose import *
 import pandas as pd
 import time
@@ -9,12 +10,12 @@ import re
 def s_pk_extract_time_and_unit_prompt(md_table, caption, md_data_lines_after_post_process):
     return f"""
 The following table contains pharmacokinetics (PK) data:  
-{display_md_table(md_table)}
+{prompt_table(md_table)}
 Here is the table caption:  
 {caption}
 From the main table above, I have extracted some information to create Subtable 1:  
 Below is Subtable 1:
-{display_md_table(md_data_lines_after_post_process)}  
+{prompt_table(md_data_lines_after_post_process)}  
 Carefully analyze the table and follow these steps:  
 (1) For each row in Subtable 1, add two more columns [Time value, Time unit].  
 - **Time Value:** A specific moment (numerical or time range) when the row of data is recorded, or a drug dose is administered.  
@@ -22,7 +23,7 @@ Carefully analyze the table and follow these steps:
 - **Time Unit:** The unit corresponding to the recorded time point (e.g., "Hour", "Min", "Day").  
 (2) List each unique combination in the format of a list of lists, using Python string syntax. Your answer should be enclosed in double angle brackets, like this:  
    <<[["0-1", "Hour"], ["10", "Min"], ["N/A", "N/A"]]>> (example)  
-(3) Strictly ensure that you process only rows 0 to {markdown_to_dataframe(md_data_lines_after_post_process).shape[0] - 1} from the Subtable 1 (which has {markdown_to_dataframe(md_data_lines_after_post_process).shape[0]} rows in total). 
+(3) Strictly ensure that you process only rows 0 to {prompt_row_count(md_data_lines_after_post_process) - 1} from the Subtable 1 (which has {prompt_row_count(md_data_lines_after_post_process)} rows in total). 
     - The number of processed rows must **exactly match** the number of rows in the Subtable 1—no more, no less.  
 (4) Verify the source of each [Time value, Time unit] combination before including it in your answer.  
 (5) **Absolutely no calculations are allowed—every value must be taken directly from the table without any modifications.** 
@@ -45,65 +46,48 @@ Do NOT include:
 
 def s_pk_extract_time_and_unit(md_table, caption, md_data_lines_after_post_process, model_name="gemini_15_pro",
                                max_retries=5, initial_wait=1):
-    msg = s_pk_extract_time_and_unit_prompt(md_table, caption, md_data_lines_after_post_process)
-    messages = [msg]
-    question = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
+    def build(md_rows):
+        msg = s_pk_extract_time_and_unit_prompt(md_table, caption, md_rows)
+        df_rows = markdown_to_dataframe(md_rows)
+        expected_rows = df_rows.shape[0]
+        row_texts = [" | ".join(map(str, row)) for row in df_rows.itertuples(index=False)]
 
-    retries = 0
-    wait_time = initial_wait
-    total_usage = 0
-    all_content = []
+        def parse(content):
+            extracted_data = extract_answer(content, "No time information found in the extracted content.")
 
-    while retries < max_retries:
-        try:
-            res, content, usage, truncated = get_llm_response(messages, question, model=model_name)
-            content = fix_angle_brackets(content)
-            # print(usage, content)
-
-            total_usage += usage
-            all_content.append(f"Attempt {retries + 1}:\n{content}")
-
-            content = content.replace('\n', '')
-            matches = re.findall(r'<<.*?>>', content)
-            match_angle = matches[-1] if matches else None
-
-            if match_angle:
-                try:
-                    match_list = ast.literal_eval(fix_trailing_brackets(match_angle[2:-2]))
-                    # match_list = [list(t) for t in dict.fromkeys(map(tuple, match_list))]
-                except Exception as e:
-                    raise ValueError(f"Failed to parse extracted time information. {e}") from e
-            else:
-                raise ValueError("No time information found in the extracted content.")
+            try:
+                match_list = ast.literal_eval(fix_trailing_brackets(extracted_data))
+                # match_list = [list(t) for t in dict.fromkeys(map(tuple, match_list))]
+            except Exception as e:
+                raise ValueError(f"Failed to parse extracted time information. {e}") from e
 
             if not match_list:
                 raise ValueError("Time information extraction failed: No valid entries found!")
 
-            expected_rows = markdown_to_dataframe(md_data_lines_after_post_process).shape[0]
-
             # if all the same
             if all(x == match_list[0] for x in match_list):
                 # expand to expect_rows
                 match_list = [match_list[0]] * expected_rows
 
-            df_table = pd.DataFrame(match_list, columns=["Time value", "Time unit"])
-
-            if df_table.shape[0] != expected_rows:
-                messages.append("Wrong answer example:\n" + content + f"\nWhy it's wrong:\nMismatch: Expected {expected_rows} rows, but got {df_table.shape[0]} extracted matches. Think about why this happened, correct your approach, and try again with the right answer.")
-                raise ValueError(
-                    f"Mismatch: Expected {expected_rows} rows, but got {df_table.shape[0]} extracted values."
-                )
-
-            return_md_table = dataframe_to_markdown(df_table)
-
-            return return_md_table, res, "\n\n".join(all_content), total_usage, truncated
-
-        except Exception as e:
-            retries += 1
-            print(f"Attempt {retries}/{max_retries} failed: {e}")
-            if retries < max_retries:
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                wait_time *= 2
-
-    raise RuntimeError(f"All {max_retries} attempts failed. Unable to extract drug information.")
+            rows, unresolved = reconcile_rows(
+                match_list, expected_rows,
+                check_row=lambda row: isinstance(row, (list, tuple)) and len(row) == 2,
+                fits=lambda i, row: value_in_row(row[0], row_texts[i])
+            )
+            if unresolved:
+                if len(match_list) != expected_rows:
+                    raise StepRowsError(
+                        f"Mismatch: Expected {expected_rows} rows, but got {len(match_list)} extracted values.",
+                        retry_feedback(f"Mismatch: Expected {expected_rows} rows, but got {len(match_list)} extracted matches."),
+                        rows, unresolved
+                    )
+                message = f"Invalid data format: Expected 2 columns per row in rows {unresolved}."
+                raise StepRowsError(message, retry_feedback(message), rows, unresolved)
+
+            return [rows[i] for i in range(expected_rows)]
+
+        return [msg], parse
+
+    return run_llm_row_step(build, md_data_lines_after_post_process, model_name, max_retries, initial_wait,
+                            failure_message="Unable to extract drug information.",
+                            finish=lambda rows: dataframe_to_markdown(pd.DataFrame(rows, columns=["Time value", "Time unit"])))
@@ -1,5 +1,8 @@
 import ast
 from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
+from TabFuncFlow.utils.rule_utils import *
+from TabFuncFlow.utils.preflight_utils import *
 from TabFuncFlow.operations.f_transpose import *
 from difflib import get_close_matches
 import re
@@ -11,7 +14,7 @@ def s_pk_get_col_mapping_prompt(md_table):
     column_headers_str = 'These are all its column headers: ' + ", ".join(f'"{col}"' for col in df.columns)
     return f"""
 The following table contains pharmacokinetics (PK) data:  
-{display_md_table(md_table)}
+{prompt_table(md_table)}
 {column_headers_str}
 Carefully analyze the table and follow these steps:  
 (1) Examine all column headers and categorize each one into one of the following groups:  
@@ -25,73 +28,144 @@ Carefully analyze the table and follow these steps:
 """
 
 
-def s_pk_get_col_mapping(md_table, model_name="gemini_15_pro", max_retries=5, initial_wait=1):
-    msg = s_pk_get_col_mapping_prompt(md_table)
-    messages = [msg]
-    question = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
-
-    retries = 0
-    wait_time = initial_wait
-    total_usage = 0
-    all_content = []
-
-    while retries < max_retries:
-        try:
-            res, content, usage, truncated = get_llm_response(messages, question, model=model_name)
-            content = fix_angle_brackets(content)
-
-            total_usage += usage
-            all_content.append(f"Attempt {retries + 1}:\n{content}")
-
-            content = content.replace('\n', '')
-            matches = re.findall(r'<<.*?>>', content)
-
-            if not matches:
-                raise ValueError(f"No valid column mapping found.")
-
-            extracted_data = matches[-1][2:-2]
+"""
+Minimum confidence of every column for the rule-based mapping to replace the LLM call (None never skips it).
+"""
+COL_MAPPING_RULE_CONFIDENCE = 0.9
 
-            try:
-                match_dict = ast.literal_eval(fix_trailing_brackets(extracted_data))
-            except Exception as e:
-                raise ValueError(f"Failed to parse column mapping: {e}") from e
+"""
+Last header levels of numeric columns that are usually not parameter values (times, doses, subjects, study details, ratios).
+"""
+NON_VALUE_HEADER_PATTERN = (r'\b(?:time|dose|dosing|day|week|age|weight|period|visit|date|year|id|patient|subject'
+                            r'|study|studies|ref|reference|no|ratio)s?\b')
+
+
+def has_pk_cue(text):
+    """
+    Whether a header or row label names a PK parameter, a concentration unit or a summary statistic.
+    A bare range is not enough, e.g. a "Range" column next to a "Mean" column.
+    """
+    text = str(text).lower()
+    if any(re.search(pattern, text) for pattern in PK_PARAMETER_PATTERNS) or re.search(CONCENTRATION_UNIT_PATTERN, text):
+        return True
+    stats, variations, intervals, _ = find_statistics(text)
+    return bool(stats or variations or intervals - {"Range"})
+
+
+def classify_col_header(header, values, pk_rows=False):
+    """
+    Rule-based category of one column of a parameter-aligned table.
+
+    :param values: The column's cells.
+    :param pk_rows: Most "Parameter type" rows of the table name a PK parameter or a statistic, so its numeric
+                    columns are parameter values even when their header does not say so (e.g. a group name).
+    :return: (category, confidence between 0 and 1, reason)
+    """
+    if header == "Parameter type":
+        return "Parameter type", 1.0, "aligned parameter column"
+    cells = [str(v) for v in values if not is_missing_cell(v)]
+    name = normalize_header(header)
+
+    if is_p_value_header(header):
+        if all(is_p_value_cell(c) for c in cells):
+            return "P value", 1.0, "P value header and values"
+        return "P value", 0.6, "P value header"
+    if is_unit_header(header):
+        if cells and sum(is_unit_cell(c) for c in cells) >= 0.8 * len(cells):
+            return "Parameter unit", 1.0, "unit header and values"
+        return "Parameter unit", 0.6, "unit header"
+    if not cells:
+        return "Uncategorized", 0.5, "empty column"
+    if is_count_header(header) and all(is_integer_cell(c) for c in cells):
+        return "Uncategorized", 0.95, "subject numbers"
+    if all(is_unit_cell(c) for c in cells):
+        return "Parameter unit", 0.9, "unit values"
+
+    numeric = sum(is_numeric_cell(c) for c in cells) / len(cells)
+    if numeric >= 0.8:
+        if re.search(NON_VALUE_HEADER_PATTERN, name):
+            return "Parameter value", 0.5, "numeric values under a time, dose, subject, study or ratio header"
+        score = (numeric - 0.8) / 0.2
+        if has_pk_cue(header):
+            return "Parameter value", 0.9 + 0.1 * score, f"{numeric:.0%} numeric values under a PK or statistic header"
+        if pk_rows:
+            return "Parameter value", 0.9 + 0.1 * score, f"{numeric:.0%} numeric values in PK parameter rows"
+        return "Parameter value", 0.7 + 0.1 * score, f"{numeric:.0%} numeric values"
+    return "Uncategorized", 0.3, f"{numeric:.0%} numeric values"
+
+
+def s_pk_get_col_mapping_rules(md_table):
+    """
+    Rule-based column mapping from the header text and the value distribution of each column.
+
+    :return: (dictionary of column header to category, dictionary of column header to confidence, reasoning)
+    """
+    df_table = markdown_to_dataframe(md_table)
+    labels = df_table["Parameter type"].tolist() if "Parameter type" in df_table.columns else []
+    pk_rows = bool(labels) and sum(has_pk_cue(label) for label in labels) >= 0.5 * len(labels)
+    mapping, confidence, reasons = {}, {}, []
+    for i, col in enumerate(df_table.columns):
+        category, score, reason = classify_col_header(col, df_table.iloc[:, i].tolist(), pk_rows)
+        mapping[col] = category
+        confidence[col] = score
+        reasons.append(f'"{col}": {category} ({reason}, confidence {score:.2f})')
+    return mapping, confidence, "\n".join(reasons)
+
+
+def s_pk_get_col_mapping(md_table, model_name="gemini_15_pro", max_retries=5, initial_wait=1,
+                         rule_confidence=COL_MAPPING_RULE_CONFIDENCE):
+    """
+    :param rule_confidence: When every column of the rule-based mapping (see s_pk_get_col_mapping_rules) is at
+                            least this confident, with one "Parameter type" and at least one "Parameter value"
+                            column, it is returned without an LLM call. None always asks the LLM.
+    """
+    if rule_confidence is not None:
+        mapping, confidence, reasoning = s_pk_get_col_mapping_rules(md_table)
+        categories = list(mapping.values())
+        confident = sum(score >= rule_confidence for score in confidence.values())
+        if categories.count("Parameter type") != 1 or "Parameter value" not in categories:
+            confident = min(confident, len(categories) - 1)
+        record_fast_path("s_pk_get_col_mapping", confident, len(categories))
+        if confident == len(categories):
+            return mapping, True, "Automatic execution (rule-based column mapping).\n" + reasoning + "\n", 0, False
 
-            if not isinstance(match_dict, dict):
-                raise ValueError(f"Parsed content is not a dictionary")
+    msg = s_pk_get_col_mapping_prompt(md_table)
 
-            predefined_categories = ["Parameter value", "P value", "Parameter type", "Parameter unit", "Uncategorized"]
+    def parse(content):
+        extracted_data = extract_answer(content, f"No valid column mapping found.")
 
-            match_dict = {
-                fix_col_name(k, md_table): (
-                    get_close_matches(v, predefined_categories, n=1)[0] if get_close_matches(v, predefined_categories, n=1) else "Uncategorized"
-                ) for k, v in match_dict.items()
-            }
+        try:
+            match_dict = ast.literal_eval(fix_trailing_brackets(extracted_data))
+        except Exception as e:
+            raise ValueError(f"Failed to parse column mapping: {e}") from e
 
-            if not match_dict:
-                raise ValueError(f"Column mapping extraction failed: No mappings found.")
+        if not isinstance(match_dict, dict):
+            raise ValueError(f"Parsed content is not a dictionary")
 
-            expected_columns = markdown_to_dataframe(md_table).shape[1]
-            if len(match_dict.keys()) != expected_columns:
-                raise ValueError(
-                    f"Mismatch: Expected {expected_columns} columns, but got {len(match_dict.keys())} in match_dict."
-                )
+        predefined_categories = ["Parameter value", "P value", "Parameter type", "Parameter unit", "Uncategorized"]
 
-            parameter_type_count = list(match_dict.values()).count("Parameter type")
-            if parameter_type_count != 1:
-                raise ValueError(
-                    f"Invalid mapping: Expected 1 'Parameter type' column, but found {parameter_type_count}."
-                )
+        match_dict = {
+            fix_col_name(k, md_table): (
+                get_close_matches(v, predefined_categories, n=1)[0] if get_close_matches(v, predefined_categories, n=1) else "Uncategorized"
+            ) for k, v in match_dict.items()
+        }
 
-            return match_dict, res, "\n\n".join(all_content), total_usage, truncated
+        if not match_dict:
+            raise ValueError(f"Column mapping extraction failed: No mappings found.")
 
-        except (RuntimeError, ValueError) as e:
-            retries += 1
-            print(f"Attempt {retries}/{max_retries} failed: {e}")
+        expected_columns = as_table(md_table).shape[1]
+        if len(match_dict.keys()) != expected_columns:
+            raise ValueError(
+                f"Mismatch: Expected {expected_columns} columns, but got {len(match_dict.keys())} in match_dict."
+            )
 
-            if retries < max_retries:
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                wait_time *= 2
+        parameter_type_count = list(match_dict.values()).count("Parameter type")
+        if parameter_type_count != 1:
+            raise ValueError(
+                f"Invalid mapping: Expected 1 'Parameter type' column, but found {parameter_type_count}."
+            )
 
-    raise RuntimeError(f"All {max_retries} attempts failed. Unable to extract column mapping.")
+        return match_dict
 
+    return run_llm_step([msg], parse, model_name, max_retries, initial_wait,
+                        failure_message="Unable to extract column mapping.", retry_on=(RuntimeError, ValueError))
@@ -1,5 +1,7 @@
 import ast
 from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
+from TabFuncFlow.utils.rule_utils import *
 from TabFuncFlow.operations.f_transpose import *
 import pandas as pd
 import re
@@ -13,14 +15,11 @@ def s_pk_get_parameter_value_prompt(md_table_aligned, caption, md_table_aligned_
     extracted_param_types = f""" "{'", "'.join(headers)}" """
 
     return f"""
-The following main table contains pharmacokinetics (PK) data:  
-{display_md_table(md_table_aligned)}
-Here is the table caption:  
-{caption}
+{main_table_prompt(md_table_aligned, caption)}
 From the main table above, I have extracted the following columns to create Subtable 1:  
 {extracted_param_types}  
 Below is Subtable 1:
-{display_md_table(md_table_aligned_with_1_param_type_and_value)}
+{prompt_table(md_table_aligned_with_1_param_type_and_value)}
 Please review the information in Subtable 1 row by row and complete Subtable 2.
 Subtable 2 should have the following column headers only:  
 
@@ -38,7 +37,7 @@ P value: P-value.
 Please Note:
 (1) An interval consisting of two numbers must be placed separately into the Low limit and High limit fields; it is prohibited to place it in the Variation value field.
 (2) For values that do not need to be filled, enter "N/A".
-(3) Strictly ensure that you process only rows 0 to {markdown_to_dataframe(md_table_aligned_with_1_param_type_and_value).shape[0] - 1} from the Subtable 1 (which has {markdown_to_dataframe(md_table_aligned_with_1_param_type_and_value).shape[0]} rows in total). 
+(3) Strictly ensure that you process only rows 0 to {prompt_row_count(md_table_aligned_with_1_param_type_and_value) - 1} from the Subtable 1 (which has {prompt_row_count(md_table_aligned_with_1_param_type_and_value)} rows in total). 
     - The number of processed rows must **exactly match** the number of rows in the Subtable 1—no more, no less.  
 (4) For rows in Subtable 1 that can not be extracted, enter "N/A" for the entire row.
 (5) **Important:** Please return Subtable 2 as a list of lists, excluding the headers. Ensure all values are converted to strings.
@@ -48,31 +47,65 @@ Please Note:
 """
 
 
-def s_pk_get_parameter_value(md_table_aligned, caption, md_table_aligned_with_1_param_type_and_value, model_name="gemini_15_pro", max_retries=5, initial_wait=1):
-    msg = s_pk_get_parameter_value_prompt(md_table_aligned, caption, md_table_aligned_with_1_param_type_and_value)
-    messages = [msg]
-    question = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
-
-    retries = 0
-    wait_time = initial_wait
-    total_usage = 0
-    all_content = []
-
-    while retries < max_retries:
-        try:
-            res, content, usage, truncated = get_llm_response(messages, question, model=model_name)
-            content = fix_angle_brackets(content)
-
-            total_usage += usage
-            all_content.append(f"Attempt {retries + 1}:\n{content}")
-
-            content = content.replace('\n', '')
-            matches = re.findall(r'<<.*?>>', content)
-
-            if not matches:
-                raise ValueError(f"No valid parameter values found.")
-
-            extracted_data = matches[-1][2:-2]
+def s_pk_get_parameter_value_rules(caption, md_table_aligned_with_1_param_type_and_value):
+    """
+    Parse the value cells of Subtable 1 without the LLM (see parse_value_cell). The statistics labels come
+    from the row's parameter type, then the value column header, then the caption.
+
+    :return: Dictionary mapping row index to its 8 Subtable 2 values, for the rows parsed unambiguously.
+    """
+    df_table = markdown_to_dataframe(md_table_aligned_with_1_param_type_and_value)
+    value_cols, p_value_cols = [], []
+    for i, col in enumerate(df_table.columns):
+        cells = [c for c in df_table.iloc[:, i] if not is_missing_cell(c)]
+        if col == "Parameter type" or is_unit_header(col) or (cells and all(is_unit_cell(c) for c in cells)):
+            continue
+        (p_value_cols if is_p_value_header(col) else value_cols).append(i)
+    if len(value_cols) != 1 or len(p_value_cols) > 1 or "Parameter type" not in df_table.columns:
+        return {}
+
+    value_col = value_cols[0]
+    header_hints = find_statistics(df_table.columns[value_col], count_header=True)
+    caption_hints = find_statistics(caption)
+    rows = {}
+    for i in range(df_table.shape[0]):
+        cell = df_table.iloc[i, value_col]
+        if is_missing_cell(cell):
+            rows[i] = ["N/A"] * 8
+            continue
+        p_value = "N/A"
+        if p_value_cols:
+            p_cell = str(df_table.iloc[i, p_value_cols[0]]).strip()
+            if not is_missing_cell(p_cell):
+                if not is_p_value_cell(p_cell):
+                    continue
+                p_value = p_cell
+        values = parse_value_cell(cell, [find_statistics(df_table["Parameter type"].iloc[i]), header_hints, caption_hints])
+        if values is not None:
+            rows[i] = values + [p_value]
+    return rows
+
+
+def s_pk_get_parameter_value(md_table_aligned, caption, md_table_aligned_with_1_param_type_and_value, model_name="gemini_15_pro", max_retries=5, initial_wait=1,
+                             rules=True):
+    """
+    :param rules: Parse the common cell formats without the LLM (see s_pk_get_parameter_value_rules);
+                  only the remaining rows are sent to the LLM.
+    """
+    expected_columns = [
+        'Main value', 'Statistics type', 'Variation type', 'Variation value',
+        'Interval type', 'Lower bound', 'Upper bound', 'P value'
+    ]
+    rule_rows = s_pk_get_parameter_value_rules(caption, md_table_aligned_with_1_param_type_and_value) if rules else None
+
+    def build(md_rows):
+        msg = s_pk_get_parameter_value_prompt(md_table_aligned, caption, md_rows)
+        df_rows = markdown_to_dataframe(md_rows)
+        expected_rows = df_rows.shape[0]
+        row_texts = [" | ".join(map(str, row)) for row in df_rows.itertuples(index=False)]
+
+        def parse(content):
+            extracted_data = extract_answer(content, f"No valid parameter values found.")
 
             try:
                 match_list = ast.literal_eval(fix_trailing_brackets(extracted_data))
@@ -89,38 +122,28 @@ def s_pk_get_parameter_value(md_table_aligned, caption, md_table_aligned_with_1_
                     f"Parameter value extraction failed: No valid values found."
                 )
 
-            expected_columns = [
-                'Main value', 'Statistics type', 'Variation type', 'Variation value',
-                'Interval type', 'Lower bound', 'Upper bound', 'P value'
-            ]
-
-            for row in match_list:
-                if len(row) != len(expected_columns):
-                    messages.append("Wrong answer example:\n" + content + f"\nWhy it's wrong:\nInvalid data format: Expected {len(expected_columns)} columns per row, but got {len(row)}.\nRow: {row}\nThink about why this happened, correct your approach, and try again with the right answer.")
-                    raise ValueError(
-                        f"Invalid data format: Expected {len(expected_columns)} columns per row, but got {len(row)}.\nRow: {row}"
-                    )
-
-            df_table = pd.DataFrame(match_list, columns=expected_columns)
-
-            expected_rows = markdown_to_dataframe(md_table_aligned_with_1_param_type_and_value).shape[0]
-            if df_table.shape[0] != expected_rows:
-                messages.append("Wrong answer example:\n" + content + f"\nWhy it's wrong:\nMismatch: Expected {expected_rows} rows, but got {df_table.shape[0]} extracted values. Think about why this happened, correct your approach, and try again with the right answer.")
-                raise ValueError(
-                    f"Mismatch: Expected {expected_rows} rows, but got {df_table.shape[0]} extracted values."
-                )
-
-            return_md_table = dataframe_to_markdown(df_table)
-
-            return return_md_table, res, "\n\n".join(all_content), total_usage, truncated
-
-        except (RuntimeError, ValueError) as e:
-            retries += 1
-            print(f"Attempt {retries}/{max_retries} failed: {e}")
-
-            if retries < max_retries:
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                wait_time *= 2
-
-    raise RuntimeError(f"All {max_retries} attempts failed. Unable to extract parameter values.")
+            def check_row(row):
+                return isinstance(row, (list, tuple)) and len(row) == len(expected_columns)
+
+            rows, unresolved = reconcile_rows(
+                match_list, expected_rows, check_row=check_row,
+                fits=lambda i, row: value_in_row(row[0], row_texts[i])
+            )
+            if unresolved:
+                bad_rows = [row for row in match_list if not check_row(row)]
+                if bad_rows:
+                    row = bad_rows[0]
+                    columns = len(row) if isinstance(row, (list, tuple)) else 1
+                    message = f"Invalid data format: Expected {len(expected_columns)} columns per row, but got {columns}.\nRow: {row}"
+                    raise StepRowsError(message, f"{message}\n{RETRY_HINT}", rows, unresolved)
+                message = f"Mismatch: Expected {expected_rows} rows, but got {len(match_list)} extracted values."
+                raise StepRowsError(message, retry_feedback(message), rows, unresolved)
+
+            return [rows[i] for i in range(expected_rows)]
+
+        return [msg], parse
+
+    return run_llm_row_step(build, md_table_aligned_with_1_param_type_and_value, model_name, max_retries, initial_wait,
+                            failure_message="Unable to extract parameter values.", retry_on=(RuntimeError, ValueError),
+                            finish=lambda rows: dataframe_to_markdown(pd.DataFrame(rows, columns=expected_columns)),
+                            row_overhead=estimate_tokens(repr(["N/A"] * len(expected_columns))), known_rows=rule_rows)
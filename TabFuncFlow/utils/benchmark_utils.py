@@ -0,0 +1,273 @@
+import json
+import os
+import re
+from collections import Counter
+import pandas as pd
+from TabFuncFlow.utils.table_utils import *
+from TabFuncFlow.utils.preflight_utils import *
+
+
+"""
+Benchmark sets: name -> (pipeline, gold file pattern relative to data/benchmark/<name>).
+"""
+BENCHMARK_SETS = {
+    "pk_summary_250218": ("pk_summary", "{pmid}-pk-summary-baseline.csv"),
+    "pk_summary_curators_250307": ("pk_summary", "A - {pmid}.csv"),
+    "pk_individual_250304": ("pk_individual", "{pmid}.csv"),
+}
+
+"""
+Columns compared for accuracy, as (gold columns, predicted columns). Each row becomes a tuple of numbers.
+"""
+SUMMARY_VALUE_COLUMNS = (
+    ["Value", "Variation value", "Lower limit", "High limit"],
+    ["Parameter value", "Variation value", "Lower bound", "Upper bound"],
+)
+INDIVIDUAL_VALUE_COLUMN = "Parameter value"
+
+"""
+Expected pre-flight labels of benchmark tables that do not belong to their set's pipeline:
+(set, pmid, table) -> label. Every other table is expected to get its set's pipeline as label.
+"""
+PREFLIGHT_TRUTH = {
+    ("pk_individual_250304", "32153014", "1"): "not_pk",  # Subject characteristics, no PK values in the gold file.
+}
+
+"""
+Aggregate metrics compared between two reports: name -> (direction, relative tolerance).
+"higher" means a larger value is better.
+"""
+REPORT_METRICS = {
+    "wall_time": ("lower", 0.10),
+    "llm_calls": ("lower", 0.05),
+    "retries": ("lower", 0.10),
+    "tokens": ("lower", 0.05),
+    "prompt_tokens": ("lower", 0.05),
+    "peak_rss_kb": ("lower", 0.10),
+    "failed_tables": ("lower", 0.0),
+    "f1": ("higher", 0.01),
+}
+
+
+def list_benchmark_tables(data_dir, set_name):
+    """
+    List the source tables of a benchmark set.
+
+    :param data_dir: The repository's data directory.
+    :param set_name: e.g. "pk_summary_250218".
+    :return: List of (pmid, table_id), sorted.
+    """
+    html_dir = os.path.join(data_dir, "html", set_name)
+    tables = []
+    for pmid in sorted(os.listdir(html_dir)):
+        pmid_dir = os.path.join(html_dir, pmid)
+        if not os.path.isdir(pmid_dir):
+            continue
+        for file in os.listdir(pmid_dir):
+            match = re.match(r"(\d+)\.html$", file)
+            if match:
+                tables.append((pmid, match.group(1)))
+    return sorted(tables, key=lambda t: (t[0], int(t[1])))
+
+
+def load_benchmark_table(data_dir, set_name, pmid, table_id):
+    """
+    Load one source table the same way as the pipeline notebooks.
+
+    :return: (md_table, description), where description is the caption followed by the footnote.
+    """
+    base = os.path.join(data_dir, "html", set_name, pmid, table_id)
+    md_table = normalize_html_table(get_html_content_from_file(base + ".html"))
+    caption, footnote = get_caption_and_footnote_from_file(base + ".json")
+    return md_table, caption + footnote
+
+
+def load_gold(data_dir, set_name, pmid):
+    """
+    :return: The gold DataFrame of a PMID, or None if the set has no gold file for it.
+    """
+    _, pattern = BENCHMARK_SETS[set_name]
+    path = os.path.join(data_dir, "benchmark", set_name, pattern.format(pmid=pmid))
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+
+def normalize_number(cell):
+    """
+    Parse a table cell into a number, e.g. "1,234.5" -> 1234.5. Returns None if there is no number.
+    """
+    if cell is None:
+        return None
+    match = re.search(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", str(cell).replace(",", ""))
+    if not match:
+        return None
+    return round(float(match.group()), 6)
+
+
+def value_tuples(df, columns):
+    """
+    :return: Counter of the numeric tuples of the given columns; rows without any number are skipped.
+    """
+    tuples = Counter()
+    if df is None:
+        return tuples
+    for row in df.reindex(columns=columns).itertuples(index=False):
+        values = tuple(normalize_number(cell) if pd.notna(cell) else None for cell in row)
+        if any(v is not None for v in values):
+            tuples[values] += 1
+    return tuples
+
+
+def individual_gold_values(df_gold):
+    """
+    The individual gold files are wide ("Value 1" ... "Value 22"); collect every value as a 1-tuple.
+    """
+    values = Counter()
+    for col in df_gold.columns:
+        if re.fullmatch(r"Value \d+", col):
+            for cell in df_gold[col]:
+                number = normalize_number(cell)
+                if number is not None:
+                    values[(number,)] += 1
+    return values
+
+
+def score_values(gold, predicted):
+    """
+    Multiset precision / recall / F1 of predicted value tuples against gold value tuples.
+    """
+    matched = sum((gold & predicted).values())
+    n_gold, n_pred = sum(gold.values()), sum(predicted.values())
+    precision = matched / n_pred if n_pred else 0.0
+    recall = matched / n_gold if n_gold else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"n_gold": n_gold, "n_pred": n_pred, "matched": matched, "precision": precision, "recall": recall, "f1": f1}
+
+
+def score_pmid(pipeline, df_gold, df_pred_list):
+    """
+    Score all tables of one PMID, merged, against its gold file.
+
+    :param pipeline: "pk_summary" or "pk_individual".
+    :param df_gold: Gold DataFrame.
+    :param df_pred_list: Pipeline results of every table of the PMID (None for failed tables).
+    """
+    df_pred_list = [df for df in df_pred_list if df is not None]
+    df_pred = pd.concat(df_pred_list, ignore_index=True) if df_pred_list else None
+    if pipeline == "pk_summary":
+        gold_columns, pred_columns = SUMMARY_VALUE_COLUMNS
+        return score_values(value_tuples(df_gold, gold_columns), value_tuples(df_pred, pred_columns))
+    return score_values(individual_gold_values(df_gold), value_tuples(df_pred, [INDIVIDUAL_VALUE_COLUMN]))
+
+
+def score_labels(truth, predicted, label):
+    """
+    Precision / recall of one label over paired lists of expected and predicted labels.
+    """
+    tp = sum(1 for t, p in zip(truth, predicted) if t == label and p == label)
+    n_pred = sum(1 for p in predicted if p == label)
+    n_true = sum(1 for t in truth if t == label)
+    return {
+        "n_true": n_true,
+        "n_pred": n_pred,
+        "precision": tp / n_pred if n_pred else None,
+        "recall": tp / n_true if n_true else None,
+    }
+
+
+def evaluate_preflight(data_dir, set_names, model_name=None, pmids=None):
+    """
+    Run the pre-flight classifier (see classify_pk_table) over the benchmark tables and score it.
+    "pk" scores the skip decision (any PK label against "not_pk"); the other entries score the routing labels.
+
+    :param model_name: Pre-flight model for uncertain tables; None is rules only.
+    :return: Dictionary with "tables" (per-table records) and "scores" (label -> precision / recall).
+    """
+    tables = []
+    for set_name in set_names:
+        pipeline, _ = BENCHMARK_SETS[set_name]
+        for pmid, table_id in list_benchmark_tables(data_dir, set_name):
+            if pmids and pmid not in pmids:
+                continue
+            md_table, description = load_benchmark_table(data_dir, set_name, pmid, table_id)
+            label, _, _, usage, _ = classify_pk_table(md_table, description, model_name)
+            tables.append({
+                "set": set_name, "pmid": pmid, "table": table_id, "usage": usage or 0,
+                "expected": PREFLIGHT_TRUTH.get((set_name, pmid, table_id), pipeline), "label": label,
+            })
+    truth = [t["expected"] for t in tables]
+    predicted = [t["label"] for t in tables]
+    scores = {label: score_labels(truth, predicted, label) for label in PREFLIGHT_LABELS}
+    scores["pk"] = score_labels(["pk" if t != "not_pk" else t for t in truth],
+                                ["pk" if p != "not_pk" else p for p in predicted], "pk")
+    return {"tables": tables, "scores": scores}
+
+
+def aggregate_report(tables, pmids):
+    """
+    :param tables: Per-table records of a benchmark run.
+    :param pmids: Per-PMID accuracy records.
+    :return: Dictionary of aggregate metrics.
+    """
+    matched = sum(p["matched"] for p in pmids)
+    n_gold = sum(p["n_gold"] for p in pmids)
+    n_pred = sum(p["n_pred"] for p in pmids)
+    precision = matched / n_pred if n_pred else 0.0
+    recall = matched / n_gold if n_gold else 0.0
+    step_latency = {}
+    for table in tables:
+        for step, stats in table["steps"].items():
+            total = step_latency.setdefault(step, {"calls": 0, "latency": 0.0, "tokens": 0, "prompt_tokens": 0})
+            for key in total:
+                total[key] += stats.get(key, 0)
+    return {
+        "tables": len(tables),
+        "failed_tables": sum(1 for t in tables if not t["ok"]),
+        "skipped_tables": sum(1 for t in tables if t.get("skipped")),
+        "wall_time": sum(t["wall_time"] for t in tables),
+        "llm_calls": sum(t["llm_calls"] for t in tables),
+        "retries": sum(t["retries"] for t in tables),
+        "hedged_calls": sum(t.get("hedged_calls", 0) for t in tables),
+        "tokens": sum(t["tokens"] for t in tables),
+        "prompt_tokens": sum(s["prompt_tokens"] for s in step_latency.values()),
+        "peak_rss_kb": max([t["peak_rss_kb"] for t in tables] or [0]),
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "steps": step_latency,
+    }
+
+
+def compare_reports(previous, current):
+    """
+    Compare the aggregate metrics of two benchmark reports.
+
+    :return: List of (metric, previous value, current value, relative change, is_regression).
+    """
+    rows = []
+    for metric, (direction, tolerance) in REPORT_METRICS.items():
+        old = previous["aggregate"].get(metric)
+        new = current["aggregate"].get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+        if direction == "lower":
+            regression = new > old and change > tolerance
+        else:
+            regression = new < old and -change > tolerance
+        rows.append((metric, old, new, change, regression))
+    return rows
+
+
+def load_report(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_LLM_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cotable", "llm_cache.sqlite")
+DEFAULT_LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+LLM_CACHE_MODES = ["on", "off", "refresh"]
+
+
+def make_llm_cache_key(model, messages, question, generation_config=None):
+    """
+    Build a content-addressed key for one LLM request.
+
+    :param model: Model name as passed to get_llm_response (e.g. "gemini_15_pro").
+    :param messages: The full list of message strings sent before the question.
+    :param question: The final question appended to the messages.
+    :param generation_config: Provider settings that change the answer (model version, temperature, ...).
+    :return: Hex digest identifying the request.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": list(messages),
+            "question": question,
+            "generation_config": generation_config or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(object):
+    """
+    On-disk (SQLite) cache of LLM responses with size-based LRU eviction.
+
+    Entries are stored as the (res, content, usage, truncated) tuple returned by get_llm_response.
+    The database can be shared by several threads and processes on one host.
+    """
+
+    def __init__(self, path=DEFAULT_LLM_CACHE_PATH, max_bytes=DEFAULT_LLM_CACHE_MAX_BYTES, mode="on"):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unsupported cache mode: {mode}")
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, value TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _ensure_dir(self):
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+    def get(self, key):
+        """
+        Look up a cached response.
+
+        :param key: Key built by make_llm_cache_key.
+        :return: The cached (res, content, usage, truncated) tuple, or None on a miss or in "refresh" mode.
+        """
+        if self.mode != "on":
+            return None
+        self._ensure_dir()
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            finally:
+                conn.close()
+            self.hits += 1
+        res, content, usage, truncated = json.loads(row[0])
+        return res, content, usage, truncated
+
+    def set(self, key, model, response):
+        """
+        Store a response and evict the least recently used entries beyond max_bytes.
+
+        :param key: Key built by make_llm_cache_key.
+        :param model: Model name, kept for inspection only.
+        :param response: The (res, content, usage, truncated) tuple to store.
+        """
+        if not self.enabled:
+            return
+        value = json.dumps(list(response), ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        self._ensure_dir()
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, value, size, now, now),
+                )
+                self.writes += 1
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                        total -= old_size
+                        self.evictions += 1
+                conn.commit()
+            finally:
+                conn.close()
+
+    def clear(self):
+        self._ensure_dir()
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM responses")
+                conn.commit()
+            finally:
+                conn.close()
+
+    def stats(self):
+        """
+        :return: Dictionary of hit/miss counters for this process, plus the on-disk entry count and size.
+        """
+        entries, total = 0, 0
+        if os.path.exists(self.path):
+            with self._lock:
+                conn = self._connect()
+                try:
+                    entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                finally:
+                    conn.close()
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """
+    Return the process-wide cache used by get_llm_response.
+    Configured from LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES and LLM_CACHE_MODE ("on", "off" or "refresh").
+    The cache is opt-in: unless LLM_CACHE_MODE or configure_llm_cache turns it on, every request reaches the provider.
+    """
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache(
+            path=os.environ.get("LLM_CACHE_PATH", DEFAULT_LLM_CACHE_PATH),
+            max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", DEFAULT_LLM_CACHE_MAX_BYTES)),
+            mode=os.environ.get("LLM_CACHE_MODE", "off"),
+        )
+    return _llm_cache
+
+
+def configure_llm_cache(path=None, max_bytes=None, mode=None):
+    """
+    Reconfigure the process-wide LLM response cache.
+
+    :param path: SQLite file to use.
+    :param max_bytes: Size budget; least recently used entries are evicted beyond it.
+    :param mode: "on" (read and write), "off" (bypass) or "refresh" (skip reads, overwrite entries).
+    :return: The configured cache.
+    """
+    cache = get_llm_cache()
+    if path is not None and path != cache.path:
+        cache.path = path
+        cache._initialized = False
+    if max_bytes is not None:
+        cache.max_bytes = int(max_bytes)
+    if mode is not None:
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unsupported cache mode: {mode}")
+        cache.mode = mode
+    return cache
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+from TabFuncFlow.utils.step_utils import STEP_CASCADES, STEP_ENGINE_DEFAULTS
+
+
+def make_checkpoint_key(pipeline, md_table, description, llm, options=None):
+    """
+    Identify one pipeline run by its input table and description (and the pipeline and model used).
+
+    :param options: Dictionary of the pipeline options that change step outputs (e.g. prompt_slicing).
+                    The step engine settings and model cascades in effect are always part of the key.
+    """
+    payload = json.dumps(
+        [pipeline, md_table, description, llm, options or {},
+         {"cascades": STEP_CASCADES, "engine": STEP_ENGINE_DEFAULTS}],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StepCheckpoint(object):
+    """
+    Per-table state file holding the return values of the finished steps of a pipeline run.
+
+    Each step's (result, res, content, usage, truncated) is saved as soon as the step finishes,
+    so a re-run after a failure (e.g. retries exhausted on one sub-table) starts from the first
+    incomplete step. Restored steps are reported exactly like fresh ones, which keeps the
+    usage/content lists of the pipeline complete.
+    With checkpoint_dir=None nothing is stored and steps always run.
+    A run with different options (see make_checkpoint_key) uses a state file of its own.
+    """
+
+    def __init__(self, checkpoint_dir, pipeline, md_table, description, llm, options=None):
+        self.path = None
+        self.state = {}
+        self.restored = 0
+        self._lock = threading.Lock()
+        if checkpoint_dir is None:
+            return
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        key = make_checkpoint_key(pipeline, md_table, description, llm, options)
+        self.path = os.path.join(checkpoint_dir, f"{pipeline}_{key}.json")
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def run(self, name, func):
+        """
+        Return the checkpointed output of a step, or run it and checkpoint its output.
+
+        :param name: Step name, unique within the pipeline run (e.g. "value:3" for sub-table 3).
+        :param func: Callable without arguments running the step.
+        """
+        if self.path is None:
+            return func()
+        with self._lock:
+            if name in self.state:
+                self.restored += 1
+                return tuple(self.state[name])
+        output = func()
+        if output is not None:
+            with self._lock:
+                self.state[name] = output
+                self._save()
+        return output
+
+    def wrap_nodes(self, nodes):
+        """
+        Checkpoint every node of a run_dag graph under its node name.
+        """
+        return {
+            name: (deps, lambda r, name=name, func=func: self.run(name, lambda: func(r)))
+            for name, (deps, func) in nodes.items()
+        }
+
+    def wrap_tasks(self, tasks):
+        """
+        Checkpoint every task of a run_fan_out dictionary; a key ("value", 3) is stored as '["value", 3]'.
+        """
+        return {
+            key: (lambda key=key, func=func: self.run(json.dumps(list(key), ensure_ascii=False), func))
+            for key, func in tasks.items()
+        }
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def run_dag(nodes, max_workers=4):
+    """
+    Run a dependency graph of steps on a bounded thread pool.
+    A node starts as soon as all of its dependencies have finished, so independent
+    LLM round trips overlap and the wall-clock time follows the critical path.
+
+    :param nodes: Dictionary mapping node name to (dependency name list, callable).
+                  The callable receives a dictionary with the results of its dependencies.
+    :param max_workers: Maximum number of nodes running at the same time.
+    :return: Dictionary mapping node name to its result.
+             A node whose dependency returned None is not run, and its result is None as well.
+    """
+    for name, (deps, _) in nodes.items():
+        for dep in deps:
+            if dep not in nodes:
+                raise ValueError(f"Node '{name}' depends on unknown node '{dep}'.")
+
+    results = {}
+    pending = dict(nodes)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            scheduled = True
+            while scheduled:
+                scheduled = False
+                for name in list(pending):
+                    deps, func = pending[name]
+                    if not all(dep in results for dep in deps):
+                        continue
+                    del pending[name]
+                    scheduled = True
+                    if any(results[dep] is None for dep in deps):
+                        results[name] = None
+                        continue
+                    dep_results = {dep: results[dep] for dep in deps}
+                    running[executor.submit(func, dep_results)] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Dependency cycle detected among nodes: {list(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+
+    return results
+
+
+def run_fan_out(tasks, max_workers=4):
+    """
+    Run independent tasks on a bounded thread pool and gather their results.
+
+    :param tasks: Dictionary mapping a task key (e.g. ("value", sub_table_index)) to a callable without arguments.
+    :param max_workers: Maximum number of tasks running at the same time.
+    :return: Dictionary mapping each task key to its result, in the insertion order of tasks.
+    """
+    if not tasks:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: executor.submit(func) for key, func in tasks.items()}
+        try:
+            return {key: future.result() for key, future in futures.items()}
+        except Exception:
+            for future in futures.values():
+                future.cancel()
+            raise
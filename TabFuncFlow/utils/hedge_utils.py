@@ -0,0 +1,188 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+
+
+class LatencyTracker(object):
+    """
+    Recent request latencies of each (model, step), to estimate a latency percentile online.
+    Only the last `window` latencies of a key are kept, so the estimate follows the provider's current speed.
+    """
+
+    def __init__(self, window=200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+
+    def add(self, key, latency):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def count(self, key):
+        with self._lock:
+            return len(self._latencies.get(key, ()))
+
+    def percentile(self, key, q):
+        """
+        :param q: Percentile as a fraction, e.g. 0.95.
+        :return: The q-th percentile (nearest rank) of the recent latencies of key, or None without any.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, max(0, math.ceil(q * len(latencies)) - 1))]
+
+
+class LLMHedger(object):
+    """
+    Hedged LLM requests: when a request has not returned after the given latency percentile of its
+    (model, step), a duplicate is sent and the first response passing the caller's check is used;
+    the other request is cancelled.
+
+    Hedging starts once a (model, step) has min_samples latencies. The estimated prompt tokens of all
+    duplicates stay below max_ratio times those of the original requests, so hedging at most doubles spend.
+    With percentile=None nothing is hedged.
+    Requests of providers without an async client run in a worker thread, which keeps running after
+    it is cancelled; its response is then discarded.
+    """
+
+    def __init__(self, percentile=None, min_samples=20, max_ratio=0.1, window=200):
+        """
+        :param percentile: Latency percentile after which a duplicate is sent, as a fraction, e.g. 0.95.
+        :param min_samples: Latencies of a (model, step) needed before its requests are hedged.
+        :param max_ratio: Maximum ratio of duplicate to original prompt tokens, between 0 and 1.
+        :param window: Latencies kept per (model, step), see LatencyTracker.
+        """
+        if percentile is not None and not 0 < percentile < 1:
+            raise ValueError(f"Hedging percentile must be between 0 and 1, got {percentile}")
+        if not 0 <= max_ratio <= 1:
+            raise ValueError(f"Hedging max_ratio must be between 0 and 1, got {max_ratio}")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.latencies = LatencyTracker(window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.request_tokens = 0
+        self.hedges = 0
+        self.hedge_tokens = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+
+    def delay(self, model, step):
+        """
+        :return: Seconds after which a request of (model, step) is hedged, or None if it is not hedged.
+        """
+        if self.percentile is None or self.latencies.count((model, step)) < self.min_samples:
+            return None
+        return self.latencies.percentile((model, step), self.percentile)
+
+    def record(self, model, step, latency):
+        self.latencies.add((model, step), latency)
+
+    def _take_budget(self, tokens):
+        with self._lock:
+            if self.hedge_tokens + tokens > self.max_ratio * self.request_tokens:
+                self.skipped += 1
+                return False
+            self.hedges += 1
+            self.hedge_tokens += tokens
+            return True
+
+    async def arun(self, send, model, step, tokens, accept=None):
+        """
+        Send a request, hedged if it is slow.
+
+        :param send: Coroutine function sending the request once and returning its (res, content, usage, truncated).
+        :param tokens: Estimated prompt tokens of the request.
+        :param accept: Callable(response) -> bool; a hedged response failing it only wins if the other fails too.
+                       Defaults to checking res.
+        :return: (response, hedged)
+        """
+        if accept is None:
+            accept = lambda response: bool(response[0])
+        with self._lock:
+            self.requests += 1
+            self.request_tokens += tokens
+        start = time.time()
+        first = asyncio.ensure_future(send())
+        delay = self.delay(model, step)
+        if delay is None:
+            return await first, False
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self._take_budget(tokens):
+            return await first, False
+
+        second = asyncio.ensure_future(send())
+        pending = [first, second]
+        fallback, error = None, None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in [t for t in pending if t in done]:
+                    pending.remove(task)
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    response = task.result()
+                    if accept(response):
+                        if task is second:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return response, True
+                    fallback = fallback or response
+            if fallback is None:
+                raise error
+            return fallback, True
+        finally:
+            for task in pending:
+                task.cancel()
+                # A cancelled request took at least this long; keeps the percentile from drifting down.
+                self.record(model, step, time.time() - start)
+
+    def stats(self):
+        """
+        :return: Dictionary of counters for this process.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "skipped": self.skipped,
+                "request_tokens": self.request_tokens,
+                "hedge_tokens": self.hedge_tokens,
+            }
+
+
+_llm_hedger = None
+
+
+def get_llm_hedger():
+    """
+    Return the process-wide hedger used by get_llm_response.
+    Hedging is off unless LLM_HEDGE_PERCENTILE is set (e.g. 0.95); LLM_HEDGE_MAX_RATIO caps the extra spend.
+    """
+    global _llm_hedger
+    if _llm_hedger is None:
+        percentile = os.environ.get("LLM_HEDGE_PERCENTILE")
+        _llm_hedger = LLMHedger(
+            percentile=float(percentile) if percentile else None,
+            max_ratio=float(os.environ.get("LLM_HEDGE_MAX_RATIO", 0.1)),
+        )
+    return _llm_hedger
+
+
+def configure_llm_hedger(percentile=0.95, min_samples=20, max_ratio=0.1, window=200):
+    """
+    Replace the process-wide LLM hedger, e.g. configure_llm_hedger(percentile=None) turns hedging off.
+
+    :return: The configured hedger.
+    """
+    global _llm_hedger
+    _llm_hedger = LLMHedger(percentile=percentile, min_samples=min_samples, max_ratio=max_ratio, window=window)
+    return _llm_hedger
@@ -3,35 +3,210 @@ from extractor.request_openai import (
     # request_to_chatgpt_35,
     # request_to_chatgpt_40,
     request_to_chatgpt_4o,
+    arequest_to_chatgpt_4o,
+    get_generation_config as get_openai_generation_config,
 )
 from extractor.request_geminiai import (
     request_to_gemini_15_pro,
     request_to_gemini_15_flash,
+    arequest_to_gemini_15_pro,
+    arequest_to_gemini_15_flash,
+    get_generation_config as get_gemini_generation_config,
 )
+from extractor.utils import estimate_tokens
+from TabFuncFlow.utils.cache_utils import *
+from TabFuncFlow.utils.rate_limit_utils import *
+from TabFuncFlow.utils.hedge_utils import *
+from TabFuncFlow.utils.replay_utils import *
 import ast
+import asyncio
+import os
+import sys
+import threading
+import time
 # from dotenv import load_dotenv
 # load_dotenv()
 
 
-def get_llm_response(messages, question, model="gemini_15_pro"):
+"""
+Provider registry: model name -> (sync request function, async request function, generation config function).
+The request functions take (prompt_list, question) and return (res, content, usage, truncated).
+The underlying clients are created once per process and share pooled connections.
+"""
+LLM_PROVIDERS = {
+    "chatgpt_4o": (request_to_chatgpt_4o, arequest_to_chatgpt_4o, get_openai_generation_config),
+    "gemini_15_pro": (request_to_gemini_15_pro, arequest_to_gemini_15_pro, get_gemini_generation_config),
+    "gemini_15_flash": (request_to_gemini_15_flash, arequest_to_gemini_15_flash,
+                        lambda: get_gemini_generation_config(flash=True)),
+    "replay": (request_to_replay, arequest_to_replay, lambda: {}),
+}
+
+
+def get_llm_provider(model):
+    if model not in LLM_PROVIDERS:
+        raise ValueError(f"Unsupported model: {model}")
+    return LLM_PROVIDERS[model]
+
+
+_llm_call_listeners = []
+
+
+def add_llm_call_listener(listener):
     """
-    A further wrapper around Shaohong's request_llm function.
+    Register a function called after every LLM request with a dictionary describing it:
+    step (name of the calling step function), model, latency (seconds), usage, res, cached,
+    prompt_tokens (estimated size of the request) and hedged (a duplicate request was sent).
+    """
+    _llm_call_listeners.append(listener)
+
+
+def remove_llm_call_listener(listener):
+    if listener in _llm_call_listeners:
+        _llm_call_listeners.remove(listener)
+
+
+def _notify_llm_call(step, model, start, response, cached, prompt_tokens, hedged=False):
+    if not _llm_call_listeners:
+        return
+    res, content, usage, truncated = response
+    event = {
+        "step": step,
+        "model": model,
+        "latency": time.time() - start,
+        "usage": usage,
+        "res": res,
+        "cached": cached,
+        "prompt_tokens": prompt_tokens,
+        "hedged": hedged,
+    }
+    for listener in list(_llm_call_listeners):
+        listener(event)
+
+
+async def aget_llm_response(messages, question, model="gemini_15_pro", step=None, refresh=False, accept=None):
+    """
+    Async version of get_llm_response.
     Send messages and question to the specified LLM and return response details.
+    When the on-disk LLM cache is turned on (opt-in, see cache_utils), successful responses are stored
+    in it, so an identical request is answered from disk without contacting the provider.
+    Requests sent to the provider are paced by the shared RPM/TPM limiter (see rate_limit_utils).
+    model="replay" serves responses recorded in a cassette (see replay_utils); they are never cached,
+    so synthetic latency and injected failures apply to every call.
+    :param step: Name of the calling step, reported to the LLM call listeners.
+    :param refresh: Skip the cache lookup (the new response is still cached), e.g. when a step
+                    re-sends a request whose cached answer it has just rejected.
+    :param accept: Callable(response) -> bool deciding which response of a hedged request wins
+                   (see hedge_utils); defaults to the first successful one.
     """
 
     prompt_list = [{"role": "user", "content": msg} for msg in messages]
 
-    if model == "chatgpt_4o":
-        request_llm = request_to_chatgpt_4o
-    elif model == "gemini_15_pro":
-        request_llm = request_to_gemini_15_pro
-    else:
-        raise ValueError(f"Unsupported model: {model}")
+    request_llm, arequest_llm, get_generation_config = get_llm_provider(model)
+
+    start = time.time()
+    prompt_tokens = estimate_tokens(messages) + estimate_tokens(question)
+    replay = get_llm_replay()
+    cache = get_llm_cache()
+    cache_key = None
+    if cache.enabled and model != "replay":
+        cache_key = make_llm_cache_key(model, messages, question, get_generation_config())
+        # The cache is a SQLite file; its reads and writes run in a worker thread, off the shared event loop.
+        cached = None if refresh else await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            if replay.record:
+                replay.record_response(messages, question, model, cached, None)
+            _notify_llm_call(step, model, start, cached, True, prompt_tokens)
+            return cached
+
+    limiter = get_llm_rate_limiter()
+    hedger = get_llm_hedger()
+
+    async def send():
+        reservation = await limiter.areserve(model, prompt_tokens)
+        sent = time.time()
+        used_tokens = 0
+        try:
+            if arequest_llm is not None:
+                response = await arequest_llm(prompt_list, question)
+            else:
+                response = await asyncio.to_thread(request_llm, prompt_list, question)
+            hedger.record(model, step, time.time() - sent)
+            used_tokens = response[2]
+        finally:
+            # A request cancelled by the hedger (or raising) is settled with no usage, refunding its reservation.
+            await limiter.asettle(reservation, used_tokens)
+        if not response[0] and is_throttle_error(response[1]):
+            await limiter.athrottle(model)
+        return response
 
-    res, content, usage, truncated = request_llm(prompt_list, question)
+    if model == "replay":
+        # Hedging would take recorded responses out of order.
+        response, hedged = await send(), False
+    else:
+        response, hedged = await hedger.arun(send, model, step, prompt_tokens, accept)
+    res, content, usage, truncated = response
+    if cache_key is not None and res:
+        await asyncio.to_thread(cache.set, cache_key, model, (res, content, usage, truncated))
+    if replay.record and model != "replay":
+        replay.record_response(messages, question, model, (res, content, usage, truncated), time.time() - start)
+    _notify_llm_call(step, model, start, (res, content, usage, truncated), False, prompt_tokens, hedged)
     return res, content, usage, truncated
 
 
+_llm_loop = None
+_llm_loop_thread = None
+_llm_loop_lock = threading.Lock()
+
+
+def get_llm_event_loop():
+    """
+    Return the process-wide event loop that runs every LLM coroutine.
+    The loop lives in a daemon thread, so sync callers on any thread share one set of
+    pooled connections instead of opening a loop (and connections) per request.
+    """
+    global _llm_loop, _llm_loop_thread
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            _llm_loop_thread = threading.Thread(target=_llm_loop.run_forever, name="llm-event-loop", daemon=True)
+            _llm_loop_thread.start()
+        return _llm_loop
+
+
+def _reset_llm_event_loop():
+    # The loop thread does not survive a fork; a child process starts its own loop.
+    global _llm_loop, _llm_loop_thread, _llm_loop_lock
+    _llm_loop = None
+    _llm_loop_thread = None
+    _llm_loop_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_llm_event_loop)
+
+
+def run_llm_coroutine(coro):
+    """
+    Run a coroutine on the shared LLM event loop and block until it finishes.
+    """
+    loop = get_llm_event_loop()
+    if threading.current_thread() is _llm_loop_thread:
+        coro.close()
+        raise RuntimeError("run_llm_coroutine() cannot be called from the LLM event loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def get_llm_response(messages, question, model="gemini_15_pro", step=None, refresh=False, accept=None):
+    """
+    A further wrapper around Shaohong's request_llm function.
+    Send messages and question to the specified LLM and return response details.
+    Sync facade over aget_llm_response; safe to call from several threads at once.
+    :param step: Name of the calling step; defaults to the name of the calling function.
+    """
+    if step is None:
+        step = sys._getframe(1).f_code.co_name
+    return run_llm_coroutine(aget_llm_response(messages, question, model, step, refresh, accept))
+
+
 def fix_angle_brackets(text: str) -> str:
     text = text.rstrip()
     return text + '>' if text.endswith('>') and not text.endswith('>>') else text
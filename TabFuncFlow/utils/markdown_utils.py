@@ -0,0 +1,79 @@
+import re
+
+
+"""
+Escapes of Markdown table cells: a pipe would start a new cell and a newline a new row, so they are written as
+\\| and \\n. A backslash is doubled only where it would otherwise be read as the start of one of these escapes,
+so cells without pipes or newlines, including ones with other backslashes, are written unchanged.
+"""
+MARKDOWN_ESCAPE_PATTERN = re.compile(r'\\(?=[\\|n\n])')
+MARKDOWN_UNESCAPE_PATTERN = re.compile(r'\\([\\|n])')
+
+
+def needs_markdown_escape(cell):
+    return '|' in cell or '\n' in cell or '\\' in cell and MARKDOWN_ESCAPE_PATTERN.search(cell) is not None
+
+
+def escape_markdown_cell(cell):
+    """
+    Escape the pipes and newlines of a cell for a Markdown table (see unescape_markdown_cell).
+    """
+    if not needs_markdown_escape(cell):
+        return cell
+    return MARKDOWN_ESCAPE_PATTERN.sub(r'\\\\', cell).replace('|', '\\|').replace('\n', '\\n')
+
+
+def unescape_markdown_cell(cell):
+    """
+    Inverse of escape_markdown_cell: unescape_markdown_cell(escape_markdown_cell(cell)) == cell.
+    """
+    if '\\' not in cell:
+        return cell
+    return MARKDOWN_UNESCAPE_PATTERN.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), cell)
+
+
+def split_markdown_row(line):
+    """
+    Split a Markdown table line on its pipes like line.split('|'), leaving escaped pipes (\\|) inside their cell.
+    """
+    if '\\' not in line:
+        return line.split('|')
+    cells = []
+    start = i = 0
+    while i < len(line):
+        if line[i] == '\\':
+            i += 2
+            continue
+        if line[i] == '|':
+            cells.append(line[start:i])
+            start = i + 1
+        i += 1
+    cells.append(line[start:])
+    return cells
+
+
+def parse_markdown_rows(lines):
+    """
+    Cells of Markdown table lines, stripped and unescaped; the parts before the first and after the last pipe
+    are dropped.
+
+    :param lines: Table lines, e.g. the header line or the data lines.
+    :return: List of rows, each a list of cell strings.
+    """
+    # One search over the joined lines instead of one per line; most tables have no escapes at all.
+    if '\\' not in '\n'.join(lines):
+        return [[cell.strip() for cell in line.split('|')[1:-1]] for line in lines]
+    return [[unescape_markdown_cell(cell.strip()) for cell in split_markdown_row(line)[1:-1]] for line in lines]
+
+
+def dataframe_to_cells(df_table):
+    """
+    Header and data cells of a DataFrame as strings, converted column by column (str() of each value, without
+    building a Series per row like DataFrame.iterrows, which also upcasts the integers of mixed int/float frames).
+
+    :return: (list of header strings, list of rows, each a list of cell strings)
+    """
+    headers = [col if isinstance(col, str) else str(col) for col in df_table.columns]
+    columns = [list(map(str, df_table.iloc[:, i].tolist())) for i in range(df_table.shape[1])]
+    rows = [list(row) for row in zip(*columns)] if columns else [[] for _ in range(df_table.shape[0])]
+    return headers, rows
@@ -0,0 +1,154 @@
+from TabFuncFlow.utils.table_utils import *
+from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.step_utils import *
+from TabFuncFlow.utils.rule_utils import *
+from difflib import get_close_matches
+import re
+
+
+"""
+Labels of the pre-flight table classifier: which pipeline a table belongs to, or "not_pk" to skip it.
+"""
+PREFLIGHT_LABELS = ["pk_summary", "pk_individual", "not_pk"]
+
+"""
+Minimum confidence of the rule-based label for it to be used without asking the pre-flight model.
+"""
+PREFLIGHT_RULE_CONFIDENCE = 0.8
+
+"""
+Vocabulary scored by the pre-flight classifier in the caption, the headers and the row labels, as regular
+expressions on lower-case text. Parameter names are strong evidence of a PK table; specimens and concentration
+units are weak evidence; demographic and clinical words point to a table that is not about PK.
+"""
+PK_PARAMETER_PATTERNS = [
+    r'\bc\s?max\b', r'\bc\s?min\b', r'\bt\s?max\b', r'\bauc', r'\bt\s?(?:1/2|½)', r'half[\s\-]?life',
+    r'\bcl(?:t|r|ss)?\s?(?:/\s?f)?\b', r'clearance', r'\bv\s?(?:d|z|ss|c)\w*\b', r'\bv\s?/\s?f\b',
+    r'volume of distribution', r'\bk\s?(?:a|e|el)\b', r'\bmrt\b', r'mean residence', r'\bc\s?(?:trough|avg|average|mid|ss)',
+    r'trough', r'bioavailability', r'elimination', r'absorption', r'area under', r'pharmacokinetic', r'\bpk\b',
+    r'\bm\s?/\s?p\b', r'(?:cord|placenta)[\s\-‐]?(?:to[\s\-‐]?)?(?:maternal|mother)', r'excretion', r'\bfe\b',
+    r'concentrations?', r'plasma levels?', r'exposure', r'infant dose', r'protein binding', r'free fraction',
+]
+PK_CONTEXT_PATTERNS = [
+    r'\bplasma\b', r'\bserum\b', r'\bblood\b', r'\bcord\b', r'\bmilk\b', r'\burine\b', r'\burinary\b',
+    r'amniotic', r'placenta', r'\bdoses?\b', r'\blevels?\b', r'\bratios?\b',
+]
+CONCENTRATION_UNIT_PATTERN = (r'\b(?:p|n|µ|μ|u|m)?(?:g|mol)\s?/\s?(?:d|m|µ|μ)?l\b|\b(?:µ|μ|u|m|n)g\s?/\s?g\b'
+                              r'|\bmg\s?/\s?kg|\bh\s?[·∙⋅*.]?\s?(?:n|µ|μ|m)g')
+NON_PK_PATTERNS = [
+    r'\bage\b', r'\bsex\b', r'\bgender\b', r'\bmales?\b', r'\bfemales?\b', r'\brace\b', r'ethnic', r'\bbmi\b',
+    r'body mass', r'\bheight\b', r'birth ?weight', r'gestational age', r'apgar', r'comorbid', r'complications?',
+    r'adverse', r'baseline', r'characteristics', r'demographic', r'diagnos', r'smoking', r'education', r'income',
+    r'delivery method', r'caesarean|cesarean', r'abnormalit', r'disease', r'symptoms?', r'score',
+]
+INDIVIDUAL_HEADER_PATTERN = (r'(?:patients?|subjects?|volunteers?|cases?|pt|id|participants?|parturients?|mothers?'
+                             r'|infants?|neonates?|women|woman)(?: (?:no|number|id|#))?(?: \d+)?')
+SUMMARY_PATTERN = (r'\bmeans?\b|\bmedians?\b|\bsd\b|\bs\.d\.|\bsem?\b|geometric|\bgm\b|\bcv\b|±|\bci\b|confidence interval'
+                   r'|\brange\b|percentile|interquartile|\biqr\b|\bn\s?=\s?\d')
+
+
+def _count_patterns(text, patterns):
+    return sum(1 for pattern in patterns if re.search(pattern, text))
+
+
+def classify_pk_table_rules(md_table, description):
+    """
+    Rule-based pre-flight label of a table from its header vocabulary, row labels, numeric density and caption.
+    A table is only called "not_pk" when nothing in it names a PK parameter, a specimen or a concentration unit,
+    and some of it is demographic or clinical vocabulary.
+
+    :return: (label, confidence between 0 and 1, reasoning)
+    """
+    df_table = markdown_to_dataframe(md_table)
+    caption = re.sub(r'<[^>]+>', " ", description or "").lower()
+    headers = " | ".join(str(col) for col in df_table.columns).lower()
+    row_labels = " | ".join(str(v) for v in df_table.iloc[:, 0]).lower() if df_table.shape[1] else ""
+    labels = headers + " | " + row_labels
+    cells = [str(v) for v in df_table.iloc[:, 1:].values.flatten() if not is_missing_cell(v)]
+    numeric = sum(is_numeric_cell(c) for c in cells) / len(cells) if cells else 0.0
+
+    parameters = _count_patterns(labels, PK_PARAMETER_PATTERNS)
+    caption_parameters = _count_patterns(caption, PK_PARAMETER_PATTERNS)
+    context = _count_patterns(labels + " | " + caption, PK_CONTEXT_PATTERNS)
+    units = len(re.findall(CONCENTRATION_UNIT_PATTERN, labels + " | " + " | ".join(cells).lower()))
+    non_pk = _count_patterns(labels + " | " + caption, NON_PK_PATTERNS)
+    pk_score = 2 * parameters + caption_parameters + 0.5 * context + min(units, 4)
+    reasons = [
+        f"{parameters} PK parameter terms in headers and row labels, {caption_parameters} in the caption",
+        f"{context} specimen/dose terms, {units} concentration units",
+        f"{non_pk} demographic/clinical terms",
+        f"{numeric:.0%} numeric cells",
+    ]
+
+    if pk_score == 0 and non_pk:
+        confidence = min(1.0, 0.6 + 0.1 * non_pk + (0.2 if numeric < 0.5 else 0.0))
+        return "not_pk", confidence, "\n".join(reasons)
+
+    first_header = normalize_header(df_table.columns[0]) if df_table.shape[1] else ""
+    subject_columns = sum(1 for col in df_table.columns if re.fullmatch(INDIVIDUAL_HEADER_PATTERN, normalize_header(col)))
+    subject_rows = sum(1 for v in df_table.iloc[:, 0] if is_integer_cell(v)) if df_table.shape[1] else 0
+    individual = 0
+    if re.fullmatch(INDIVIDUAL_HEADER_PATTERN, first_header) or subject_columns >= 2:
+        individual += 2
+    if df_table.shape[0] and subject_rows >= max(3, 0.5 * df_table.shape[0]):
+        individual += 1
+    if re.search(r'\bindividual|\beach (?:patient|subject|volunteer|woman)', caption):
+        individual += 1
+    summary = min(3, len(re.findall(SUMMARY_PATTERN, labels + " | " + caption)))
+    reasons.append(f"individual evidence {individual}, summary evidence {summary}")
+
+    label = "pk_individual" if individual >= 3 or individual > summary else "pk_summary"
+    confidence = min(1.0, 0.4 + 0.1 * pk_score - 0.1 * non_pk)
+    if abs(individual - summary) < 2:
+        confidence = min(confidence, 0.7)
+    return label, max(confidence, 0.3), "\n".join(reasons)
+
+
+def classify_pk_table_prompt(md_table, description):
+    return f"""
+The following table comes from a pharmacology article:
+{display_md_table(md_table)}
+Here is the table caption and footnote:
+{description}
+Carefully examine the table and decide which one of the following it is:
+   - **"pk_summary"**: it reports pharmacokinetic (PK) parameters or drug concentrations summarized over groups, e.g. means, medians or ranges.
+   - **"pk_individual"**: it reports pharmacokinetic parameters or drug concentrations of individual patients or subjects.
+   - **"not_pk"**: it contains no pharmacokinetic parameters or drug concentrations, e.g. demographics, dosing schedules or clinical outcomes.
+Return the label enclosed in double angle brackets, like this: <<pk_summary>>
+"""
+
+
+def classify_pk_table(md_table, description, model_name=None, max_retries=5, initial_wait=1,
+                      rule_confidence=PREFLIGHT_RULE_CONFIDENCE):
+    """
+    Pre-flight label of a table ("pk_summary", "pk_individual" or "not_pk"), to route or skip it before the
+    pipeline's LLM steps. The rule-based label (see classify_pk_table_rules) is used when it is at least
+    rule_confidence confident or when there is no model; otherwise one call to model_name decides.
+
+    :param model_name: A cheap model for uncertain tables, e.g. "gemini_15_flash". None never calls an LLM.
+    :return: (label, res, content, usage, truncated); when the call fails, the rule-based label with res False
+             and the error in the content.
+    """
+    label, confidence, reasoning = classify_pk_table_rules(md_table, description)
+    reasoning = f"Rule-based label: {label} (confidence {confidence:.2f})\n{reasoning}\n"
+    if model_name is None or confidence >= rule_confidence:
+        record_fast_path("classify_pk_table", 1)
+        return label, True, "Automatic execution (rule-based pre-flight).\n" + reasoning, 0, False
+    record_fast_path("classify_pk_table", 0)
+
+    msg = classify_pk_table_prompt(md_table, description)
+
+    def parse(content):
+        extracted_data = extract_answer(content, f"No valid table label found.")
+        matches = get_close_matches(extracted_data.strip().strip("\"'").lower(), PREFLIGHT_LABELS, n=1)
+        if not matches:
+            raise ValueError(f"Unknown table label: {extracted_data}")
+        return matches[0]
+
+    try:
+        result, res, content, usage, truncated = run_llm_step(
+            [msg], parse, model_name, max_retries, initial_wait, failure_message="Unable to classify the table.")
+    except RuntimeError as e:
+        # A failed pre-flight call falls back to the rule-based label instead of failing the table.
+        return label, False, f"{reasoning}Pre-flight classification failed ({e}), using the rule-based label.\n", 0, False
+    return result, res, reasoning + content, usage, truncated
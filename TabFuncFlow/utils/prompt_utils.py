@@ -0,0 +1,162 @@
+import threading
+from collections import OrderedDict
+from extractor.utils import estimate_tokens
+from TabFuncFlow.utils.table_utils import *
+
+
+"""
+Number of prompt fragments kept in memory; the least recently used are dropped first. A pipeline run uses a few
+dozen (its main table, sub-tables and row counts), so this covers several runs in parallel.
+"""
+PROMPT_FRAGMENT_CACHE_SIZE = 256
+
+"""
+Opening of the prompts that show the aligned main table and its caption before a sub-table.
+"""
+MAIN_TABLE_PROMPT = ("The following main table contains pharmacokinetics (PK) data:  \n{table}\n"
+                     "Here is the table caption:  \n{caption}")
+
+
+class PromptFragmentCache(object):
+    """
+    In-memory LRU cache of the prompt fragments rendered from tables: the labeled table (display_md_table),
+    its row count and the main table block with its caption. Entries are keyed by the fragment kind and the
+    table text, so the same table hits the same entry across steps, sub-tables, row windows and retries,
+    whether it is passed as a Table or as a string reloaded from a checkpoint.
+    """
+
+    def __init__(self, max_entries=PROMPT_FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._fragments = OrderedDict()
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, key, render):
+        """
+        :param kind: Fragment kind, e.g. "table"; counted separately in the metrics.
+        :param key: The table text (or a tuple of texts) the fragment is rendered from.
+        :param render: Callable returning the fragment, called on a miss only.
+        """
+        cache_key = (kind, key)
+        with self._lock:
+            stats = self._metrics.setdefault(kind, {"uses": 0, "renders": 0})
+            stats["uses"] += 1
+            if cache_key in self._fragments:
+                self._fragments.move_to_end(cache_key)
+                return self._fragments[cache_key]
+        fragment = render()
+        with self._lock:
+            stats["renders"] += 1
+            self._fragments[cache_key] = fragment
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def metrics(self):
+        """
+        :return: Dictionary mapping fragment kind to uses, renders, saved (uses answered without rendering)
+                 and hit_rate.
+        """
+        with self._lock:
+            return {
+                kind: dict(stats, saved=stats["uses"] - stats["renders"],
+                           hit_rate=(stats["uses"] - stats["renders"]) / stats["uses"] if stats["uses"] else 0.0)
+                for kind, stats in self._metrics.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self._metrics.clear()
+
+
+_prompt_fragments = PromptFragmentCache()
+
+
+def prompt_table(md_table):
+    """
+    display_md_table(md_table), rendered once per table.
+    """
+    return _prompt_fragments.get("table", md_table, lambda: display_md_table(md_table))
+
+
+def prompt_row_count(md_table):
+    """
+    The number of data rows of md_table, counted once per table.
+    """
+    return _prompt_fragments.get("row_count", md_table, lambda: as_table(md_table).shape[0])
+
+
+def main_table_prompt(md_table, caption):
+    """
+    MAIN_TABLE_PROMPT for a main table and its caption, rendered once per pair.
+    """
+    return _prompt_fragments.get("main_table", (md_table, caption),
+                                 lambda: MAIN_TABLE_PROMPT.format(table=prompt_table(md_table), caption=caption))
+
+
+def get_prompt_fragment_metrics():
+    """
+    :return: Dictionary mapping fragment kind ("table", "row_count", "main_table") to its counters in this
+             process, see PromptFragmentCache.metrics.
+    """
+    return _prompt_fragments.metrics()
+
+
+def reset_prompt_fragment_metrics():
+    _prompt_fragments.clear()
+
+
+def slice_main_table(md_table, columns):
+    """
+    The main table cut down to the columns a sub-table needs, for the per-sub-table prompts in prompt slicing
+    mode. Columns keep the main table's order and headers (stacked header rows included), and all rows are kept
+    so that row numbers still match the sub-table. Names not in the table are ignored.
+    Prompt slicing is experimental and opt-in: fewer prompt tokens are measured, its effect on accuracy is not.
+
+    :param columns: Column names to keep, e.g. the sub-table's columns and the row label columns.
+    :return: Table (md_table itself when nothing is cut)
+    """
+    table = as_table(md_table)
+    keep = set(columns)
+    selected = [col for col in table.columns if col in keep]
+    if not selected or len(selected) == len(table.columns):
+        return table
+    return table.select(cols=selected)
+
+
+_prompt_slicing_metrics = {"calls": 0, "full_tokens": 0, "sliced_tokens": 0}
+_prompt_slicing_lock = threading.Lock()
+
+
+def record_prompt_slicing(md_table, md_slice, calls=1):
+    """
+    Count the prompts of calls sub-table LLM calls that show md_slice instead of the main table md_table.
+
+    :return: Estimated prompt tokens saved by these calls (first attempts only).
+    """
+    full_tokens = estimate_tokens(prompt_table(md_table)) * calls
+    sliced_tokens = estimate_tokens(prompt_table(md_slice)) * calls
+    with _prompt_slicing_lock:
+        _prompt_slicing_metrics["calls"] += calls
+        _prompt_slicing_metrics["full_tokens"] += full_tokens
+        _prompt_slicing_metrics["sliced_tokens"] += sliced_tokens
+    return full_tokens - sliced_tokens
+
+
+def get_prompt_slicing_metrics():
+    """
+    :return: Counters of prompt slicing in this process: calls, full_tokens and sliced_tokens (estimated tokens
+             of the main table shown in these calls, without and with slicing), saved and saved_rate.
+    """
+    with _prompt_slicing_lock:
+        stats = dict(_prompt_slicing_metrics)
+    stats["saved"] = stats["full_tokens"] - stats["sliced_tokens"]
+    stats["saved_rate"] = stats["saved"] / stats["full_tokens"] if stats["full_tokens"] else 0.0
+    return stats
+
+
+def reset_prompt_slicing_metrics():
+    with _prompt_slicing_lock:
+        for key in _prompt_slicing_metrics:
+            _prompt_slicing_metrics[key] = 0
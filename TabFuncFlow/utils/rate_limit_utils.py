@@ -0,0 +1,305 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+
+THROTTLE_MARKERS = ["429", "rate limit", "ratelimit", "resource has been exhausted", "quota"]
+
+
+def _refill(level, updated, capacity, now):
+    """
+    Refill a bucket holding at most `capacity` units that regains `capacity` units per minute.
+    """
+    if level is None:
+        return capacity
+    return min(capacity, level + (now - updated) * capacity / 60.0)
+
+
+def _take(levels, amounts, capacities, now):
+    """
+    Try to take `amounts` from every bucket at once.
+
+    :param levels: Dictionary mapping bucket name to (level, updated); refreshed in place.
+    :param amounts: Dictionary mapping bucket name to the amount to take.
+    :param capacities: Dictionary mapping bucket name to its per-minute capacity.
+    :param now: Current time.
+    :return: 0 if the amounts were taken, otherwise the number of seconds to wait before retrying.
+    """
+    wait = 0.0
+    for name, amount in amounts.items():
+        level, updated = levels.get(name, (None, now))
+        level = _refill(level, updated, capacities[name], now)
+        levels[name] = (level, now)
+        # A single request larger than the whole bucket only has to wait for a full bucket.
+        needed = min(amount, capacities[name])
+        if level < needed:
+            wait = max(wait, (needed - level) * 60.0 / capacities[name])
+    if wait > 0:
+        return wait
+    for name, amount in amounts.items():
+        level, _ = levels[name]
+        levels[name] = (level - amount, now)
+    return 0.0
+
+
+class MemoryBucketStore(object):
+    """
+    Bucket levels shared by every thread and task of this process.
+    """
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._levels = {}
+
+    def transact(self, func):
+        with self._lock:
+            return func(self._levels)
+
+
+class SQLiteBucketStore(object):
+    """
+    Bucket levels kept in a SQLite file, so several worker processes on one host share a budget.
+    Each update runs in an IMMEDIATE transaction, which serializes the writers.
+    Transactions can wait on other processes, so async callers run them in a worker thread.
+    """
+
+    blocking = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)")
+            self._initialized = True
+        return conn
+
+    def transact(self, func):
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                levels = {name: (level, updated) for name, level, updated in conn.execute("SELECT name, level, updated FROM buckets")}
+                before = dict(levels)
+                result = func(levels)
+                for name, (level, updated) in levels.items():
+                    if before.get(name) != (level, updated):
+                        conn.execute(
+                            "INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                            (name, level, updated),
+                        )
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+
+class LLMRateLimiter(object):
+    """
+    Token-bucket limiter of requests per minute (RPM) and tokens per minute (TPM) for each model.
+
+    Before a request is sent, one request and the estimated prompt tokens are reserved, waiting
+    until both buckets allow it. Once the response arrives, the reservation is settled against
+    the real usage: unused tokens are refunded and extra tokens are charged.
+    Models without limits are not throttled.
+    """
+
+    def __init__(self, limits=None, path=None):
+        """
+        :param limits: Dictionary mapping model name to (rpm, tpm); either value can be None for no limit.
+        :param path: Optional SQLite file shared by several processes. Buckets stay in memory if None.
+        """
+        self.limits = dict(limits or {})
+        self.store = SQLiteBucketStore(path) if path else MemoryBucketStore()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0
+
+    def _capacities(self, model):
+        rpm, tpm = self.limits.get(model, (None, None))
+        capacities = {}
+        if rpm:
+            capacities[f"{model}:rpm"] = float(rpm)
+        if tpm:
+            capacities[f"{model}:tpm"] = float(tpm)
+        return capacities
+
+    def _try_reserve(self, model, tokens):
+        capacities = self._capacities(model)
+        amounts = {}
+        if f"{model}:rpm" in capacities:
+            amounts[f"{model}:rpm"] = 1.0
+        if f"{model}:tpm" in capacities:
+            amounts[f"{model}:tpm"] = float(tokens)
+        if not amounts:
+            return 0.0
+        return self.store.transact(lambda levels: _take(levels, amounts, capacities, time.time()))
+
+    async def _arun(self, func, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _record(self, waited):
+        with self._stats_lock:
+            self.requests += 1
+            if waited is not None:
+                self.waits += 1
+                self.wait_seconds += waited
+
+    def reserve(self, model, tokens):
+        """
+        Block until one request and `tokens` tokens are available for the model, then take them.
+
+        :return: Reservation (model, tokens) to pass to settle.
+        """
+        start = time.time()
+        wait = self._try_reserve(model, tokens)
+        waited = wait > 0
+        while wait > 0:
+            time.sleep(wait)
+            wait = self._try_reserve(model, tokens)
+        self._record(time.time() - start if waited else None)
+        return (model, tokens)
+
+    async def areserve(self, model, tokens):
+        """
+        Async version of reserve; waiting does not block the event loop.
+        """
+        start = time.time()
+        wait = await self._arun(self._try_reserve, model, tokens)
+        waited = wait > 0
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = await self._arun(self._try_reserve, model, tokens)
+        self._record(time.time() - start if waited else None)
+        return (model, tokens)
+
+    def settle(self, reservation, used_tokens):
+        """
+        Refund the unused part of a reservation, or charge the tokens used beyond it.
+
+        :param reservation: Value returned by reserve.
+        :param used_tokens: Tokens actually used by the request; None leaves the reservation as is.
+        """
+        model, reserved = reservation
+        name = f"{model}:tpm"
+        capacities = self._capacities(model)
+        if used_tokens is None or name not in capacities:
+            return
+        delta = float(reserved) - float(used_tokens)
+
+        def _adjust(levels):
+            now = time.time()
+            level, updated = levels.get(name, (None, now))
+            level = _refill(level, updated, capacities[name], now)
+            levels[name] = (min(capacities[name], level + delta), now)
+
+        self.store.transact(_adjust)
+
+    async def asettle(self, reservation, used_tokens):
+        """
+        Async version of settle.
+        """
+        await self._arun(self.settle, reservation, used_tokens)
+
+    def throttle(self, model):
+        """
+        Empty the model's buckets after the provider rejected a request for exceeding its quota,
+        so that every thread and process backs off until the buckets refill.
+        """
+        with self._stats_lock:
+            self.throttled += 1
+        capacities = self._capacities(model)
+
+        def _drain(levels):
+            now = time.time()
+            for name in capacities:
+                levels[name] = (0.0, now)
+
+        if capacities:
+            self.store.transact(_drain)
+
+    async def athrottle(self, model):
+        """
+        Async version of throttle.
+        """
+        await self._arun(self.throttle, model)
+
+    def stats(self):
+        """
+        :return: Dictionary of counters for this process.
+        """
+        return {
+            "requests": self.requests,
+            "waits": self.waits,
+            "wait_seconds": self.wait_seconds,
+            "throttled": self.throttled,
+        }
+
+
+def is_throttle_error(content):
+    """
+    Whether a failed response's message says the provider throttled the request.
+    """
+    if content is None:
+        return False
+    content = str(content).lower()
+    return any(marker in content for marker in THROTTLE_MARKERS)
+
+
+def _limits_from_env(models):
+    limits = {}
+    for model in models:
+        rpm = os.environ.get(f"LLM_RPM_{model.upper()}")
+        tpm = os.environ.get(f"LLM_TPM_{model.upper()}")
+        if rpm or tpm:
+            limits[model] = (float(rpm) if rpm else None, float(tpm) if tpm else None)
+    return limits
+
+
+_llm_rate_limiter = None
+
+
+def get_llm_rate_limiter():
+    """
+    Return the process-wide limiter used by get_llm_response.
+    Limits are read from LLM_RPM_<MODEL> and LLM_TPM_<MODEL> (e.g. LLM_TPM_GEMINI_15_PRO);
+    LLM_RATE_LIMIT_PATH selects a SQLite file shared by several processes.
+    """
+    global _llm_rate_limiter
+    if _llm_rate_limiter is None:
+        _llm_rate_limiter = LLMRateLimiter(
+            limits=_limits_from_env(["gemini_15_pro", "gemini_15_flash", "chatgpt_4o"]),
+            path=os.environ.get("LLM_RATE_LIMIT_PATH"),
+        )
+    return _llm_rate_limiter
+
+
+def configure_llm_rate_limiter(limits=None, path=None):
+    """
+    Replace the process-wide LLM rate limiter.
+
+    :param limits: Dictionary mapping model name to (rpm, tpm).
+    :param path: Optional SQLite file to share the budget with other processes on this host.
+    :return: The configured limiter.
+    """
+    global _llm_rate_limiter
+    _llm_rate_limiter = LLMRateLimiter(limits=limits, path=path)
+    return _llm_rate_limiter
@@ -0,0 +1,303 @@
+import ast
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from TabFuncFlow.utils.cache_utils import make_llm_cache_key
+
+
+LLM_REPLAY_FAILURE_TYPES = ["malformed", "row_mismatch", "timeout"]
+
+
+def make_replay_key(messages, question):
+    """
+    Key of a request in a cassette. It does not depend on the model, so a cassette recorded
+    with one provider can be replayed with model="replay".
+    """
+    return make_llm_cache_key("replay", messages, question)
+
+
+def make_replay_prefix_key(messages, question):
+    """
+    Key of the first attempt of a request. Retries append "Wrong answer example" feedback to the
+    messages; they are answered with the recordings of the same step when no exact match exists.
+    """
+    return make_llm_cache_key("replay", list(messages)[:1], question)
+
+
+def parse_latency_spec(spec):
+    """
+    Parse a latency distribution such as "fixed:0.5", "lognormal:1.2,0.6" (median seconds, sigma),
+    "trace" or "trace:0.5" (recorded latency, scaled by 0.5).
+
+    :return: (kind, parameter list)
+    """
+    if not spec:
+        return ("fixed", [0.0])
+    kind, _, params = spec.partition(":")
+    params = [float(p) for p in params.split(",") if p.strip()]
+    if kind == "fixed":
+        return (kind, params or [0.0])
+    if kind == "lognormal":
+        if len(params) != 2:
+            raise ValueError(f"lognormal latency needs a median and a sigma: {spec}")
+        return (kind, params)
+    if kind == "trace":
+        return (kind, params or [1.0])
+    raise ValueError(f"Unsupported latency distribution: {spec}")
+
+
+def parse_failure_spec(spec):
+    """
+    Parse injected failure rates such as "malformed=0.05,row_mismatch=0.05,timeout=0.01".
+
+    :return: Dictionary mapping failure type to probability.
+    """
+    failures = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition("=")
+        name = name.strip()
+        if name not in LLM_REPLAY_FAILURE_TYPES:
+            raise ValueError(f"Unsupported failure type: {name}")
+        failures[name] = float(rate)
+    return failures
+
+
+def make_malformed(content):
+    """
+    Cut the final <<...>> answer in half and drop its closing brackets, so it can no longer be parsed.
+    """
+    start = content.rfind("<<")
+    if start < 0:
+        return content[:len(content) // 2]
+    end = content.find(">>", start)
+    payload = content[start + 2:end if end >= 0 else len(content)]
+    return content[:start] + "<<" + payload[:len(payload) // 2]
+
+
+def make_row_mismatch(content):
+    """
+    Drop the last row of the final <<[...]>> answer, so its row count no longer matches the table.
+    Answers that are not a list of at least two rows are made malformed instead.
+    """
+    matches = list(re.finditer(r"<<(\[.*\])>>", content, re.DOTALL))
+    if matches:
+        match = matches[-1]
+        try:
+            rows = ast.literal_eval(match.group(1))
+        except (SyntaxError, ValueError):
+            rows = None
+        if isinstance(rows, list) and len(rows) > 1:
+            return content[:match.start()] + "<<" + repr(rows[:-1]) + ">>" + content[match.end():]
+    return make_malformed(content)
+
+
+class LLMReplay(object):
+    """
+    Cassette of recorded LLM responses, served back by model="replay".
+
+    In record mode every response returned by get_llm_response is appended to the cassette
+    (a JSON lines file) together with its latency. In replay mode the recorded responses are
+    returned after a synthetic latency, optionally corrupted to exercise the retry paths.
+    Several recordings of the same request are served in turn. Requests that were not recorded
+    exactly (e.g. a retry caused by an injected failure) are answered with the recordings of
+    their first attempt.
+    """
+
+    def __init__(self, path=None, record=False, latency=None, failures=None, timeout=60.0, seed=0):
+        """
+        :param path: Cassette file.
+        :param record: Append the responses of real models to the cassette.
+        :param latency: Latency distribution, see parse_latency_spec.
+        :param failures: Failure rates, see parse_failure_spec, or a dictionary.
+        :param timeout: Seconds an injected timeout waits before failing.
+        :param seed: Seed of the latency and failure draws.
+        """
+        self.path = path
+        self.record = record
+        self.latency = parse_latency_spec(latency)
+        self.failures = parse_failure_spec(failures) if isinstance(failures, str) or failures is None else dict(failures)
+        self.timeout = timeout
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._entries = None
+        self._served = {}
+        self.replayed = 0
+        self.missing = 0
+        self.injected = {name: 0 for name in LLM_REPLAY_FAILURE_TYPES}
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry):
+        self._entries.setdefault(entry["key"], []).append(entry)
+        if entry.get("prefix_key") and entry["prefix_key"] != entry["key"]:
+            self._entries.setdefault(entry["prefix_key"], []).append(entry)
+
+    def record_response(self, messages, question, model, response, latency):
+        """
+        Append one response to the cassette.
+
+        :param response: The (res, content, usage, truncated) tuple.
+        :param latency: Seconds the provider took, or None for a response served from the cache.
+        """
+        if not self.record or not self.path:
+            return
+        res, content, usage, truncated = response
+        entry = {
+            "key": make_replay_key(messages, question),
+            "prefix_key": make_replay_prefix_key(messages, question),
+            "model": model,
+            "res": res,
+            "content": content,
+            "usage": usage,
+            "truncated": truncated,
+            "latency": latency,
+        }
+        dirname = os.path.dirname(self.path)
+        with self._lock:
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            if self._entries is not None:
+                self._index(entry)
+
+    def _draw(self, messages, question):
+        """
+        Pick the recorded entry, the latency and the injected failure of one replayed request.
+        The draws are seeded from (seed, key, served index) rather than taken from one shared stream,
+        so a request gets the same latency and failure whatever order concurrent requests arrive in.
+        A string seed is hashed with sha512 by random.Random, so it does not depend on PYTHONHASHSEED.
+        """
+        key = make_replay_key(messages, question)
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                key = make_replay_prefix_key(messages, question)
+            entries = self._entries.get(key)
+            if not entries:
+                self.missing += 1
+                return None, 0.0, None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            entry = entries[served % len(entries)]
+            rng = random.Random(f"{self.seed}:{key}:{served}")
+
+            kind, params = self.latency
+            if kind == "fixed":
+                latency = params[0]
+            elif kind == "lognormal":
+                latency = rng.lognormvariate(math.log(params[0]), params[1])
+            else:
+                latency = (entry.get("latency") or 0.0) * params[0]
+
+            failure = None
+            draw = rng.random()
+            for name in LLM_REPLAY_FAILURE_TYPES:
+                rate = self.failures.get(name, 0.0)
+                if draw < rate:
+                    failure = name
+                    self.injected[name] += 1
+                    break
+                draw -= rate
+            self.replayed += 1
+        return entry, latency, failure
+
+    def _respond(self, entry, failure):
+        if entry is None:
+            return (False, "No recorded response for this request in the cassette.", 0, False)
+        if failure == "timeout":
+            return (False, f"Request timed out after {self.timeout} seconds.", 0, False)
+        content = entry["content"]
+        if failure == "malformed":
+            content = make_malformed(content)
+        elif failure == "row_mismatch":
+            content = make_row_mismatch(content)
+        return (entry["res"], content, entry["usage"], entry["truncated"])
+
+    def request(self, prompts, question):
+        """
+        Replay one request; same arguments and return value as the provider request functions.
+        """
+        entry, latency, failure = self._draw([p["content"] for p in prompts], question)
+        time.sleep(self.timeout if failure == "timeout" else latency)
+        return self._respond(entry, failure)
+
+    async def arequest(self, prompts, question):
+        """
+        Async version of request.
+        """
+        entry, latency, failure = self._draw([p["content"] for p in prompts], question)
+        await asyncio.sleep(self.timeout if failure == "timeout" else latency)
+        return self._respond(entry, failure)
+
+    def stats(self):
+        """
+        :return: Dictionary of replay counters for this process.
+        """
+        return {
+            "replayed": self.replayed,
+            "missing": self.missing,
+            "injected": dict(self.injected),
+        }
+
+
+def request_to_replay(prompts, question):
+    return get_llm_replay().request(prompts, question)
+
+
+async def arequest_to_replay(prompts, question):
+    return await get_llm_replay().arequest(prompts, question)
+
+
+_llm_replay = None
+
+
+def get_llm_replay():
+    """
+    Return the process-wide cassette used by get_llm_response.
+    Configured from LLM_CASSETTE_PATH, LLM_CASSETTE_RECORD ("1" to record), LLM_REPLAY_LATENCY,
+    LLM_REPLAY_FAILURES, LLM_REPLAY_TIMEOUT and LLM_REPLAY_SEED.
+    """
+    global _llm_replay
+    if _llm_replay is None:
+        _llm_replay = LLMReplay(
+            path=os.environ.get("LLM_CASSETTE_PATH"),
+            record=os.environ.get("LLM_CASSETTE_RECORD", "0") == "1",
+            latency=os.environ.get("LLM_REPLAY_LATENCY"),
+            failures=os.environ.get("LLM_REPLAY_FAILURES"),
+            timeout=float(os.environ.get("LLM_REPLAY_TIMEOUT", 60)),
+            seed=int(os.environ.get("LLM_REPLAY_SEED", 0)),
+        )
+    return _llm_replay
+
+
+def configure_llm_replay(path=None, record=False, latency=None, failures=None, timeout=60.0, seed=0):
+    """
+    Replace the process-wide cassette.
+
+    :param path: Cassette file (JSON lines).
+    :param record: Append the responses of real models to the cassette.
+    :param latency: "fixed:<seconds>", "lognormal:<median>,<sigma>" or "trace[:<scale>]".
+    :param failures: e.g. "malformed=0.05,row_mismatch=0.05,timeout=0.01".
+    :param timeout: Seconds an injected timeout waits before failing.
+    :param seed: Seed of the latency and failure draws.
+    :return: The configured cassette.
+    """
+    global _llm_replay
+    _llm_replay = LLMReplay(path=path, record=record, latency=latency, failures=failures, timeout=timeout, seed=seed)
+    return _llm_replay
@@ -0,0 +1,302 @@
+import re
+
+
+"""
+Deterministic helpers classifying the cells and headers of PK tables, used by the rule-based fast paths
+of the steps. They only answer when the text is unambiguous; anything else is left to the LLM.
+"""
+MISSING_CELLS = {"", "n/a", "na", "-", "–", "—", "nd", "nr", "nc", "none"}
+
+UNIT_WORDS = {
+    "pg", "ng", "ug", "µg", "μg", "mcg", "mg", "g", "kg",
+    "µl", "μl", "ul", "ml", "dl", "l",
+    "pmol", "nmol", "umol", "µmol", "μmol", "mmol", "mol",
+    "s", "sec", "min", "mins", "minute", "minutes", "h", "hr", "hrs", "hour", "hours",
+    "d", "day", "days", "wk", "week", "weeks",
+    "m", "m2", "cm", "mm", "iu", "mu", "u", "%",
+}
+
+NUMBER_PATTERN = r'[-+−]?(?:\d+(?:[.,]\s?\d+)*|\.\d+)(?:[eE][-+]?\d+)?'
+
+# Words and footnote marks that may surround the numbers of a value cell, e.g. "0.162 (0.090) (n = 16)".
+VALUE_WORDS = {"n", "to", "vs", "ns", "cv", "sd", "se", "sem", "range", "mean", "median", "a", "b", "c", "d", "e"}
+
+
+def is_missing_cell(cell):
+    return str(cell).strip().lower() in MISSING_CELLS
+
+
+def is_numeric_cell(cell):
+    """
+    Whether a cell holds numbers only, with their usual decorations:
+    "12.96 (9.42–16.49)", "56.1 ± 44.9", "0.268 [0.193; 0.493](n = 16)", "41 (68.3)", "<0.001".
+    """
+    text = str(cell).strip()
+    if not re.search(r'\d', text):
+        return False
+    rest = re.sub(NUMBER_PATTERN, " ", text)
+    rest = re.sub(r'[\s±()\[\]{},;:=<>≤≥~%*†‡§‖¶#/–—−\-]', " ", rest)
+    return all(word in VALUE_WORDS for word in rest.lower().split())
+
+
+def is_integer_cell(cell):
+    return re.fullmatch(r'\d+', str(cell).strip()) is not None
+
+
+def is_unit_cell(cell):
+    """
+    Whether a cell is only a unit, e.g. "ng/mL", "mg·h/L", "mL/min/kg", "h".
+    """
+    text = str(cell).strip()
+    if not text or len(text) > 25:
+        return False
+    words = [w for w in re.split(r'[/·∙⋅*×.\s()\[\]^\-−\d]+', text.lower()) if w]
+    return bool(words) and all(word in UNIT_WORDS for word in words)
+
+
+def is_p_value_cell(cell):
+    """
+    Whether a cell is a P value, e.g. "0.015", ".67", "<0.001", "P = 0.04", "NS".
+    """
+    text = str(cell).strip().lower().rstrip("*†‡§abcde ")
+    if text in {"ns", "n.s.", "n.s"}:
+        return True
+    return re.fullmatch(r'(?:p\s*)?[<>≤≥=]?\s*(?:0?\.\d+|0|1(?:\.0+)?)', text) is not None
+
+
+def normalize_header(header):
+    """
+    The last level of a (stacked) header in lower case, without footnote marks and punctuation,
+    e.g. "Dose range 1 (5–15 mg/kg/12 h)..pvalue." -> "pvalue", "P‐value*" -> "p value".
+    """
+    levels = [level for level in re.split(r'\.\.|\.(?=\S)', str(header)) if level.strip(" .")]
+    last = levels[-1] if levels else str(header)
+    last = re.sub(r'[‐‑–—\-_]', " ", last.lower())
+    last = re.sub(r'[^\w\s%]', " ", last)
+    return " ".join(last.split())
+
+
+def is_p_value_header(header):
+    return re.fullmatch(r'p|p values?|pvalues?|p val', normalize_header(header)) is not None
+
+
+def is_unit_header(header):
+    return re.fullmatch(r'units?', normalize_header(header)) is not None
+
+
+def is_count_header(header):
+    return re.fullmatch(r'(?:n|no|number)(?: \d+)?', normalize_header(header)) is not None
+
+
+"""
+Labels of the summary statistics recognized in captions, headers and row names, as used in the
+"Statistics type", "Variation type" and "Interval type" columns of s_pk_get_parameter_value.
+Earlier patterns win, and their text is not matched again (e.g. "geometric mean" is not also "mean").
+"""
+STATISTICS_PATTERNS = [
+    ("Geometric mean", r'geometric\s+means?|\bgeo\.?\s*means?|\bgm\b|\bgmean\b'),
+    ("Mean", r'\bmeans?\b|\baverage\b'),
+    ("Median", r'\bmedians?\b'),
+]
+VARIATION_PATTERNS = [
+    ("SD", r'\bs\.\s?d\.?|\bsd\b|standard\s+deviations?'),
+    ("SE", r'\bs\.\s?e\.?(?:\s?m\.?)?|\bsem?\b|standard\s+errors?(?:\s+of\s+the\s+mean)?'),
+    ("CV%", r'\bcv\s*%?|\bcoefficients?\s+of\s+variation'),
+]
+INTERVAL_PATTERNS = [
+    ("95% CI", r'95\s*%\s*(?:ci\b|confidence\s+intervals?)|\bci\s*95\s*%'),
+    ("90% CI", r'90\s*%\s*(?:ci\b|confidence\s+intervals?)|\bci\s*90\s*%'),
+    ("IQR", r'\biqr\b|interquartile\s+ranges?|25(?:th)?\s*[-–]\s*75(?:th)?\s*percentiles?'),
+    ("Range", r'\branges?\b|\bmin(?:imum)?\s*[-–,]\s*max(?:imum)?\b'),
+    ("CI", r'\bci\b|confidence\s+intervals?'),
+]
+
+_STATISTICS_PAIR_GAP = r'[\s(\[±,]*(?:\+/-|and|with)?[\s(\[±,]*'
+
+
+def _find_labels(text, patterns):
+    """
+    :return: List of (label, start, end) of the non-overlapping pattern matches in text.
+    """
+    found, taken = [], []
+    for label, pattern in patterns:
+        for match in re.finditer(pattern, text):
+            if any(match.start() < end and start < match.end() for start, end in taken):
+                continue
+            taken.append((match.start(), match.end()))
+            found.append((label, match.start(), match.end()))
+    return found
+
+
+def find_statistics(text, count_header=False):
+    """
+    Summary statistics named in a caption, header or row name, e.g. "Values are mean ± SD; tmax is median (range)".
+
+    :param count_header: The text is a column header; a header like "N" means counts.
+    :return: (set of statistics, set of variation types, set of interval types,
+              set of (statistic, variation or interval type) written next to each other)
+    """
+    text = str(text or "").lower()
+    stats = _find_labels(text, STATISTICS_PATTERNS)
+    variations = _find_labels(text, VARIATION_PATTERNS)
+    intervals = _find_labels(text, INTERVAL_PATTERNS)
+    pairs = set()
+    for stat, _, stat_end in stats:
+        for disp, disp_start, _ in variations + intervals:
+            if disp_start >= stat_end and re.fullmatch(_STATISTICS_PAIR_GAP, text[stat_end:disp_start]):
+                pairs.add((stat, disp))
+    stat_labels = {s for s, _, _ in stats}
+    if count_header and is_count_header(text):
+        stat_labels.add("Count")
+    return stat_labels, {v for v, _, _ in variations}, {i for i, _, _ in intervals}, pairs
+
+
+def resolve_statistics(hint_levels, kind, dispersion=None):
+    """
+    Pick the labels of a value cell from its hints, the most specific first (e.g. row name, column header, caption).
+
+    :param hint_levels: List of find_statistics results.
+    :param kind: "plain" (a single number), "variation" (e.g. "1.2 ± 0.3") or "interval" (e.g. "1.2 (0.9–1.5)").
+    :param dispersion: Variation or interval type already given by the cell itself, e.g. "CV%" for "45 (CV 23%)".
+    :return: (statistic, variation or interval type or None), or None when the hints are missing or ambiguous.
+    """
+    stat, disp = None, dispersion
+    named = []
+    for stats, variations, intervals, pairs in hint_levels:
+        if stats:
+            named.append(stats)
+        candidates = {"plain": set(), "variation": variations, "interval": intervals}[kind]
+        if dispersion is not None:
+            candidates = candidates & {dispersion}
+        fitting = {pair for pair in pairs if pair[1] in candidates}
+        if len(fitting) > 1:
+            return None
+        if fitting:
+            pair_stat, pair_disp = next(iter(fitting))
+            if stat not in (None, pair_stat):
+                return None
+            stat = pair_stat
+            disp = disp or pair_disp
+        else:
+            if kind != "plain" and disp is None:
+                if len(candidates) > 1:
+                    return None
+                disp = next(iter(candidates), None)
+            if stat is None:
+                if len(stats) > 1:
+                    return None
+                stat = next(iter(stats), None)
+        if stat is not None and (kind == "plain" or disp is not None):
+            break
+    else:
+        return None
+    # e.g. a "Median ..." row in a "Mean difference" column.
+    if any(stat not in stats for stats in named):
+        return None
+    # A dispersion written next to another statistic anywhere (e.g. "mean (SD) or median [IQR]") is not
+    # combined with this statistic.
+    paired = {pair for _, _, _, pairs in hint_levels for pair in pairs if pair[1] == disp}
+    if paired and (stat, disp) not in paired:
+        return None
+    return stat, disp
+
+
+_VALUE_NUMBER = r'[-−]?(?:\d+(?:\.\d+)?|\.\d+)'
+_VALUE_CELL_SHAPES = [
+    ("plain", None, re.compile(rf'(?P<main>{_VALUE_NUMBER})')),
+    ("variation", None, re.compile(rf'(?P<main>{_VALUE_NUMBER})\s*(?:±|\+/-|\+-)\s*(?P<var>{_VALUE_NUMBER})')),
+    ("variation", "CV%", re.compile(
+        rf'(?P<main>{_VALUE_NUMBER})\s*[(\[]\s*(?:cv\s*:?\s*(?P<var>{_VALUE_NUMBER})\s*%?|(?P<var2>{_VALUE_NUMBER})\s*%\s*cv)\s*[)\]]',
+        re.IGNORECASE)),
+    ("variation", None, re.compile(rf'(?P<main>{_VALUE_NUMBER})\s*[(\[]\s*(?P<var>{_VALUE_NUMBER})\s*(?P<pct>%)?\s*[)\]]')),
+    ("interval", None, re.compile(
+        rf'(?P<main>{_VALUE_NUMBER})\s*[(\[]\s*(?P<low>{_VALUE_NUMBER})\s*(?:–|—|-|−|to|,|;)\s*(?P<high>{_VALUE_NUMBER})\s*[)\]]')),
+]
+
+
+def _to_float(number):
+    return float(number.replace("−", "-"))
+
+
+def parse_value_cell(cell, hint_levels):
+    """
+    Parse a summary value cell such as "12.96 (9.42–16.49)", "0.162 ± 0.090", "3.1 [2.57, 3.63]", "45 (CV 23%)" or "7.5".
+
+    :param hint_levels: Statistics hints of the cell, most specific first (see resolve_statistics).
+    :return: [Main value, Statistics type, Variation type, Variation value, Interval type, Lower bound, Upper bound]
+             with "N/A" for the fields that do not apply, or None when the cell is not parsed unambiguously.
+             Numbers are copied from the cell as written.
+    """
+    text = str(cell).strip()
+    text = re.sub(r'\(\s*n\s*=\s*\d+\s*\)', " ", text, flags=re.IGNORECASE)
+    text = text.strip().rstrip("*†‡§ ").strip()
+    for kind, dispersion, pattern in _VALUE_CELL_SHAPES:
+        match = pattern.fullmatch(text)
+        if match is None:
+            continue
+        groups = match.groupdict()
+        labels = resolve_statistics(hint_levels, kind, dispersion)
+        if labels is None:
+            return None
+        stat, disp = labels
+        if groups.get("pct") and disp != "CV%":
+            # "41 (68.3%)" is a CV only when the hints say so; it may as well be a count and its percentage.
+            return None
+        if kind == "plain":
+            return [groups["main"], stat, "N/A", "N/A", "N/A", "N/A", "N/A"]
+        if kind == "variation":
+            return [groups["main"], stat, disp, groups.get("var") or groups.get("var2"), "N/A", "N/A", "N/A"]
+        if _to_float(groups["low"]) > _to_float(groups["high"]):
+            return None
+        return [groups["main"], stat, "N/A", "N/A", disp, groups["low"], groups["high"]]
+    return None
+
+
+def normalize_label(text):
+    """
+    Lower-case words of a label or cell, e.g. "Lorazepam-glucuronide (plasma)" -> "lorazepam glucuronide plasma".
+    """
+    return " ".join(re.sub(r'[^\w%]+', " ", str(text).lower()).split())
+
+
+def _is_number_label(value):
+    return re.fullmatch(r'\d+(?:\.\d+)?', str(value).strip()) is not None
+
+
+def match_rows_by_labels(rows, candidates):
+    """
+    Match each row to the one candidate row whose distinguishing labels it contains, e.g. the sub-table row
+    "Cmax (plasma)" to the candidate ["Lorazepam", "Lorazepam", "Plasma"] rather than [..., "Urine"].
+
+    Only the candidate columns whose values differ between candidates are compared. A text label must occur
+    as whole words in the row (its headers and cells); a number (e.g. Subject N, Patient ID) must be written
+    as "n = <number>" in the row, or be the row's cell under a header of the same name.
+
+    :param rows: List of dictionaries mapping column header to cell, one per row to match.
+    :param candidates: List of dictionaries mapping column name to value, one per candidate row.
+    :return: Dictionary mapping row index to candidate index, for the rows matching exactly one candidate.
+    """
+    if len(candidates) < 2:
+        return {}
+    columns = [col for col in candidates[0]
+               if len({normalize_label(c.get(col, "")) for c in candidates}) > 1]
+    keys = []
+    for candidate in candidates:
+        keys.append([(col, str(candidate.get(col, "")).strip()) for col in columns
+                     if not is_missing_cell(candidate.get(col, "")) and normalize_label(candidate.get(col, ""))])
+
+    matches = {}
+    for i, row in enumerate(rows):
+        text = f" {normalize_label(' | '.join(list(map(str, row)) + list(map(str, row.values()))))} "
+        subject_ns = set(re.findall(r'\bn\s*=\s*(\d+)', " ".join(map(str, list(row) + list(row.values()))), re.I))
+
+        def contains(col, value):
+            if _is_number_label(value):
+                return value in subject_ns or str(row.get(col, "")).strip() == value
+            return f" {normalize_label(value)} " in text
+
+        hits = [k for k, candidate_keys in enumerate(keys)
+                if candidate_keys and all(contains(col, value) for col, value in candidate_keys)]
+        if len(hits) == 1:
+            matches[i] = hits[0]
+    return matches
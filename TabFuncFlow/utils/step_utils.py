@@ -0,0 +1,700 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from TabFuncFlow.utils.llm_utils import *
+from TabFuncFlow.utils.table_utils import *
+from TabFuncFlow.utils.exec_utils import *
+from TabFuncFlow.utils.prompt_utils import *
+
+
+STEP_QUESTION = "Do not give the final result immediately. First, explain your thought process, then provide the answer."
+RETRY_HINT = "Think about why this happened, correct your approach, and try again with the right answer."
+
+"""
+Engine-wide defaults of run_llm_step, see configure_step_engine.
+jitter: Random extra fraction (0 to jitter) added to each backoff wait, so concurrent steps do not retry in lockstep.
+deadline: Seconds a step may spend in total before it gives up retrying (None for no limit).
+history: How a wrong answer is carried into the next attempt. "compact" sends a short summary (the final
+         <<...>> answer, shortened to history_answer_chars, and why it is wrong); "full" sends the whole answer.
+max_history: Number of most recent wrong answers carried (None for all).
+reask_fraction: When at most this fraction of the rows of a list answer is missing or malformed (see StepRowsError),
+                only those rows are asked again and spliced into the answer; 0 always retries the whole answer.
+chunk_output_tokens: Estimated answer tokens above which a long list answer is split into row windows that are
+                     asked concurrently (see plan_chunks); None never splits.
+chunk_workers: Maximum number of row windows of one step asked at the same time.
+"""
+STEP_ENGINE_DEFAULTS = {
+    "jitter": 0.1,
+    "deadline": None,
+    "history": "compact",
+    "max_history": 2,
+    "history_answer_chars": 200,
+    "reask_fraction": 0.5,
+    "chunk_output_tokens": 1500,
+    "chunk_workers": 4,
+}
+STEP_HISTORY_MODES = ["compact", "full"]
+
+
+def parse_step_cascade(spec):
+    """
+    Parse a cascade specification such as "s_pk_align_parameter=gemini_15_flash;*=gemini_15_flash,chatgpt_4o".
+
+    :return: Dictionary mapping step name (or "*") to the list of models tried before the step's own model.
+    """
+    cascades = {}
+    for entry in (spec or "").split(";"):
+        if not entry.strip():
+            continue
+        step, _, models = entry.partition("=")
+        cascades[step.strip()] = [m.strip() for m in models.split(",") if m.strip()]
+    return cascades
+
+
+"""
+Model cascades: step name -> cheaper models asked first, one attempt each, before the step's own model.
+A cheaper model's answer is kept when it passes the step's parser and validators and is not truncated;
+otherwise the step escalates to the next model, without carrying the rejected answer.
+"*" applies to every step without an entry of its own. Off by default; set with configure_step_cascade
+or the LLM_STEP_CASCADE environment variable (see parse_step_cascade).
+"""
+STEP_CASCADES = parse_step_cascade(os.environ.get("LLM_STEP_CASCADE"))
+
+
+class StepValidationError(ValueError):
+    """
+    Raised by a step parser or validator when the model's answer is wrong.
+    When feedback is given, the answer is shown to the model again as a "Wrong answer example"
+    followed by the feedback, before the next attempt.
+    """
+
+    def __init__(self, message, feedback=None):
+        super().__init__(message)
+        self.feedback = feedback
+
+
+class StepRowsError(StepValidationError):
+    """
+    A list answer whose rows could only partly be lined up with the rows of the step's table.
+
+    :param rows: Dictionary mapping table row index to the answer row accepted for it.
+    :param unresolved: Table row indices without an accepted answer row (missing or malformed).
+    """
+
+    def __init__(self, message, feedback, rows, unresolved):
+        super().__init__(message, feedback)
+        self.rows = rows
+        self.unresolved = unresolved
+
+
+def retry_feedback(message):
+    """
+    The usual feedback of a wrong answer: the error message followed by RETRY_HINT.
+    """
+    return f"{message} {RETRY_HINT}"
+
+
+def wrong_answer_message(content, feedback):
+    return "Wrong answer example:\n" + content + "\nWhy it's wrong:\n" + feedback
+
+
+def shorten_answer(content, max_chars):
+    """
+    The final <<...>> answer of a response (or its end, if it has none), cut in the middle to max_chars.
+    """
+    matches = re.findall(r'<<.*?>>', content)
+    answer = matches[-1] if matches else content[-max_chars:]
+    if len(answer) <= max_chars:
+        return answer
+    half = max(max_chars // 2, 1)
+    return answer[:half] + " ... " + answer[-half:]
+
+
+def compact_wrong_answer_message(content, feedback, max_chars):
+    return "Wrong answer example (shortened):\n" + shorten_answer(content, max_chars) + "\nWhy it's wrong:\n" + feedback
+
+
+def extract_answer(content, error_message):
+    """
+    Return the text inside the last <<...>> of an answer.
+
+    :param error_message: Message of the ValueError raised when the answer has no <<...>>.
+    """
+    matches = re.findall(r'<<.*?>>', content)
+    if not matches:
+        raise ValueError(error_message)
+    return matches[-1][2:-2]
+
+
+def expect_rows(expected_rows, unit="extracted matches"):
+    """
+    Validator checking that a list answer has exactly expected_rows entries.
+    """
+    def validate(result):
+        if len(result) != expected_rows:
+            message = f"Mismatch: Expected {expected_rows} rows, but got {len(result)} {unit}."
+            raise StepValidationError(message, retry_feedback(message))
+    return validate
+
+
+def value_in_row(value, row_text):
+    """
+    Whether an extracted value (e.g. "0.162") occurs as a whole value in the text of a table row,
+    e.g. in "0.162 ± 0.090" but not in "10.162". "N/A" and empty values never occur.
+    """
+    value = str(value).strip()
+    if not value or value.upper() == "N/A":
+        return False
+    return re.search(r'(?<![\w.])' + re.escape(value) + r'(?![\w]|\.\d)', row_text) is not None
+
+
+def reconcile_rows(rows, expected_rows, check_row=None, fits=None):
+    """
+    Line up the rows of a list answer with the rows of the step's table.
+
+    With as many answer rows as table rows, row i answers table row i and only malformed rows are unresolved.
+    Otherwise an answer row can only belong to a table row within the count difference of its position;
+    it is accepted when fits() holds for exactly one such table row, and no other answer row fits that row.
+
+    :param check_row: Callable(answer row) -> False for a malformed row.
+    :param fits: Callable(table row index, answer row) -> True if the answer row may belong to the table row.
+                 Without it, answers with a wrong number of rows cannot be lined up.
+    :return: (dictionary mapping table row index to answer row, sorted list of unresolved table row indices)
+    """
+    def well_formed(row):
+        return check_row is None or check_row(row)
+
+    if len(rows) == expected_rows:
+        resolved = {i: row for i, row in enumerate(rows) if well_formed(row)}
+    elif fits is None:
+        resolved = {}
+    else:
+        shift = expected_rows - len(rows)
+        candidates = {}
+        for j, row in enumerate(rows):
+            if not well_formed(row):
+                continue
+            window = range(max(0, j + min(shift, 0)), min(expected_rows, j + max(shift, 0) + 1))
+            candidates[j] = [i for i in window if fits(i, row)]
+        claims = {}
+        for j, table_rows in candidates.items():
+            for i in table_rows:
+                claims.setdefault(i, []).append(j)
+        resolved = {}
+        last = -1
+        for j in sorted(candidates):
+            if len(candidates[j]) == 1 and len(claims[candidates[j][0]]) == 1 and candidates[j][0] > last:
+                last = candidates[j][0]
+                resolved[last] = rows[j]
+    return resolved, [i for i in range(expected_rows) if i not in resolved]
+
+
+def select_md_rows(md_table, indices):
+    """
+    The given rows of a markdown table, renumbered from 0, as a markdown table.
+    """
+    indices = list(indices)
+    return as_table(md_table).select(rows=indices) if indices else Table("")
+
+
+def plan_chunks(item_tokens, max_tokens=None):
+    """
+    Split a list answer into contiguous windows of about the same estimated size.
+
+    :param item_tokens: Estimated answer tokens of each item (row) in order.
+    :param max_tokens: Token budget of one window; defaults to STEP_ENGINE_DEFAULTS["chunk_output_tokens"].
+    :return: List of (start, end) windows covering all items; a single window when the answer fits the budget.
+    """
+    if max_tokens is None:
+        max_tokens = STEP_ENGINE_DEFAULTS["chunk_output_tokens"]
+    total = sum(item_tokens)
+    if not item_tokens or max_tokens is None or total <= max_tokens:
+        return [(0, len(item_tokens))]
+    n_chunks = min(len(item_tokens), -(-total // max_tokens))
+    target = total / n_chunks
+    chunks = []
+    start, size = 0, 0
+    for i, tokens in enumerate(item_tokens):
+        size += tokens
+        if size >= target * (len(chunks) + 1) and len(chunks) < n_chunks - 1 and i + 1 < len(item_tokens):
+            chunks.append((start, i + 1))
+            start = i + 1
+    chunks.append((start, len(item_tokens)))
+    return chunks
+
+
+def estimate_md_row_tokens(md_table, row_overhead):
+    """
+    Estimated answer tokens of each row of a markdown table: its cell text plus row_overhead tokens of answer format.
+    """
+    return [estimate_tokens(" ".join(row)) + row_overhead for row in as_table(md_table).rows]
+
+
+def run_chunks(chunks, run_chunk, max_workers=None):
+    """
+    Run a step on every window concurrently and merge the outputs in window order.
+
+    :param chunks: List of (start, end) windows, see plan_chunks.
+    :param run_chunk: Callable(start, end) -> the step's (result, res, content, usage, truncated) for one window.
+    :return: (list of window results, res, content, usage, truncated); the content starts with the windows.
+    """
+    if max_workers is None:
+        max_workers = STEP_ENGINE_DEFAULTS["chunk_workers"]
+    outputs = run_fan_out(
+        {chunk: (lambda chunk=chunk: run_chunk(*chunk)) for chunk in chunks},
+        max_workers=max_workers,
+    )
+    results, contents = [], [f"Answer split into {len(chunks)} row windows: {chunks}"]
+    res, usage, truncated = True, 0, False
+    for n, ((start, end), (result, chunk_res, content, chunk_usage, chunk_truncated)) in enumerate(outputs.items()):
+        results.append(result)
+        contents.append(f"Window {n + 1}/{len(chunks)} (rows {start}-{end - 1}):\n{content}")
+        res = res and chunk_res
+        usage += chunk_usage or 0
+        truncated = truncated or chunk_truncated
+    return results, res, "\n\n".join(contents), usage, truncated
+
+
+_step_metrics = {}
+_step_metrics_lock = threading.Lock()
+
+
+def get_step_metrics():
+    """
+    :return: Dictionary mapping step name to its counters in this process: calls, succeeded, failed,
+             attempts, retries, usage, time (seconds, including backoff), prompt_tokens (estimated, all attempts
+             of the step's own model), prompt_tokens_by_attempt (the same summed per attempt number, 1st attempt
+             first), cascade_prompt_tokens (estimated, attempts of the cheaper models of a cascade, see
+             get_cascade_metrics) and reasks (runs completed by asking again for some rows only).
+    """
+    with _step_metrics_lock:
+        return {
+            name: dict(stats, prompt_tokens_by_attempt=list(stats["prompt_tokens_by_attempt"]))
+            for name, stats in _step_metrics.items()
+        }
+
+
+def reset_step_metrics():
+    with _step_metrics_lock:
+        _step_metrics.clear()
+
+
+_cascade_metrics = {}
+
+
+def get_cascade_metrics():
+    """
+    :return: Dictionary mapping step name to {model: counters} of the cascaded steps in this process:
+             calls, accepted (answers kept), escalated, latency (seconds) and hit_rate (accepted / calls).
+             The step's own model is counted as the last tier.
+    """
+    with _step_metrics_lock:
+        return {
+            name: {
+                model: dict(stats, hit_rate=stats["accepted"] / stats["calls"] if stats["calls"] else 0.0)
+                for model, stats in tiers.items()
+            }
+            for name, tiers in _cascade_metrics.items()
+        }
+
+
+def reset_cascade_metrics():
+    with _step_metrics_lock:
+        _cascade_metrics.clear()
+
+
+def get_step_cascade(name, model_name):
+    """
+    :return: The cheaper models asked before model_name in step name (row windows and re-asks follow their step).
+    """
+    if model_name == "replay":
+        return []
+    step = name.split(":")[0]
+    models = STEP_CASCADES.get(step, STEP_CASCADES.get("*", []))
+    return [model for model in models if model != model_name]
+
+
+_fast_path_metrics = {}
+
+
+def record_fast_path(name, resolved, total=1):
+    """
+    Count one run of a step's rule-based fast path.
+
+    :param resolved: Items (e.g. columns or rows) answered by the rules, without a model call.
+    :param total: Items of the run; the LLM is skipped entirely when resolved == total.
+    """
+    with _step_metrics_lock:
+        stats = _fast_path_metrics.setdefault(name, {"calls": 0, "skipped": 0, "items": 0, "resolved": 0})
+        stats["calls"] += 1
+        stats["skipped"] += int(resolved >= total)
+        stats["items"] += total
+        stats["resolved"] += resolved
+
+
+def get_fast_path_metrics():
+    """
+    :return: Dictionary mapping step name to the counters of its fast path in this process: calls, skipped
+             (runs without any model call), items, resolved (items answered by the rules), skip_rate and
+             resolved_rate.
+    """
+    with _step_metrics_lock:
+        return {
+            name: dict(stats,
+                       skip_rate=stats["skipped"] / stats["calls"] if stats["calls"] else 0.0,
+                       resolved_rate=stats["resolved"] / stats["items"] if stats["items"] else 0.0)
+            for name, stats in _fast_path_metrics.items()
+        }
+
+
+def reset_fast_path_metrics():
+    with _step_metrics_lock:
+        _fast_path_metrics.clear()
+
+
+def configure_step_cascade(cascades):
+    """
+    Replace the model cascades, e.g. configure_step_cascade({"s_pk_align_parameter": ["gemini_15_flash"]});
+    configure_step_cascade({}) turns them off.
+    """
+    for model in {m for models in cascades.values() for m in models}:
+        if model not in LLM_PROVIDERS:
+            raise ValueError(f"Unsupported model: {model}")
+    STEP_CASCADES.clear()
+    STEP_CASCADES.update({step: list(models) for step, models in cascades.items()})
+
+
+def configure_step_engine(**defaults):
+    """
+    Change the engine-wide defaults, e.g. configure_step_engine(jitter=0, deadline=600).
+    """
+    unknown = set(defaults) - set(STEP_ENGINE_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown step engine settings: {sorted(unknown)}")
+    if defaults.get("history", "compact") not in STEP_HISTORY_MODES:
+        raise ValueError(f"Unsupported history mode: {defaults['history']}")
+    STEP_ENGINE_DEFAULTS.update(defaults)
+
+
+class _StepRun(object):
+    """
+    State of one run of a step (see run_llm_step): the prompt, the wrong answers so far and the usage of the attempts.
+    """
+
+    def __init__(self, name, messages, question, parse, validators, max_retries, initial_wait, retry_on,
+                 failure_message, jitter, deadline, reask, finish):
+        self.name = name
+        self.reask = reask
+        self.finish = finish
+        self.reask_fraction = STEP_ENGINE_DEFAULTS["reask_fraction"]
+        self.messages = list(messages)
+        self.question = question
+        self.history = []
+        self.history_mode = STEP_ENGINE_DEFAULTS["history"]
+        self.max_history = STEP_ENGINE_DEFAULTS["max_history"]
+        self.history_answer_chars = STEP_ENGINE_DEFAULTS["history_answer_chars"]
+        self.prompt_tokens = []
+        self.cascade_prompt_tokens = 0
+        self.reasked = False
+        self.parse = parse
+        self.validators = validators
+        self.max_retries = max_retries
+        self.retry_on = retry_on
+        self.failure_message = failure_message
+        self.jitter = STEP_ENGINE_DEFAULTS["jitter"] if jitter is None else jitter
+        self.deadline = STEP_ENGINE_DEFAULTS["deadline"] if deadline is None else deadline
+        self.retries = 0
+        self.wait_time = initial_wait
+        self.total_usage = 0
+        self.all_content = []
+        self.sent = set()
+        self.start = time.time()
+        self.model_name = None
+        self.tier_start = None
+
+    def request(self, tier=None):
+        """
+        :param tier: The cheaper model of a cascade the attempt is sent to; its prompt tokens are counted apart.
+        :return: (messages, refresh) of the next attempt: the step's prompt followed by the most recent
+                 wrong answers. A conversation that was already sent to the same model (e.g. a retry without
+                 feedback) skips the cache, which holds the rejected answer.
+        """
+        if self.max_history is None:
+            history = self.history
+        else:
+            history = self.history[-self.max_history:] if self.max_history else []
+        messages = self.messages + history
+        key = (tier or self.model_name, tuple(messages))
+        refresh = key in self.sent
+        self.sent.add(key)
+        tokens = estimate_tokens(messages) + estimate_tokens(self.question)
+        if tier is None:
+            self.prompt_tokens.append(tokens)
+        else:
+            self.cascade_prompt_tokens += tokens
+        return messages, refresh
+
+    def accept(self, response):
+        """
+        Whether a response passes the step's parser and validators; picks the winner of a hedged request.
+        """
+        res, content, usage, truncated = response
+        try:
+            result = self.parse(fix_angle_brackets(content or "").replace('\n', ''))
+            for validate in self.validators:
+                validate(result)
+        except Exception:
+            return False
+        return True
+
+    def handle(self, response, tier=None):
+        """
+        Parse and validate one response.
+
+        :param tier: The cheaper model of a cascade that gave the response; its answer must not be truncated.
+        :return: The step's (result, res, content, usage, truncated).
+        """
+        res, content, usage, truncated = response
+        content = fix_angle_brackets(content or "")
+
+        self.total_usage += usage or 0
+        label = "Attempt" if tier is None else f"Cascade attempt ({tier})"
+        self.all_content.append(f"{label} {self.retries + 1}:\n{content}")
+
+        content = content.replace('\n', '')
+        try:
+            result = self.parse(content)
+            for validate in self.validators:
+                validate(result)
+        except StepValidationError as e:
+            if e.feedback is not None:
+                if self.history_mode == "full":
+                    self.history.append(wrong_answer_message(content, e.feedback))
+                else:
+                    self.history.append(compact_wrong_answer_message(content, e.feedback, self.history_answer_chars))
+            raise
+        if tier is not None and truncated:
+            raise StepValidationError(f"The answer of {tier} was truncated.")
+        if self.finish is not None:
+            result = self.finish(result)
+        self._record(True, tier)
+        return result, res, "\n\n".join(self.all_content), self.total_usage, truncated
+
+    def start_tier(self):
+        self.tier_start = time.time()
+
+    def escalate(self, tier, e):
+        """
+        Drop the answer of a cheaper model and move on to the next model of the cascade.
+        """
+        print(f"Cascade: {tier} answer rejected ({e}), escalating.")
+        self.history = []
+        self._record_tier(tier, False)
+        self.tier_start = time.time()
+
+    def can_reask(self, e):
+        if self.reask is None or not isinstance(e, StepRowsError) or not e.rows or not e.unresolved:
+            return False
+        return len(e.unresolved) <= self.reask_fraction * (len(e.rows) + len(e.unresolved))
+
+    def start_reask(self, e):
+        print(f"Attempt {self.retries + 1}: {e} Asking again for {len(e.unresolved)} of "
+              f"{len(e.rows) + len(e.unresolved)} rows: {e.unresolved}")
+        return e.unresolved
+
+    def splice(self, e, output):
+        """
+        Fill the unresolved rows of a partial answer with the output of the re-asked step.
+
+        :return: The step's (result, res, content, usage, truncated).
+        """
+        rows, res, content, usage, truncated = output
+        self.total_usage += usage or 0
+        self.all_content.append(f"Attempt {self.retries + 1} (rows {e.unresolved} asked again):\n{content}")
+        result = [e.rows.get(i) for i in range(len(e.rows) + len(e.unresolved))]
+        for i, row in zip(e.unresolved, rows):
+            result[i] = row
+        if self.finish is not None:
+            result = self.finish(result)
+        self.reasked = True
+        self._record(True)
+        return result, res, "\n\n".join(self.all_content), self.total_usage, truncated
+
+    def fail(self, e):
+        """
+        Report a failed attempt.
+
+        :return: Seconds to wait before the next attempt, or None if the step gives up.
+        """
+        self.retries += 1
+        print(f"Attempt {self.retries}/{self.max_retries} failed: {e}")
+        if self.retries >= self.max_retries:
+            return None
+        wait = self.wait_time
+        if self.jitter and wait:
+            wait = round(wait * (1 + random.uniform(0, self.jitter)), 2)
+        if self.deadline is not None and time.time() - self.start + wait > self.deadline:
+            return None
+        print(f"Retrying in {wait} seconds...")
+        self.wait_time *= 2
+        return wait
+
+    def give_up(self):
+        self._record(False)
+        if self.retries < self.max_retries:
+            return RuntimeError(
+                f"Deadline of {self.deadline} seconds exceeded after {self.retries} attempts. {self.failure_message}"
+            )
+        return RuntimeError(f"All {self.max_retries} attempts failed. {self.failure_message}")
+
+    def _record_tier(self, model, accepted):
+        with _step_metrics_lock:
+            stats = _cascade_metrics.setdefault(self.name, {}).setdefault(model, {
+                "calls": 0, "accepted": 0, "escalated": 0, "latency": 0.0,
+            })
+            stats["calls"] += 1
+            stats["accepted" if accepted else "escalated"] += 1
+            stats["latency"] += time.time() - self.tier_start
+
+    def _record(self, succeeded, tier=None):
+        if self.tier_start is not None:
+            self._record_tier(tier or self.model_name, succeeded)
+        with _step_metrics_lock:
+            stats = _step_metrics.setdefault(self.name, {
+                "calls": 0, "succeeded": 0, "failed": 0, "attempts": 0, "retries": 0, "usage": 0, "time": 0.0,
+                "prompt_tokens": 0, "prompt_tokens_by_attempt": [], "cascade_prompt_tokens": 0, "reasks": 0,
+            })
+            stats["calls"] += 1
+            stats["succeeded" if succeeded else "failed"] += 1
+            stats["attempts"] += len(self.all_content)
+            stats["retries"] += self.retries
+            stats["usage"] += self.total_usage
+            stats["time"] += time.time() - self.start
+            stats["reasks"] += int(self.reasked)
+            stats["prompt_tokens"] += sum(self.prompt_tokens)
+            stats["cascade_prompt_tokens"] += self.cascade_prompt_tokens
+            by_attempt = stats["prompt_tokens_by_attempt"]
+            by_attempt.extend([0] * (len(self.prompt_tokens) - len(by_attempt)))
+            for i, tokens in enumerate(self.prompt_tokens):
+                by_attempt[i] += tokens
+
+
+def run_llm_step(messages, parse, model_name="gemini_15_pro", max_retries=5, initial_wait=1, failure_message="",
+                 question=STEP_QUESTION, validators=(), retry_on=(Exception,), name=None, jitter=None, deadline=None,
+                 reask=None, finish=None):
+    """
+    Ask the LLM until its answer passes the step's parser and validators.
+
+    Every attempt is printed like the original step loops ("Attempt i/n failed: ..." and
+    "Retrying in ... seconds..."), with the wait doubling after each failure.
+
+    :param messages: Prompt messages of the step; wrong answers are carried as set in STEP_ENGINE_DEFAULTS.
+    :param parse: Callable turning the answer (newlines removed) into the step result; raises on a bad answer,
+                  StepValidationError with feedback to show the answer back to the model.
+    :param failure_message: End of the RuntimeError raised when every attempt failed, e.g. "Unable to ...".
+    :param validators: Callables checking the parsed result, raising StepValidationError (see expect_rows).
+    :param retry_on: Exceptions that count as a failed attempt; any other exception is raised at once.
+    :param name: Step name used for metrics and LLM call listeners; defaults to the calling function.
+    :param jitter: See STEP_ENGINE_DEFAULTS.
+    :param deadline: See STEP_ENGINE_DEFAULTS.
+    :param reask: Callable(list of table row indices) running the step on only those rows and returning its
+                  (rows, res, content, usage, truncated); used for the partial answers reported by StepRowsError.
+    :param finish: Callable turning the parsed (and possibly spliced) result into the step result.
+    :return: (result, res, content of all attempts, total usage, truncated)
+
+    When STEP_CASCADES has cheaper models for the step, each is asked once first (see get_cascade_metrics).
+    """
+    if name is None:
+        name = sys._getframe(1).f_code.co_name
+    run = _StepRun(name, messages, question, parse, validators, max_retries, initial_wait, retry_on,
+                   failure_message, jitter, deadline, reask, finish)
+    run.model_name = model_name
+    for tier in get_step_cascade(name, model_name):
+        request_messages, refresh = run.request(tier)
+        run.start_tier()
+        try:
+            return run.handle(get_llm_response(request_messages, question, tier, name, refresh, run.accept), tier)
+        except retry_on as e:
+            run.escalate(tier, e)
+        except BaseException:
+            run._record(False, tier)
+            raise
+    while run.retries < max_retries:
+        request_messages, refresh = run.request()
+        try:
+            try:
+                return run.handle(get_llm_response(request_messages, question, model_name, name, refresh, run.accept))
+            except StepRowsError as e:
+                if not run.can_reask(e):
+                    raise
+                return run.splice(e, reask(run.start_reask(e)))
+        except retry_on as e:
+            wait = run.fail(e)
+        except BaseException:
+            run._record(False)
+            raise
+        if wait is None:
+            break
+        time.sleep(wait)
+    raise run.give_up()
+
+
+def run_llm_row_step(build, md_table, model_name="gemini_15_pro", max_retries=5, initial_wait=1, failure_message="",
+                     retry_on=(Exception,), finish=None, name=None, row_overhead=None, known_rows=None):
+    """
+    run_llm_step for a step answering one list entry per row of md_table (e.g. Subtable 1).
+    When the parser reports a partial answer (StepRowsError), the step is run again on only the
+    unresolved rows (see STEP_ENGINE_DEFAULTS["reask_fraction"]) and the answers are spliced together.
+
+    :param build: Callable(md table of some rows) -> (messages, parse) of the step for those rows;
+                  parse returns the list of row answers.
+    :param finish: Callable turning the complete list of row answers into the step result.
+    :param row_overhead: Answer tokens of one row besides its cell text. When given, a table whose answer would
+                         exceed STEP_ENGINE_DEFAULTS["chunk_output_tokens"] is asked in concurrent row windows.
+    :param known_rows: Dictionary mapping row index to its answer, found without the LLM (e.g. by rules);
+                       only the other rows are asked, and none when every row is known.
+                       The share of known rows is counted in the fast-path metrics.
+    """
+    if name is None:
+        name = sys._getframe(1).f_code.co_name
+
+    if known_rows is not None:
+        expected_rows = as_table(md_table).shape[0]
+        record_fast_path(name, len(known_rows), expected_rows)
+        if known_rows:
+            unresolved = [i for i in range(expected_rows) if i not in known_rows]
+            if unresolved:
+                rows, res, content, usage, truncated = run_llm_row_step(
+                    build, select_md_rows(md_table, unresolved), model_name, max_retries, initial_wait,
+                    failure_message, retry_on, name=name, row_overhead=row_overhead)
+                content = f"Rows {sorted(known_rows)} answered by rules; rows {unresolved} asked:\n" + content
+            else:
+                rows, res, content, usage, truncated = [], True, "Automatic execution (rule-based).\n", 0, False
+            answers = dict(known_rows)
+            answers.update(zip(unresolved, rows))
+            rows = [answers[i] for i in range(expected_rows)]
+            return (finish(rows) if finish is not None else rows), res, content, usage, truncated
+
+    if row_overhead is not None:
+        chunks = plan_chunks(estimate_md_row_tokens(md_table, row_overhead))
+        if len(chunks) > 1:
+            expected_rows = chunks[-1][1]
+            results, res, content, usage, truncated = run_chunks(chunks, lambda start, end: run_llm_row_step(
+                build, select_md_rows(md_table, range(start, end)), model_name, max_retries, initial_wait,
+                failure_message, retry_on, name=f"{name}:window"))
+            rows = [row for result in results for row in result]
+            if len(rows) != expected_rows:
+                raise RuntimeError(f"Row windows returned {len(rows)} rows for {expected_rows} rows. {failure_message}")
+            return (finish(rows) if finish is not None else rows), res, content, usage, truncated
+
+    def reask(indices):
+        messages, parse = build(select_md_rows(md_table, indices))
+        return run_llm_step(messages, parse, model_name, max_retries, initial_wait, failure_message,
+                            retry_on=retry_on, name=f"{name}:reask")
+
+    messages, parse = build(md_table)
+    return run_llm_step(messages, parse, model_name, max_retries, initial_wait, failure_message,
+                        retry_on=retry_on, name=name, reask=reask, finish=finish)
@@ -3,6 +3,12 @@ import pandas as pd
 import re
 from difflib import get_close_matches
 import json
+from TabFuncFlow.utils.markdown_utils import *
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
 
 
 def html_table_to_markdown(html):
@@ -47,7 +53,7 @@ def html_table_to_markdown(html):
             # for sup in col.find_all("sup"):
             #     sup.string = f"^{sup.get_text(strip=True)}^"  # Convert to Markdown superscript format
 
-            text = "".join(col.stripped_strings)
+            text = escape_markdown_cell("".join(col.stripped_strings))
             colspan = int(col.get("colspan", 1))
             rowspan = int(col.get("rowspan", 1))
 
@@ -86,55 +92,164 @@ def html_table_to_markdown(html):
     return "\n".join(markdown_rows[:header_end_idx + 1] + [separator] + markdown_rows[header_end_idx + 1:])
 
 
-def markdown_to_dataframe(md_table):
+class Table(str):
     """
-    Convert a Markdown table to a Pandas DataFrame, treating all values as strings.
+    A Markdown table that keeps its parsed cells, so that passing it from step to step does not parse it again.
 
-    :param md_table: A string containing the Markdown table.
-    :return: Pandas DataFrame representing the table with all values as strings.
+    It is the Markdown string itself, so prompts, checkpoints and string operations work on it unchanged;
+    markdown_to_dataframe, display_md_table, fix_col_name and the operations (f_select_row_col, ...) use
+    the cached cells and renderings instead. dataframe_to_markdown returns a Table.
     """
-    lines = md_table.strip().split('\n')
-    if len(lines) < 3:
-        return pd.DataFrame()  # Return empty DataFrame if table is invalid
 
-    # Extract header and data rows, skipping the separator line
-    headers = lines[0].split('|')[1:-1]  # Remove leading and trailing empty parts
-    data_rows = [line.split('|')[1:-1] for line in lines[2:]]
+    def __new__(cls, md_table="", columns=None, rows=None):
+        table = super().__new__(cls, md_table)
+        table._columns = columns
+        table._rows = rows
+        table._df = None
+        table._display = None
+        return table
+
+    @classmethod
+    def from_cells(cls, columns, rows):
+        """
+        Build a table from its header and data cells (lists of strings); the cell lists are kept, not copied.
+        The Markdown is the same as dataframe_to_markdown gives for a DataFrame of these cells, with pipes and
+        newlines in cells escaped (see escape_markdown_cell).
+        """
+        if not columns or not rows:
+            return cls("")
+        if any(needs_markdown_escape(c) for c in columns) or any(needs_markdown_escape(c) for row in rows for c in row):
+            # Escaped cells are read back stripped after unescaping, so such tables are parsed lazily.
+            columns = [escape_markdown_cell(c) for c in columns]
+            rows = [[escape_markdown_cell(c) for c in row] for row in rows]
+            lines = ['| ' + ' | '.join(columns) + ' |', '| ' + ' | '.join(['---'] * len(columns)) + ' |']
+            lines += ['| ' + ' | '.join(row) + ' |' for row in rows]
+            return cls('\n'.join(lines))
+        lines = ['| ' + ' | '.join(columns) + ' |', '| ' + ' | '.join(['---'] * len(columns)) + ' |']
+        lines += ['| ' + ' | '.join(row) + ' |' for row in rows]
+        if any(c != c.strip() for c in columns) or any(c != c.strip() for row in rows for c in row):
+            columns = [c.strip() for c in columns]
+            rows = [[c.strip() for c in row] for row in rows]
+        return cls('\n'.join(lines), columns, rows)
+
+    def _parse(self):
+        if self._columns is not None:
+            return
+        lines = self.strip().split('\n')
+        if len(lines) < 3:
+            self._columns, self._rows = [], []  # Not a valid table
+            return
+        # Skip the separator line and the empty parts before the first and after the last "|"
+        self._columns = parse_markdown_rows(lines[:1])[0]
+        self._rows = parse_markdown_rows(lines[2:])
+
+    @property
+    def columns(self):
+        self._parse()
+        return self._columns
+
+    @property
+    def rows(self):
+        self._parse()
+        return self._rows
+
+    @property
+    def shape(self):
+        self._parse()
+        return len(self._rows), len(self._columns)
+
+    def _build_dataframe(self):
+        self._parse()
+        if not self._columns:
+            return pd.DataFrame()
+        return pd.DataFrame(self._rows, columns=self._columns, dtype=str)
+
+    def to_dataframe(self):
+        """
+        :return: A new DataFrame of the cells (all values as strings); the caller may modify it.
+        """
+        if self._df is None:
+            self._df = self._build_dataframe()
+        return self._df.copy()
+
+    def display(self):
+        """
+        :return: display_md_table of this table, rendered once.
+        """
+        if self._display is None:
+            self._display = display_md_table(str(self))
+        return self._display
+
+    def select(self, rows=None, cols=None):
+        """
+        Select rows (by position) and columns (by name) like f_select_row_col, sharing the cell strings.
+
+        :param rows: List of row indices, or None / [] for all rows.
+        :param cols: List of column names, or None / [] for all columns.
+        :return: Table
+        """
+        self._parse()
+        if len(set(self._columns)) != len(self._columns):
+            # Selecting a duplicated header name selects all its columns; leave that to pandas.
+            df_table = self.to_dataframe()
+            df_table = df_table.iloc[rows if rows else slice(None)][cols if cols else df_table.columns]
+            return dataframe_to_markdown(df_table.reset_index(drop=True))
+        selected_rows = [self._rows[i] for i in rows] if rows else self._rows
+        if not cols:
+            return Table.from_cells(self._columns, selected_rows)
+        positions = {col: i for i, col in enumerate(self._columns)}
+        missing = [col for col in cols if col not in positions]
+        if missing:
+            raise KeyError(f"{missing} not in index")
+        indices = [positions[col] for col in cols]
+        return Table.from_cells([self._columns[i] for i in indices],
+                                [[row[i] for i in indices] for row in selected_rows])
+
+
+def as_table(md_table):
+    """
+    :return: md_table as a Table, parsed at most once.
+    """
+    return md_table if isinstance(md_table, Table) else Table(md_table)
 
-    # Trim whitespace from headers and data cells
-    headers = [h.strip() for h in headers]
-    data_rows = [[cell.strip() for cell in row] for row in data_rows]
 
-    # Create DataFrame treating all values as strings
-    df = pd.DataFrame(data_rows, columns=headers, dtype=str)
-    return df
+def markdown_to_dataframe(md_table):
+    """
+    Convert a Markdown table to a Pandas DataFrame, treating all values as strings.
+
+    :param md_table: A string (or Table) containing the Markdown table.
+    :return: Pandas DataFrame representing the table with all values as strings.
+    """
+    if isinstance(md_table, Table):
+        return md_table.to_dataframe()
+    return Table(md_table)._build_dataframe()
 
 
 def dataframe_to_markdown(df_table):
     """
-    Convert a Pandas DataFrame to a Markdown-formatted table.
+    Convert a Pandas DataFrame to a Markdown-formatted table, column by column (see dataframe_to_cells).
+    Pipes and newlines in cells are escaped, so markdown_to_dataframe reads the same cells back.
 
     :param df_table: Pandas DataFrame to convert
-    :return: Markdown-formatted table as a string
+    :return: Markdown-formatted table as a Table (a string)
     """
     if df_table.empty:
-        return ""  # Return empty string if DataFrame is empty
-
-    # Prepare header
-    headers = df_table.columns.tolist()
-    header_line = '| ' + ' | '.join(headers) + ' |'
-    separator_line = '| ' + ' | '.join(['---'] * len(headers)) + ' |'
+        return Table("")  # Return empty string if DataFrame is empty
 
-    # Prepare data rows
-    data_lines = []
-    for _, row in df_table.iterrows():
-        row_str = '| ' + ' | '.join(str(cell) for cell in row) + ' |'
-        data_lines.append(row_str)
+    headers, rows = dataframe_to_cells(df_table)
+    return Table.from_cells(headers, rows)
 
-    # Combine into final Markdown table
-    md_table = '\n'.join([header_line, separator_line] + data_lines)
 
-    return md_table
+def _split_header_line(line):
+    """
+    re.split(r'\s*\|\s*', line.strip('|')), leaving escaped pipes (\\|) inside their cell.
+    """
+    if '\\' not in line:
+        return re.split(r'\s*\|\s*', line.strip('|'))
+    cells = split_markdown_row(line.strip('|'))
+    last = len(cells) - 1
+    return [cell if last == 0 else cell.rstrip() if i == 0 else cell.lstrip() if i == last else cell.strip()
+            for i, cell in enumerate(cells)]
 
 
 def stack_md_table_headers(md_table):
@@ -156,7 +271,7 @@ def stack_md_table_headers(md_table):
     header_lines = lines[:separator_idx]
 
     # Split header lines into lists of columns
-    header_matrix = [re.split(r'\s*\|\s*', line.strip('|')) for line in header_lines]
+    header_matrix = [_split_header_line(line) for line in header_lines]
     max_cols = max(len(row) for row in header_matrix)
 
     # Stack header rows by column, keeping the original name if identical
@@ -183,9 +298,9 @@ def remove_empty_col_row(md_table):
         return md_table  # Not enough lines to form a valid table
 
     # Parse table
-    headers = lines[0].split('|')[1:-1]  # Remove leading and trailing empty parts
+    headers = split_markdown_row(lines[0])[1:-1]  # Remove leading and trailing empty parts
     separator = lines[1]
-    data_rows = [line.split('|')[1:-1] for line in lines[2:]]
+    data_rows = [split_markdown_row(line)[1:-1] for line in lines[2:]]
 
     # Trim whitespace
     headers = [h.strip() for h in headers]
@@ -217,7 +332,7 @@ def fill_empty_headers(md_table):
         return md_table  # Not enough lines to form a valid table
 
     # Extract header line
-    headers = lines[0].split('|')[1:-1]  # Remove leading and trailing empty parts
+    headers = split_markdown_row(lines[0])[1:-1]  # Remove leading and trailing empty parts
     separator = lines[1]
 
     # Find existing Unnamed_x numbers
@@ -259,7 +374,7 @@ def deduplicate_headers(md_table):
         return md_table  # Not enough lines to form a valid table
 
     # Extract header line
-    headers = lines[0].split('|')[1:-1]  # Remove leading and trailing empty parts
+    headers = split_markdown_row(lines[0])[1:-1]  # Remove leading and trailing empty parts
     separator = lines[1]
 
     # Count occurrences to detect duplicates
@@ -301,6 +416,8 @@ def display_md_table(md_table):
     :param md_table: Markdown table as a string
     :return: Modified Markdown table with labeled rows
     """
+    if isinstance(md_table, Table):
+        return md_table.display()
     lines = md_table.strip().split('\n')
     if len(lines) < 2:
         return md_table  # Not enough lines to form a valid table
@@ -308,7 +425,7 @@ def display_md_table(md_table):
     labeled_lines = []
     for i, line in enumerate(lines):
         if i == 0:
-            headers = line.split('|')
+            headers = split_markdown_row(line)
             headers = [f'"{header.strip()}"' for header in headers if header.strip()]
             labeled_lines.append(f"col: | {' | '.join(headers)} |")
         elif i == 1 and re.match(r'\|\s*-+\s*\|', line):
@@ -320,8 +437,7 @@ def display_md_table(md_table):
 
 
 def fix_col_name(col_name, md_table):
-    df_table = markdown_to_dataframe(md_table)
-    col_names = [col.strip() for col in df_table.columns.tolist()]
+    col_names = [col.strip() for col in as_table(md_table).columns]
 
     if col_name in col_names:
         return col_name
@@ -335,9 +451,9 @@ def fix_col_name(col_name, md_table):
 def transpose_markdown_table(md_table):
     lines = md_table.strip().split('\n')
 
-    header = lines[0].strip('|').split('|')
+    header = split_markdown_row(lines[0].strip('|'))
     separator = lines[1]
-    rows = [line.strip('|').split('|') for line in lines[2:]]
+    rows = [split_markdown_row(line.strip('|')) for line in lines[2:]]
 
     transposed = [header] + rows
     transposed = list(map(list, zip(*transposed)))
@@ -376,21 +492,163 @@ def get_caption_and_footnote_from_file(json_file_path):
 #         md_table_aligned_with_1_param_type_and_value_list.append(dataframe_to_markdown(markdown_to_dataframe(md_table).iloc[:][[pt_list[0], pv]].reset_index(drop=True)))
 #     return md_table_aligned_with_1_param_type_and_value_list
 
-def single_html_table_to_markdown(html_content):
+def _element_text(element):
     """
-    Converts a single HTML <table> to Markdown format.
-    Ensures that the HTML content contains only one <table>.
+    The text of an lxml element without its <sup> elements, as "".join(col.stripped_strings) in BeautifulSoup
+    (which also leaves out comments and the text of scripts, styles, templates and ruby annotations).
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
+    parts = []
 
-    # Find all tables in the HTML
-    tables = soup.find_all('table')
+    def collect(el):
+        if el.text:
+            parts.append(el.text)
+        for child in el:
+            if isinstance(child.tag, str) and child.tag not in ("sup", "script", "style", "template", "rt", "rp"):
+                collect(child)
+            if child.tail:
+                parts.append(child.tail)
 
-    if len(tables) != 1:
-        raise ValueError("The input must contain exactly one <table>.")
+    collect(element)
+    return "".join(part.strip() for part in parts)
+
+
+def _html_table_matrix(table):
+    """
+    The cell grid of an lxml <table>, expanding colspan and rowspan exactly like html_table_to_markdown.
+
+    :return: (list of (row cells, is_header), number of columns)
+    """
+    table_matrix = []
+    max_cols = 0
+    rowspan_tracker = {}
+    for row in table.iter("tr"):
+        cols = [col for col in row.iter("th", "td") if col is not row]
+        row_data = []
+        col_idx = 0
+        while col_idx in rowspan_tracker and rowspan_tracker[col_idx][1] > 0:
+            row_data.append(rowspan_tracker[col_idx][0])
+            rowspan_tracker[col_idx] = (rowspan_tracker[col_idx][0], rowspan_tracker[col_idx][1] - 1)
+            if rowspan_tracker[col_idx][1] == 0:
+                del rowspan_tracker[col_idx]
+            col_idx += 1
+        is_header = all(col.tag == "th" for col in cols)
+        for col in cols:
+            text = escape_markdown_cell(_element_text(col))
+            colspan = int(col.get("colspan", 1))
+            rowspan = int(col.get("rowspan", 1))
+            row_data.extend([text] * colspan)
+            if rowspan > 1:
+                for i in range(colspan):
+                    rowspan_tracker[col_idx + i] = (text, rowspan - 1)
+            col_idx += colspan
+        max_cols = max(max_cols, len(row_data))
+        table_matrix.append((row_data, is_header))
+    for row, _ in table_matrix:
+        while len(row) < max_cols:
+            missing_col_idx = len(row)
+            row.append(rowspan_tracker[missing_col_idx][0] if missing_col_idx in rowspan_tracker else "")
+    return table_matrix, max_cols
+
+
+def _normalize_table_matrix(table_matrix, max_cols):
+    """
+    stack_md_table_headers, remove_empty_col_row, fill_empty_headers and deduplicate_headers applied to the
+    cell grid at once, giving the same Markdown as the string passes.
 
-    markdown_table = deduplicate_headers(fill_empty_headers(
+    :return: Table, or None where the string passes behave differently (they are used instead).
+    """
+    if max_cols == 0:
+        return None
+    header_end_idx = 0
+    for i, (_, is_header) in enumerate(table_matrix):
+        if is_header:
+            header_end_idx = i
+        else:
+            break
+    # stack_md_table_headers splits the header off at the first line looking like a separator
+    header_rows = [row for row, _ in table_matrix[:header_end_idx + 1]]
+    if any(re.match(r'\|\s*-+\s*\|', "| " + row[0] + " |") for row in header_rows):
+        return None
+    header_matrix = [_split_header_line("| " + " | ".join(row) + " |") for row in header_rows]
+    headers = [col[0] if all(x == col[0] for x in col) else ".".join(filter(None, col)) for col in zip(*header_matrix)]
+
+    # remove_empty_col_row
+    headers = [h.strip() for h in headers]
+    data_rows = [[cell.strip() for cell in row] for row, _ in table_matrix[header_end_idx + 1:]]
+    valid_columns = [i for i in range(len(headers)) if headers[i] or any(row[i] for row in data_rows)]
+    if not valid_columns:
+        return None
+    headers = [headers[i] for i in valid_columns]
+    data_rows = [[row[i] for i in valid_columns] for row in data_rows if any(row)]
+
+    # fill_empty_headers
+    existing_numbers = set()
+    for header in headers:
+        match = re.match(r"Unnamed_(\d+)", header)
+        if match:
+            existing_numbers.add(int(match.group(1)))
+    next_num = 0 if not existing_numbers else max(existing_numbers) + 1
+    for i in range(len(headers)):
+        if not headers[i]:
+            while next_num in existing_numbers:
+                next_num += 1
+            headers[i] = f'Unnamed_{next_num}'
+            existing_numbers.add(next_num)
+
+    # deduplicate_headers
+    counts = {}
+    for header in headers:
+        counts[header] = counts.get(header, 0) + 1
+    seen = {}
+    for i, header in enumerate(headers):
+        if counts[header] > 1:
+            seen[header] = seen[header] + 1 if header in seen else 0
+            headers[i] = f"{header}_{seen[header]}"
+
+    # The separator line keeps the column count of the HTML grid, as in the string passes.
+    lines = ['| ' + ' | '.join(headers) + ' |', "| " + " | ".join(["---"] * max_cols) + " |"]
+    lines += ['| ' + ' | '.join(row) + ' |' for row in data_rows]
+    if not data_rows or any('\\' in cell for cell in headers) or any('\\' in cell for row in data_rows for cell in row):
+        return Table('\n'.join(lines))  # Parsed as an empty table, or escaped cells to read back
+    return Table('\n'.join(lines), headers, data_rows)
+
+
+def normalize_html_table(html_content, single=False):
+    """
+    Convert the first HTML <table> to a normalized Markdown table, the same as
+    deduplicate_headers(fill_empty_headers(remove_empty_col_row(stack_md_table_headers(html_table_to_markdown(html))))),
+    but parsing the HTML once with lxml and normalizing the cell grid in memory. Without lxml, or for the
+    unusual grids listed in _normalize_table_matrix, the string passes are used.
+
+    :param single: Raise ValueError unless the HTML contains exactly one <table>.
+    :return: Markdown table as a string (a Table when normalized in memory)
+    """
+    md_table = None
+    if lxml is not None:
+        try:
+            tables = lxml.html.fromstring(html_content).xpath("//table")
+        except Exception:
+            tables = None
+        if tables is not None:
+            if single and len(tables) != 1:
+                raise ValueError("The input must contain exactly one <table>.")
+            try:
+                md_table = _normalize_table_matrix(*_html_table_matrix(tables[0])) if tables else None
+            except Exception:
+                md_table = None
+            single = False
+    if md_table is not None:
+        return md_table
+    if single and len(BeautifulSoup(html_content, 'html.parser').find_all('table')) != 1:
+        raise ValueError("The input must contain exactly one <table>.")
+    return deduplicate_headers(fill_empty_headers(
         remove_empty_col_row(stack_md_table_headers(html_table_to_markdown(html_content)))))
 
-    return markdown_table
+
+def single_html_table_to_markdown(html_content):
+    """
+    Converts a single HTML <table> to Markdown format.
+    Ensures that the HTML content contains only one <table>.
+    """
+    return normalize_html_table(html_content, single=True)
 
@@ -5,25 +5,64 @@ from google.generativeai import GenerativeModel
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import os
 import logging
+import threading
+
+from extractor.utils import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 if "GEMINI_15_API_KEY" in os.environ:
     genai.configure(api_key=os.environ.get("GEMINI_15_API_KEY", None))
 
+GEMINI_GENERATION_CONFIG = {
+    "candidate_count": 1,
+    "temperature": 0,
+    # "max_output_tokens": 10000,
+}
+
+def get_generation_config(flash: bool = False) -> Dict[str, Any]:
+    """
+    Settings that determine the generated answer, used e.g. as part of response cache keys.
+    """
+    model_name = os.environ.get("GEMINI_15_FLASH_MODEL") if flash else os.environ.get("GEMINI_15_MODEL")
+    return {"model": model_name, **GEMINI_GENERATION_CONFIG}
+
+_client_lock = threading.Lock()
+_client_registry: Dict[Any, Any] = {}
+
+def _reset_clients():
+    # Pooled connections must not be shared with a forked child process.
+    global _client_lock
+    _client_lock = threading.Lock()
+    _client_registry.clear()
+
+os.register_at_fork(after_in_child=_reset_clients)
+
 def get_client():
-    try:
-        model_15_pro = genai.GenerativeModel(
-            os.environ.get("GEMINI_15_MODEL", "gemini-pro")
-            ) \
-            if "GEMINI_15_MODEL" in os.environ else None
-        model_15_flash = genai.GenerativeModel(
-            os.environ.get("GEMINI_15_FLASH_MODEL", "gemini-1.5-flash-latest")
-            ) \
-            if "GEMINI_15_FLASH_MODEL" in os.environ else None
-        return (model_15_pro, model_15_flash)
-    except Exception:
-        return (None, None)
+    """
+    Obtain the process-wide Gemini models.
+    The GenerativeModel objects (and the gRPC channels they open) are created once per
+    model configuration and reused by every request, so connections stay alive between calls.
+    Return:
+        (model_15_pro, model_15_flash)
+    """
+    key = (os.environ.get("GEMINI_15_MODEL"), os.environ.get("GEMINI_15_FLASH_MODEL"))
+    with _client_lock:
+        if key in _client_registry:
+            return _client_registry[key]
+        try:
+            model_15_pro = genai.GenerativeModel(
+                os.environ.get("GEMINI_15_MODEL", "gemini-pro")
+                ) \
+                if "GEMINI_15_MODEL" in os.environ else None
+            model_15_flash = genai.GenerativeModel(
+                os.environ.get("GEMINI_15_FLASH_MODEL", "gemini-1.5-flash-latest")
+                ) \
+                if "GEMINI_15_FLASH_MODEL" in os.environ else None
+        except Exception:
+            return (None, None)
+        _client_registry[key] = (model_15_pro, model_15_flash)
+        return _client_registry[key]
 
 def add_message_message_list(msgs: List[Any], msg: Dict[str, Any]):
     cnt = len(msgs)
@@ -61,28 +100,44 @@ def messageDecor(func):
         return func(*args, **kwargs)
     return converter
 
+SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+}
+
+def get_usage(res, messages: List[Any]) -> int:
+    """
+    Total tokens of a generation, read from the response's usage metadata so that no
+    extra count_tokens round trip is needed. Falls back to the offline estimate of
+    the prompt and the answer when the metadata is missing.
+    """
+    if res is None or res.text is None:
+        return 0
+    usage_metadata = getattr(res, "usage_metadata", None)
+    total_tokens = getattr(usage_metadata, "total_token_count", 0) if usage_metadata is not None else 0
+    if total_tokens:
+        return total_tokens
+    return estimate_tokens(messages) + estimate_tokens(res.text)
+
 def request_to_gemini(model: GenerativeModel, messages: List[any]):
     res = model.generate_content(
         messages,
-        generation_config=genai.types.GenerationConfig(
-            candidate_count=1,
-            temperature=0,
-            # max_output_tokens=10000,
-        ),
-        safety_settings={
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        },
+        generation_config=genai.types.GenerationConfig(**GEMINI_GENERATION_CONFIG),
+        safety_settings=SAFETY_SETTINGS,
         request_options={"timeout": 60000}
     )
-    usage = (
-        model.count_tokens(res.text).total_tokens + 
-        model.count_tokens(messages).total_tokens
-        if res is not None and res.text is not None else 0
+    return (True, res.text, get_usage(res, messages), False)
+
+async def arequest_to_gemini(model: GenerativeModel, messages: List[any]):
+    res = await model.generate_content_async(
+        messages,
+        generation_config=genai.types.GenerationConfig(**GEMINI_GENERATION_CONFIG),
+        safety_settings=SAFETY_SETTINGS,
+        request_options={"timeout": 60000}
     )
-    return (True, res.text, usage, False)
+    return (True, res.text, get_usage(res, messages), False)
 
 @messageDecor
 def request_to_gemini_15_pro(messages: List[Any], question: str):
@@ -92,7 +147,7 @@ def request_to_gemini_15_pro(messages: List[Any], question: str):
         return request_to_gemini(model_15_pro, messages)
     except Exception as e:
         logger.error(e)
-        return (False, str(e), None)
+        return (False, str(e), 0, False)
     
 @messageDecor
 def request_to_gemini_15_flash(messages: List[Any], question: str):
@@ -102,5 +157,25 @@ def request_to_gemini_15_flash(messages: List[Any], question: str):
         return request_to_gemini(model_15_flash, messages)
     except Exception as e:
         logger.error(e)
-        return (False, str(e), None)
+        return (False, str(e), 0, False)
+
+@messageDecor
+async def arequest_to_gemini_15_pro(messages: List[Any], question: str):
+    add_message_message_list(messages, {"role": "user", "parts": question})
+    try:
+        model_15_pro, _ = get_client()
+        return await arequest_to_gemini(model_15_pro, messages)
+    except Exception as e:
+        logger.error(e)
+        return (False, str(e), 0, False)
+
+@messageDecor
+async def arequest_to_gemini_15_flash(messages: List[Any], question: str):
+    add_message_message_list(messages, {"role": "user", "parts": question})
+    try:
+        _, model_15_flash = get_client()
+        return await arequest_to_gemini(model_15_flash, messages)
+    except Exception as e:
+        logger.error(e)
+        return (False, str(e), 0, False)
 
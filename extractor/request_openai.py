@@ -1,20 +1,69 @@
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Dict
 # from openai import AzureOpenAI, OpenAI
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 import openai
+import httpx
 import os
 import logging
+import threading
 
 from extractor.utils import concate_llm_contents
 
 logger = logging.getLogger(__name__)
 
+_client_lock = threading.Lock()
+_client_registry: Dict[Any, Any] = {}
+_http_clients: Dict[str, Any] = {}
+
+def _reset_clients():
+    # Pooled connections must not be shared with a forked child process.
+    global _client_lock
+    _client_lock = threading.Lock()
+    _client_registry.clear()
+    _http_clients.clear()
+
+os.register_at_fork(after_in_child=_reset_clients)
+
+def _get_http_limits():
+    max_connections = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 200))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", 60)),
+    )
+
+def get_http_clients():
+    """
+    Obtain the process-wide pooled HTTP clients shared by every GPT client.
+    Connections (and their TLS sessions) are kept alive and reused between requests;
+    the pool size is set by LLM_HTTP_MAX_CONNECTIONS.
+    Return:
+        (httpx.Client, httpx.AsyncClient)
+    """
+    with _client_lock:
+        if not _http_clients:
+            timeout = httpx.Timeout(float(os.environ.get("LLM_HTTP_TIMEOUT", 600)), connect=10.0)
+            _http_clients["sync"] = httpx.Client(limits=_get_http_limits(), timeout=timeout)
+            _http_clients["async"] = httpx.AsyncClient(limits=_get_http_limits(), timeout=timeout)
+        return _http_clients["sync"], _http_clients["async"]
+
 def get_client_and_model(): 
     """
     Obtain GPT client and model
+    Clients are built once per configuration and reused by every request (see get_http_clients).
     Return:
         (gpt-4o, model-4o, gpt-35, model-35, gpt-40, model-40)
     """
+    key = tuple(sorted(get_generation_config().items()))
+    with _client_lock:
+        if key in _client_registry:
+            return _client_registry[key]
+    result = _build_client_and_model()
+    with _client_lock:
+        return _client_registry.setdefault(key, result)
+
+def _build_client_and_model():
+    http_client, http_async_client = get_http_clients()
     openai_type = os.environ.get("OPENAI_API_TYPE")
     if openai_type == "azure":
         # client_35 = AzureChatOpenAI(
@@ -45,6 +94,8 @@ def get_client_and_model():
             top_p=0.95,
             frequency_penalty=0,
             presence_penalty=0,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
         model_4o = os.environ.get("OPENAI_4O_DEPLOYMENT_NAME", None)
         return (client_4o, model_4o, None, None, None, None)
@@ -57,67 +108,117 @@ def get_client_and_model():
         client_4o = ChatOpenAI(
             api_key=os.environ.get("OPENAI_4O_API_KEY", None),
             model=os.environ.get("OPENAI_4O_MODEL", None),
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
         model_4o = "gpt-4o"
         return (client_4o, model_4o, None, None, None, None)
 
+def get_generation_config() -> Dict[str, Any]:
+    """
+    Settings that determine the generated answer, used e.g. as part of response cache keys.
+    """
+    openai_type = os.environ.get("OPENAI_API_TYPE")
+    if openai_type == "azure":
+        return {
+            "api_type": openai_type,
+            "model": os.environ.get("OPENAI_4O_MODEL", None),
+            "deployment": os.environ.get("OPENAI_4O_DEPLOYMENT_NAME", None),
+            "temperature": 0.0,
+            "max_tokens": os.environ.get("OPENAI_MAX_OUTPUT_TOKENS", 4096),
+            "top_p": 0.95,
+        }
+    return {
+        "api_type": openai_type,
+        "model": os.environ.get("OPENAI_4O_MODEL", None),
+    }
 
-def request_to_chatgpt_4o(prompts: List[Any], question: str):
+
+CONTINUE_PROMPT = "The JSON table above is incomplete. Continue generating the remaining JSON table content without adding any explanations, comments, or extra text—only the JSON data."
+
+def _response_content_and_usage(res):
+    content = res.generations[0][0].text
+    token_usage = res.llm_output.get("token_usage")
+    return content, token_usage.get("total_tokens", 0)
+
+def _chatgpt_4o_exchange(prompts: List[Any], question: str):
+    """
+    The conversation of one request as a generator, shared by request_to_chatgpt_4o and arequest_to_chatgpt_4o:
+    it yields the messages to send and is sent each response back. A truncated answer is continued
+    (at most 5 times) and the parts are joined.
+    Return (as the StopIteration value):
+        (res, content, usage, truncated)
+    """
     prompts.append({"role": "user", "content": question})
+    res = yield prompts
+    content, total_tokens = _response_content_and_usage(res)
+
+    if not _is_incompleted_response(content):
+        return (True, content, total_tokens, False)
+
+    contents = [content]
+    usages = [total_tokens]
+    loops = 0
+    MAX_LOOP = 5
+    while _is_incompleted_response(content) and loops < MAX_LOOP:
+        if content is not None:
+            prompts.append({"role": "assistant", "content": content})
+        prompts.append({"role": "user", "content": CONTINUE_PROMPT})
+        res = yield prompts
+        content, total_tokens = _response_content_and_usage(res)
+        contents.append(content)
+        usages.append(total_tokens)
+        loops += 1
+
+    all_content, all_usage, truncated = concate_llm_contents(contents, usages)
+    return (True, all_content, all_usage, True)
+
+def request_to_chatgpt_4o(prompts: List[Any], question: str):
+    exchange = _chatgpt_4o_exchange(prompts, question)
+    messages = next(exchange)
     try:
         client_4o, model_4o, _, _, _, _ = get_client_and_model()
         try:
             res = client_4o.generate(
-                messages=[prompts],
+                messages=[messages],
             )
-        except (
-            openai._exceptions.APIError,
-            openai._exceptions.OpenAIError,
-            openai._exceptions.ConflictError,
-            openai._exceptions.NotFoundError,
-            openai._exceptions.APIStatusError,
-            openai._exceptions.RateLimitError,
-            openai._exceptions.APITimeoutError,
-            openai._exceptions.BadRequestError,
-            openai._exceptions.APIConnectionError,
-            openai._exceptions.AuthenticationError,
-            openai._exceptions.InternalServerError,
-            openai._exceptions.PermissionDeniedError,
-            openai._exceptions.UnprocessableEntityError,
-            openai._exceptions.APIResponseValidationError,
-        ) as e:
+        except openai._exceptions.OpenAIError as e:
             return False, str(e), None, None
         except Exception as e:
             return False, str(e), None, None
-        content = res.generations[0][0].text
-        token_usage = res.llm_output.get("token_usage")
-        total_tokens = token_usage.get("total_tokens", 0)
-
-        if not _is_incompleted_response(content):
-            return (True, content, total_tokens, False)
-        
-        contents = [content]
-        usages = [total_tokens]
-        loops = 0
-        MAX_LOOP = 5
-        while _is_incompleted_response(content) and loops < MAX_LOOP:
-            if content is not None:
-                prompts.append({"role": "assistant", "content": content})
-            prompts.append({"role": "user", "content": "The JSON table above is incomplete. Continue generating the remaining JSON table content without adding any explanations, comments, or extra text—only the JSON data."})
-            res = client_4o.generate(messages=[prompts])
-            content = res.generations[0][0].text
-            token_usage = res.llm_output.get("token_usage")
-            total_tokens = token_usage.get("total_tokens", 0)
-            contents.append(content)
-            usages.append(total_tokens)
-            loops += 1
-        
-        all_content, all_usage, truncated = concate_llm_contents(contents, usages)
-        return (True, all_content, all_usage, True)
+        while True:
+            try:
+                messages = exchange.send(res)
+            except StopIteration as stop:
+                return stop.value
+            res = client_4o.generate(messages=[messages])
     except Exception as e:
         logger.error(e)
         return (False, str(e), None, False)
-    
+
+async def arequest_to_chatgpt_4o(prompts: List[Any], question: str):
+    exchange = _chatgpt_4o_exchange(prompts, question)
+    messages = next(exchange)
+    try:
+        client_4o, model_4o, _, _, _, _ = get_client_and_model()
+        try:
+            res = await client_4o.agenerate(
+                messages=[messages],
+            )
+        except openai._exceptions.OpenAIError as e:
+            return False, str(e), None, None
+        except Exception as e:
+            return False, str(e), None, None
+        while True:
+            try:
+                messages = exchange.send(res)
+            except StopIteration as stop:
+                return stop.value
+            res = await client_4o.agenerate(messages=[messages])
+    except Exception as e:
+        logger.error(e)
+        return (False, str(e), None, False)
+
 def _is_incompleted_response(content: Optional[str] = None):
     if content is None:
         return False
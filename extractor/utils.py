@@ -266,3 +266,22 @@ def extract_float_values(s)->List[float]:
     else:
         return None
 
+
+
+TOKEN_RE_PATTERN = re.compile(r"\w+|[^\w\s]")
+def estimate_tokens(content) -> int:
+    """
+    This function is to estimate the number of LLM tokens in a text offline,
+    without calling the provider's tokenizer. Each word is counted as one token
+    per 4 characters, and each punctuation mark (e.g. the '|' of markdown tables)
+    as one token. Lists of strings or of message dicts ({"content": ...} or
+    {"parts": ...}) are summed up.
+    """
+    if content is None:
+        return 0
+    if isinstance(content, dict):
+        return estimate_tokens(content.get("content", content.get("parts")))
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(item) for item in content)
+    content = str(content)
+    return sum((len(tok) + 3) // 4 for tok in TOKEN_RE_PATTERN.findall(content))
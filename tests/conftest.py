@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Register models "fake" and "fake_cheap" answering with answer(model, messages) and record every request.
+    """
+    from TabFuncFlow.utils.llm_utils import LLM_PROVIDERS
+
+    class FakeLLM(object):
+        def __init__(self):
+            self.requests = []
+            self.answer = lambda model, messages: "<<[]>>"
+
+    fake = FakeLLM()
+
+    def provider(model):
+        async def arequest(prompt_list, question):
+            messages = [prompt["content"] for prompt in prompt_list]
+            fake.requests.append((model, messages))
+            return True, fake.answer(model, messages), 10, False
+        return None, arequest, lambda: {}
+
+    monkeypatch.setitem(LLM_PROVIDERS, "fake", provider("fake"))
+    monkeypatch.setitem(LLM_PROVIDERS, "fake_cheap", provider("fake_cheap"))
+    return fake
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+from TabFuncFlow.utils.benchmark_utils import *
+
+
+def test_summary_values_are_scored_as_tuples():
+    gold = pd.DataFrame({
+        "Value": ["1,234.5", "2.0", "3"],
+        "Variation value": ["0.5", "", "N/A"],
+        "Lower limit": ["", "", ""],
+        "High limit": ["", "", ""],
+    })
+    predicted = pd.DataFrame({
+        "Parameter value": ["1234.5", "2", "4"],
+        "Variation value": ["0.50", "N/A", "N/A"],
+        "Lower bound": ["N/A", "N/A", "N/A"],
+        "Upper bound": ["N/A", "N/A", "N/A"],
+    })
+    scores = score_pmid("pk_summary", gold, [predicted.iloc[:2], None, predicted.iloc[2:]])
+    assert (scores["n_gold"], scores["n_pred"], scores["matched"]) == (3, 3, 2)
+    assert scores["precision"] == scores["recall"] == scores["f1"] == pytest.approx(2 / 3)
+
+
+def test_individual_gold_is_read_from_the_wide_value_columns():
+    gold = pd.DataFrame({"Parameter type": ["AUC", "Cmax"], "Value 1": ["1", "2"], "Value 2": ["3", ""]})
+    predicted = pd.DataFrame({"Parameter value": ["1", "2", "2", "5"]})
+    scores = score_pmid("pk_individual", gold, [predicted])
+    assert (scores["n_gold"], scores["n_pred"], scores["matched"]) == (3, 4, 2)
+    assert score_pmid("pk_individual", gold, [None])["f1"] == 0.0
+
+
+def report(**aggregate):
+    tables = [{"ok": True, "wall_time": 10.0, "llm_calls": 20, "retries": 2, "tokens": 1000,
+               "peak_rss_kb": 100, "steps": {"s1": {"calls": 20, "latency": 9.0, "tokens": 1000, "prompt_tokens": 800}}}]
+    pmids = [{"matched": 8, "n_gold": 10, "n_pred": 8}]
+    base = aggregate_report(tables, pmids)
+    base.update(aggregate)
+    return {"aggregate": base}
+
+
+def test_aggregate_report():
+    aggregate = report()["aggregate"]
+    assert (aggregate["tables"], aggregate["failed_tables"], aggregate["prompt_tokens"]) == (1, 0, 800)
+    assert aggregate["precision"] == 1.0
+    assert aggregate["recall"] == pytest.approx(0.8)
+    assert aggregate["f1"] == pytest.approx(2 * 0.8 / 1.8)
+
+
+def test_compare_reports_flags_changes_beyond_tolerance():
+    previous = report()
+    rows = {row[0]: row for row in compare_reports(previous, previous)}
+    assert set(rows) == set(REPORT_METRICS)
+    assert not any(row[4] for row in rows.values())
+
+    current = report(wall_time=10.5, tokens=1100, f1=previous["aggregate"]["f1"] - 0.05, failed_tables=1)
+    rows = {row[0]: row for row in compare_reports(previous, current)}
+    assert rows["wall_time"][3] == pytest.approx(0.05) and not rows["wall_time"][4]
+    assert rows["tokens"][4]
+    assert rows["f1"][4]
+    assert rows["failed_tables"][3] == float("inf") and rows["failed_tables"][4]
+
+    improved = report(tokens=500, f1=1.0)
+    rows = {row[0]: row for row in compare_reports(previous, improved)}
+    assert not rows["tokens"][4] and not rows["f1"][4]
@@ -0,0 +1,57 @@
+import pytest
+from TabFuncFlow.utils.cache_utils import *
+
+
+def test_cache_key_is_stable_and_covers_the_request():
+    key = make_llm_cache_key("gemini_15_pro", ["a", "b"], "q", {"temperature": 0})
+    assert key == make_llm_cache_key("gemini_15_pro", ("a", "b"), "q", {"temperature": 0})
+    assert key != make_llm_cache_key("chatgpt_4o", ["a", "b"], "q", {"temperature": 0})
+    assert key != make_llm_cache_key("gemini_15_pro", ["a", "b "], "q", {"temperature": 0})
+    assert key != make_llm_cache_key("gemini_15_pro", ["a", "b"], "q2", {"temperature": 0})
+    assert key != make_llm_cache_key("gemini_15_pro", ["a", "b"], "q", {"temperature": 1})
+    assert key != make_llm_cache_key("gemini_15_pro", ["ab"], "q", {"temperature": 0})
+
+
+def test_get_returns_the_stored_response(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get("k") is None
+    cache.set("k", "m", (True, "<<answer>>", 12, False))
+    assert cache.get("k") == (True, "<<answer>>", 12, False)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["entries"]) == (1, 1, 1, 1)
+
+
+def test_off_and_refresh_modes(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    LLMResponseCache(path).set("k", "m", (True, "old", 1, False))
+    assert LLMResponseCache(path, mode="off").get("k") is None
+    refresh = LLMResponseCache(path, mode="refresh")
+    assert refresh.get("k") is None
+    refresh.set("k", "m", (True, "new", 1, False))
+    assert LLMResponseCache(path).get("k") == (True, "new", 1, False)
+    with pytest.raises(ValueError):
+        LLMResponseCache(path, mode="sometimes")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    response = (True, "x" * 100, 1, False)
+    cache.set("a", "m", response)
+    cache.set("b", "m", response)
+    cache.max_bytes = cache.stats()["bytes"]
+    cache.get("a")
+    cache.set("c", "m", response)
+    assert cache.get("b") is None
+    assert cache.get("a") == response
+    assert cache.get("c") == response
+    assert cache.evictions == 1
+
+
+def test_process_cache_is_opt_in(monkeypatch):
+    import TabFuncFlow.utils.cache_utils as cache_utils
+    monkeypatch.setattr(cache_utils, "_llm_cache", None)
+    monkeypatch.delenv("LLM_CACHE_MODE", raising=False)
+    assert not get_llm_cache().enabled
+    monkeypatch.setattr(cache_utils, "_llm_cache", None)
+    monkeypatch.setenv("LLM_CACHE_MODE", "on")
+    assert get_llm_cache().enabled
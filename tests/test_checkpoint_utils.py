@@ -0,0 +1,66 @@
+from TabFuncFlow.utils.checkpoint_utils import *
+from TabFuncFlow.utils.exec_utils import *
+from TabFuncFlow.utils.step_utils import configure_step_cascade, configure_step_engine
+
+
+def test_key_covers_the_options_that_change_step_outputs():
+    key = make_checkpoint_key("pk_summary", "| a |", "caption", "gemini_15_pro", {"prompt_slicing": False})
+    assert key == make_checkpoint_key("pk_summary", "| a |", "caption", "gemini_15_pro", {"prompt_slicing": False})
+    assert key != make_checkpoint_key("pk_summary", "| a |", "caption", "gemini_15_pro", {"prompt_slicing": True})
+    assert key != make_checkpoint_key("pk_summary", "| a |", "caption", "chatgpt_4o", {"prompt_slicing": False})
+    reask_fraction = STEP_ENGINE_DEFAULTS["reask_fraction"]
+    try:
+        configure_step_engine(reask_fraction=0)
+        assert key != make_checkpoint_key("pk_summary", "| a |", "caption", "gemini_15_pro", {"prompt_slicing": False})
+    finally:
+        configure_step_engine(reask_fraction=reask_fraction)
+    cascades = dict(STEP_CASCADES)
+    try:
+        configure_step_cascade({"*": ["gemini_15_flash"]})
+        assert key != make_checkpoint_key("pk_summary", "| a |", "caption", "gemini_15_pro", {"prompt_slicing": False})
+    finally:
+        configure_step_cascade(cascades)
+
+
+def test_resume_restores_finished_steps(tmp_path):
+    calls = []
+
+    def step(name, output):
+        def run():
+            calls.append(name)
+            return output
+        return run
+
+    first = StepCheckpoint(str(tmp_path), "pk_summary", "| a |", "caption", "gemini_15_pro")
+    assert first.run("drug_info", step("drug_info", ["drugs", True, "content", 10, False])) == \
+        ["drugs", True, "content", 10, False]
+    assert first.run("failed", step("failed", None)) is None
+
+    second = StepCheckpoint(str(tmp_path), "pk_summary", "| a |", "caption", "gemini_15_pro")
+    assert second.run("drug_info", step("drug_info", None)) == ("drugs", True, "content", 10, False)
+    assert second.run("failed", step("failed", ("patients", True, "", 1, False))) == ("patients", True, "", 1, False)
+    assert calls == ["drug_info", "failed", "failed"]
+    assert second.restored == 1
+
+    other = StepCheckpoint(str(tmp_path), "pk_summary", "| a |", "caption", "gemini_15_pro", {"prompt_slicing": True})
+    assert other.state == {}
+
+
+def test_wrapped_nodes_and_tasks_resume_under_distinct_names(tmp_path):
+    calls = []
+
+    def task(name):
+        def run(*deps):
+            calls.append(name)
+            return name, True, "", 0, False
+        return run
+
+    tasks = {("unit", "a:b"): task("1"), ("unit:a", "b"): task("2")}
+    nodes = {"a": ([], task("a")), "b": (["a"], task("b"))}
+    for _ in range(2):
+        checkpoint = StepCheckpoint(str(tmp_path), "pk_summary", "| a |", "caption", "gemini_15_pro")
+        results = run_fan_out(checkpoint.wrap_tasks(tasks))
+        assert [results[key][0] for key in tasks] == ["1", "2"]
+        assert run_dag(checkpoint.wrap_nodes(nodes))["b"][0] == "b"
+    assert sorted(calls) == ["1", "2", "a", "b"]
+    assert checkpoint.restored == 4
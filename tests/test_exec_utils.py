@@ -0,0 +1,89 @@
+import threading
+import time
+import pytest
+from TabFuncFlow.utils.exec_utils import *
+
+
+def test_nodes_run_after_their_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def node(name, value):
+        def run(deps):
+            with lock:
+                order.append(name)
+            return value + sum(deps.values())
+        return run
+
+    results = run_dag({
+        "d": (["b", "c"], node("d", 1)),
+        "a": ([], node("a", 1)),
+        "b": (["a"], node("b", 1)),
+        "c": (["a"], node("c", 1)),
+    })
+    assert results == {"a": 1, "b": 2, "c": 2, "d": 5}
+    assert order[0] == "a" and order[-1] == "d"
+
+
+def test_independent_nodes_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+    results = run_dag({
+        "a": ([], lambda deps: barrier.wait() is not None),
+        "b": ([], lambda deps: barrier.wait() is not None),
+    }, max_workers=2)
+    assert results == {"a": True, "b": True}
+
+
+def test_none_result_skips_dependents():
+    ran = []
+    results = run_dag({
+        "a": ([], lambda deps: None),
+        "b": (["a"], lambda deps: ran.append("b")),
+        "c": (["b"], lambda deps: ran.append("c")),
+    })
+    assert results == {"a": None, "b": None, "c": None}
+    assert ran == []
+
+
+def test_errors():
+    with pytest.raises(ValueError, match="unknown node"):
+        run_dag({"a": (["missing"], lambda deps: 1)})
+    with pytest.raises(ValueError, match="cycle"):
+        run_dag({"a": (["b"], lambda deps: 1), "b": (["a"], lambda deps: 1)})
+    with pytest.raises(KeyError):
+        run_dag({"a": ([], lambda deps: {}["x"])})
+
+
+def test_fan_out_results_keep_the_task_order():
+    finished = []
+
+    def task(i):
+        def run():
+            time.sleep(0.05 * (3 - i))
+            finished.append(i)
+            return i
+        return run
+
+    results = run_fan_out({("value", i): task(i) for i in range(4)}, max_workers=4)
+    assert finished == [3, 2, 1, 0]
+    assert list(results.items()) == [(("value", i), i) for i in range(4)]
+
+
+def test_fan_out_failure_cancels_pending_tasks():
+    release = threading.Event()
+    ran = []
+
+    def fail(message):
+        def run():
+            raise RuntimeError(message)
+        return run
+
+    tasks = {
+        "a": fail("first"),
+        "b": lambda: release.wait(0.5),
+        "c": lambda: ran.append("c"),
+        "d": lambda: ran.append("d"),
+    }
+    with pytest.raises(RuntimeError, match="first"):
+        run_fan_out(tasks, max_workers=1)
+    assert ran == []
@@ -0,0 +1,105 @@
+import asyncio
+import time
+import pytest
+import TabFuncFlow.utils.hedge_utils as hedge_utils
+import TabFuncFlow.utils.rate_limit_utils as rate_limit_utils
+from TabFuncFlow.utils.llm_utils import *
+
+
+def sender(latencies, responses, sent):
+    """
+    Coroutine function answering its n-th call with responses[n] after latencies[n] seconds.
+    """
+    async def send():
+        n = len(sent)
+        sent.append(n)
+        await asyncio.sleep(latencies[n])
+        return responses[n]
+    return send
+
+
+def test_delay_needs_min_samples_and_follows_the_percentile():
+    hedger = LLMHedger(percentile=0.9, min_samples=3)
+    assert hedger.delay("m", "s") is None
+    for latency in [3.0, 1.0]:
+        hedger.record("m", "s", latency)
+    assert hedger.delay("m", "s") is None
+    hedger.record("m", "s", 2.0)
+    assert hedger.delay("m", "s") == 3.0
+    assert hedger.delay("m", "other") is None
+    assert LLMHedger(percentile=None, min_samples=0).delay("m", "s") is None
+    with pytest.raises(ValueError):
+        LLMHedger(percentile=1.5)
+
+
+def test_slow_request_is_hedged_and_the_fast_duplicate_wins():
+    hedger = LLMHedger(percentile=0.5, min_samples=1, max_ratio=1.0)
+    hedger.record("m", "s", 0.01)
+    sent = []
+    send = sender([5.0, 0.0], [(True, "slow", 1, False), (True, "fast", 1, False)], sent)
+    response, hedged = asyncio.run(hedger.arun(send, "m", "s", 100))
+    assert (response[1], hedged) == ("fast", True)
+    assert len(sent) == 2
+    assert hedger.stats()["hedge_wins"] == 1
+
+
+def test_hedges_stay_within_max_ratio():
+    hedger = LLMHedger(percentile=0.5, min_samples=1, max_ratio=0.5)
+    # Enough fast samples that the cancelled requests do not move the median.
+    for _ in range(20):
+        hedger.record("m", "s", 0.01)
+    sent = []
+    send = sender([0.05] * 10, [(True, "ok", 1, False)] * 10, sent)
+
+    async def run():
+        return [await hedger.arun(send, "m", "s", 100) for _ in range(4)]
+
+    hedged = [h for _, h in asyncio.run(run())]
+    # The duplicates may use at most half of the prompt tokens sent so far: 100 of 200, then 200 of 400.
+    assert hedged == [False, True, False, True]
+    stats = hedger.stats()
+    assert (stats["requests"], stats["request_tokens"]) == (4, 400)
+    assert (stats["hedges"], stats["hedge_tokens"], stats["skipped"]) == (2, 200, 2)
+    assert stats["hedge_tokens"] <= hedger.max_ratio * stats["request_tokens"]
+
+
+def test_rejected_response_is_only_used_when_the_other_fails_too():
+    hedger = LLMHedger(percentile=0.5, min_samples=1, max_ratio=1.0)
+    hedger.record("m", "s", 0.01)
+    accept = lambda response: response[1].startswith("<<")
+
+    sent = []
+    send = sender([0.1, 0.0], [(True, "<<good>>", 1, False), (True, "bad", 1, False)], sent)
+    response, _ = asyncio.run(hedger.arun(send, "m", "s", 10, accept))
+    assert response[1] == "<<good>>"
+
+    sent = []
+    send = sender([0.1, 0.0], [(True, "bad first", 1, False), (True, "bad second", 1, False)], sent)
+    response, _ = asyncio.run(hedger.arun(send, "m", "s", 10, accept))
+    assert response[1] == "bad second"
+
+
+def test_cancelled_request_releases_its_rate_limit_reservation(monkeypatch):
+    monkeypatch.setattr(time, "time", lambda: 1000.0)
+    limiter = LLMRateLimiter({"fake": (None, 10000)})
+    monkeypatch.setattr(rate_limit_utils, "_llm_rate_limiter", limiter)
+    hedger = LLMHedger(percentile=0.5, min_samples=1, max_ratio=1.0)
+    hedger.record("fake", "s", 0.01)
+    monkeypatch.setattr(hedge_utils, "_llm_hedger", hedger)
+    calls = []
+
+    async def arequest(prompt_list, question):
+        calls.append(prompt_list)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return True, "<<answer>>", 7, False
+
+    monkeypatch.setitem(LLM_PROVIDERS, "fake", (None, arequest, lambda: {}))
+    assert get_llm_response(["prompt"], "question", "fake", step="s") == (True, "<<answer>>", 7, False)
+    assert len(calls) == 2
+    # The cancelled request settles on the event loop thread once it sees the cancellation.
+    for _ in range(100):
+        if limiter.store.transact(lambda levels: levels["fake:tpm"][0]) == 10000 - 7:
+            break
+        time.sleep(0.01)
+    assert limiter.store.transact(lambda levels: levels["fake:tpm"][0]) == 10000 - 7
@@ -0,0 +1,34 @@
+import threading
+import TabFuncFlow.utils.cache_utils as cache_utils
+from TabFuncFlow.utils.llm_utils import *
+
+
+def test_cached_responses_skip_the_provider_and_the_event_loop(tmp_path, monkeypatch):
+    calls = []
+
+    async def arequest(prompt_list, question):
+        calls.append(prompt_list)
+        return True, "<<answer>>", 3, False
+
+    monkeypatch.setitem(LLM_PROVIDERS, "fake", (None, arequest, lambda: {}))
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(cache_utils, "_llm_cache", cache)
+    cache_threads = []
+    for method in ("get", "set"):
+        original = getattr(cache, method)
+
+        def record(*args, _original=original):
+            cache_threads.append(threading.current_thread())
+            return _original(*args)
+
+        monkeypatch.setattr(cache, method, record)
+
+    first = get_llm_response(["prompt"], "question", "fake")
+    second = get_llm_response(["prompt"], "question", "fake")
+    assert first == second == (True, "<<answer>>", 3, False)
+    assert len(calls) == 1
+    assert len(cache_threads) == 3
+    assert all(thread.name != "llm-event-loop" for thread in cache_threads)
+
+    get_llm_response(["prompt"], "question", "fake", refresh=True)
+    assert len(calls) == 2
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+from TabFuncFlow.utils.markdown_utils import *
+from TabFuncFlow.utils.table_utils import *
+
+
+CELLS = ["plain", "a|b", "line 1\nline 2", "back\\slash", "\\n is not a newline", "ends with \\", "\\|", "|\\\n", ""]
+
+
+@pytest.mark.parametrize("cell", CELLS)
+def test_escape_round_trip(cell):
+    escaped = escape_markdown_cell(cell)
+    assert '|' not in escaped.replace('\\|', '') and '\n' not in escaped
+    assert unescape_markdown_cell(escaped) == cell
+
+
+def test_cells_without_escapes_are_unchanged():
+    for cell in ["plain", "back\\slash", "C:\\data", "ends with \\"]:
+        assert escape_markdown_cell(cell) == cell
+
+
+def test_split_markdown_row_keeps_escaped_pipes():
+    assert split_markdown_row("| a\\|b | c |") == ["", " a\\|b ", " c ", ""]
+    assert split_markdown_row("| a | b |") == "| a | b |".split("|")
+    assert parse_markdown_rows(["| a\\|b | c\\nd |"]) == [["a|b", "c\nd"]]
+
+
+def test_dataframe_round_trip():
+    df = pd.DataFrame({"Name": ["a|b", "x\ny", "C:\\data"], "Value": [1, 2, 3], "Ratio": [0.5, 1.5, 2.0]})
+    md_table = dataframe_to_markdown(df)
+    assert md_table.count("\n") == 4
+    back = markdown_to_dataframe(md_table)
+    assert list(back.columns) == ["Name", "Value", "Ratio"]
+    assert back["Name"].tolist() == ["a|b", "x\ny", "C:\\data"]
+    assert back["Value"].tolist() == ["1", "2", "3"]
+    assert as_table(str(md_table)).rows == as_table(md_table).rows
+
+
+def test_dataframe_to_cells_keeps_integer_columns():
+    headers, rows = dataframe_to_cells(pd.DataFrame({0: [1, 2], "b": [1.5, None]}))
+    assert headers == ["0", "b"]
+    assert rows == [["1", "1.5"], ["2", "nan"]]
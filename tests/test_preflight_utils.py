@@ -0,0 +1,50 @@
+from TabFuncFlow.utils.preflight_utils import *
+from TabFuncFlow.utils.table_utils import Table
+
+
+SUMMARY_TABLE = Table.from_cells(["Parameter", "Children", "Adults"], [
+    ["Cmax (ng/mL)", "12.1 ± 3.2", "10.5 ± 2.1"],
+    ["AUC0-∞ (ng·h/mL)", "140 ± 30", "120 ± 25"],
+    ["t1/2 (h)", "5.1 ± 1.0", "6.2 ± 1.1"],
+])
+INDIVIDUAL_TABLE = Table.from_cells(["Patient", "Age (y)", "Dose (mg)", "Cmax (ng/mL)", "AUC (ng·h/mL)"],
+                                    [[str(i), str(20 + i), "10", str(10 + i), str(100 + i)] for i in range(1, 7)])
+DEMOGRAPHICS_TABLE = Table.from_cells(["Characteristic", "Group A", "Group B"], [
+    ["Age (years)", "34 (5)", "36 (6)"],
+    ["Weight (kg)", "70 (10)", "72 (9)"],
+    ["Male sex, n (%)", "10 (50)", "12 (60)"],
+])
+
+
+def test_classify_pk_table_rules():
+    label, confidence, _ = classify_pk_table_rules(SUMMARY_TABLE, "Pharmacokinetic parameters (mean ± SD)")
+    assert label == "pk_summary" and confidence >= PREFLIGHT_RULE_CONFIDENCE
+    label, confidence, _ = classify_pk_table_rules(INDIVIDUAL_TABLE, "Pharmacokinetic parameters of each patient")
+    assert label == "pk_individual" and confidence >= PREFLIGHT_RULE_CONFIDENCE
+    label, confidence, _ = classify_pk_table_rules(DEMOGRAPHICS_TABLE, "Baseline demographic characteristics")
+    assert label == "not_pk" and confidence >= PREFLIGHT_RULE_CONFIDENCE
+
+
+def test_a_pk_term_anywhere_keeps_the_table():
+    label, _, _ = classify_pk_table_rules(DEMOGRAPHICS_TABLE, "Baseline characteristics and plasma concentrations")
+    assert label != "not_pk"
+
+
+def test_classify_pk_table_asks_the_model_when_uncertain(fake_llm):
+    fake_llm.answer = lambda model, messages: "It lists demographics. <<not_pk>>"
+    label, res, content, usage, _ = classify_pk_table(SUMMARY_TABLE, "", "fake", rule_confidence=1.1)
+    assert (label, res, usage) == ("not_pk", True, 10)
+    assert content.startswith("Rule-based label: pk_summary")
+    assert len(fake_llm.requests) == 1
+
+    label, res, _, usage, _ = classify_pk_table(SUMMARY_TABLE, "Pharmacokinetic parameters (mean ± SD)", "fake")
+    assert (label, res, usage) == ("pk_summary", True, 0)
+    assert len(fake_llm.requests) == 1
+
+
+def test_failed_classification_falls_back_to_the_rule_label(fake_llm):
+    fake_llm.answer = lambda model, messages: "no label"
+    label, res, content, usage, _ = classify_pk_table(SUMMARY_TABLE, "", "fake", max_retries=2, initial_wait=0,
+                                                      rule_confidence=1.1)
+    assert (label, res, usage) == ("pk_summary", False, 0)
+    assert "Pre-flight classification failed (All 2 attempts failed. Unable to classify the table.)" in content
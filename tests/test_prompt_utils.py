@@ -0,0 +1,49 @@
+from TabFuncFlow.utils.prompt_utils import *
+
+
+MAIN_TABLE = Table.from_cells(["Parameter", "Children", "Adults"], [["Cmax", "1.2", "1.5"], ["AUC", "10", "12"]])
+
+
+def test_fragments_are_rendered_once_per_table():
+    reset_prompt_fragment_metrics()
+    assert prompt_table(MAIN_TABLE) == display_md_table(MAIN_TABLE)
+    assert prompt_table(str(MAIN_TABLE)) == display_md_table(MAIN_TABLE)
+    assert prompt_row_count(MAIN_TABLE) == 2
+    assert main_table_prompt(MAIN_TABLE, "Caption") == MAIN_TABLE_PROMPT.format(
+        table=display_md_table(MAIN_TABLE), caption="Caption")
+    metrics = get_prompt_fragment_metrics()
+    assert metrics["table"]["uses"] == 3 and metrics["table"]["renders"] == 1
+    assert metrics["row_count"]["renders"] == 1
+
+
+def test_least_recently_used_fragments_are_dropped():
+    cache = PromptFragmentCache(max_entries=2)
+    renders = []
+
+    def render(text):
+        return lambda: renders.append(text) or text.upper()
+
+    assert cache.get("table", "a", render("a")) == "A"
+    cache.get("table", "b", render("b"))
+    cache.get("table", "a", render("a"))
+    cache.get("table", "c", render("c"))
+    cache.get("table", "a", render("a"))
+    cache.get("table", "b", render("b"))
+    assert renders == ["a", "b", "c", "b"]
+    assert cache.metrics()["table"]["saved"] == 2
+
+
+def test_slice_main_table_keeps_the_needed_columns_in_order():
+    md_slice = slice_main_table(MAIN_TABLE, ["Adults", "Parameter", "Missing"])
+    assert md_slice.columns == ["Parameter", "Adults"]
+    assert md_slice.rows == [["Cmax", "1.5"], ["AUC", "12"]]
+    assert slice_main_table(MAIN_TABLE, ["Parameter", "Children", "Adults"]) is MAIN_TABLE
+    assert slice_main_table(MAIN_TABLE, ["Missing"]) is MAIN_TABLE
+
+
+def test_prompt_slicing_metrics():
+    reset_prompt_slicing_metrics()
+    saved = record_prompt_slicing(MAIN_TABLE, slice_main_table(MAIN_TABLE, ["Parameter"]), calls=3)
+    stats = get_prompt_slicing_metrics()
+    assert saved > 0 and stats["saved"] == saved and stats["calls"] == 3
+    assert stats["full_tokens"] == 3 * estimate_tokens(prompt_table(MAIN_TABLE))
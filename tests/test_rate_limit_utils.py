@@ -0,0 +1,73 @@
+import asyncio
+import time
+import pytest
+from TabFuncFlow.utils.rate_limit_utils import *
+from TabFuncFlow.utils.rate_limit_utils import _take
+
+
+def tpm_level(limiter, model):
+    return limiter.store.transact(lambda levels: levels[f"{model}:tpm"][0])
+
+
+def test_take_waits_for_the_missing_tokens():
+    levels = {}
+    assert _take(levels, {"tpm": 600.0}, {"tpm": 600.0}, now=0.0) == 0.0
+    assert levels["tpm"] == (0.0, 0.0)
+    # 600 tokens per minute refill 10 tokens per second.
+    assert _take(levels, {"tpm": 100.0}, {"tpm": 600.0}, now=5.0) == pytest.approx(5.0)
+    assert _take(levels, {"tpm": 100.0}, {"tpm": 600.0}, now=10.0) == 0.0
+    assert levels["tpm"] == (0.0, 10.0)
+
+
+def test_request_larger_than_the_bucket_only_waits_for_a_full_bucket():
+    levels = {"tpm": (0.0, 0.0)}
+    assert _take(levels, {"tpm": 1000.0}, {"tpm": 600.0}, now=30.0) == pytest.approx(30.0)
+
+
+def test_buckets_are_taken_together():
+    levels = {"rpm": (5.0, 0.0), "tpm": (0.0, 0.0)}
+    assert _take(levels, {"rpm": 1.0, "tpm": 10.0}, {"rpm": 60.0, "tpm": 60.0}, now=0.0) > 0
+    assert levels["rpm"][0] == 5.0
+
+
+@pytest.mark.parametrize("path", [None, "limits.sqlite"])
+def test_settle_refunds_and_charges(tmp_path, monkeypatch, path):
+    monkeypatch.setattr(time, "time", lambda: 1000.0)
+    limiter = LLMRateLimiter({"m": (None, 10000)}, path=str(tmp_path / path) if path else None)
+    reservation = limiter.reserve("m", 1000)
+    assert tpm_level(limiter, "m") == 9000
+    limiter.settle(reservation, 400)
+    assert tpm_level(limiter, "m") == 9600
+    limiter.settle(reservation, 3000)
+    assert tpm_level(limiter, "m") == 7600
+    limiter.settle(reservation, None)
+    assert tpm_level(limiter, "m") == 7600
+
+
+def test_refund_does_not_overfill_the_bucket():
+    limiter = LLMRateLimiter({"m": (None, 1000)})
+    reservation = limiter.reserve("m", 10)
+    limiter.settle(reservation, 0)
+    limiter.settle(reservation, 0)
+    assert tpm_level(limiter, "m") == 1000
+
+
+def test_async_reserve_settle_and_throttle(tmp_path):
+    limiter = LLMRateLimiter({"m": (60, 1000)}, path=str(tmp_path / "limits.sqlite"))
+
+    async def run():
+        reservation = await limiter.areserve("m", 100)
+        await limiter.asettle(reservation, 50)
+        await limiter.athrottle("m")
+
+    asyncio.run(run())
+    assert tpm_level(limiter, "m") == pytest.approx(0.0, abs=1)
+    assert limiter.stats()["requests"] == 1
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_models_without_limits_are_not_throttled():
+    limiter = LLMRateLimiter({})
+    assert limiter.reserve("m", 10**9) == ("m", 10**9)
+    limiter.settle(("m", 10**9), 0)
+    assert limiter.stats()["waits"] == 0
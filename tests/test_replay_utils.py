@@ -0,0 +1,59 @@
+from TabFuncFlow.utils.replay_utils import *
+
+
+def prompts(*contents):
+    return [{"role": "user", "content": c} for c in contents]
+
+
+def record(path, entries):
+    recorder = LLMReplay(str(path), record=True)
+    for messages, content in entries:
+        recorder.record_response(messages, "q", "gemini_15_pro", (True, content, 5, False), 0.2)
+
+
+def test_recorded_responses_are_replayed_in_turn(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    record(path, [(["a"], "<<first>>"), (["a"], "<<second>>"), (["b"], "<<other>>")])
+    replay = LLMReplay(str(path))
+    assert replay.request(prompts("a"), "q") == (True, "<<first>>", 5, False)
+    assert replay.request(prompts("a"), "q") == (True, "<<second>>", 5, False)
+    assert replay.request(prompts("a"), "q") == (True, "<<first>>", 5, False)
+    assert replay.request(prompts("b"), "q") == (True, "<<other>>", 5, False)
+    assert replay.request(prompts("c"), "q")[0] is False
+    assert replay.stats()["replayed"] == 4
+    assert replay.stats()["missing"] == 1
+
+
+def test_retries_fall_back_to_the_first_attempt(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    record(path, [(["a"], "<<answer>>")])
+    replay = LLMReplay(str(path))
+    retry = prompts("a", "Wrong answer example: ...")
+    assert replay.request(retry, "q") == (True, "<<answer>>", 5, False)
+    assert replay.request(prompts("b", "Wrong answer example: ..."), "q")[0] is False
+
+
+def test_failure_injection_is_deterministic(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    record(path, [([str(i)], f"<<[['{i}'], ['x']]>>") for i in range(40)])
+
+    def run(order, seed=0):
+        replay = LLMReplay(str(path), latency="lognormal:0.001,0.5",
+                           failures={"malformed": 0.3, "row_mismatch": 0.3}, seed=seed)
+        results = {}
+        for i in order:
+            entry, latency, failure = replay._draw([str(i)], "q")
+            results[i] = (latency, failure, replay._respond(entry, failure))
+        return results
+
+    forward = run(range(40))
+    # The draws do not depend on the order the requests arrive in.
+    assert forward == run(reversed(range(40)))
+    assert forward != run(range(40), seed=1)
+    failures = [failure for _, failure, _ in forward.values()]
+    assert "malformed" in failures and "row_mismatch" in failures and None in failures
+    for i, (_, failure, response) in forward.items():
+        if failure == "row_mismatch":
+            assert response[1] == f"<<[['{i}']]>>"
+        elif failure == "malformed":
+            assert ">>" not in response[1]
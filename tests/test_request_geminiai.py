@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+from extractor.request_geminiai import get_usage
+from extractor.utils import estimate_tokens
+
+
+MESSAGES = ["The following table contains PK data.", "Which drugs does it list?"]
+
+
+def test_usage_is_read_from_the_response_metadata():
+    res = SimpleNamespace(text="<<[1, 2]>>", usage_metadata=SimpleNamespace(total_token_count=321))
+    assert get_usage(res, MESSAGES) == 321
+
+
+def test_usage_is_estimated_without_metadata():
+    expected = estimate_tokens(MESSAGES) + estimate_tokens("<<[1, 2]>>")
+    assert expected > 0
+    assert get_usage(SimpleNamespace(text="<<[1, 2]>>"), MESSAGES) == expected
+    assert get_usage(SimpleNamespace(text="<<[1, 2]>>", usage_metadata=None), MESSAGES) == expected
+    assert get_usage(SimpleNamespace(text="<<[1, 2]>>", usage_metadata=SimpleNamespace(total_token_count=0)),
+                     MESSAGES) == expected
+
+
+def test_empty_response_has_no_usage():
+    assert get_usage(None, MESSAGES) == 0
+    assert get_usage(SimpleNamespace(text=None), MESSAGES) == 0
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+import extractor.request_openai as request_openai
+
+
+class StubClient(object):
+    """
+    Stands in for the langchain chat client: answers with the given texts in turn and records the messages.
+    """
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.sent = []
+
+    def _respond(self, messages):
+        self.sent.append([dict(m) for m in messages[0]])
+        text = self.texts.pop(0)
+        if isinstance(text, Exception):
+            raise text
+        return SimpleNamespace(generations=[[SimpleNamespace(text=text)]],
+                               llm_output={"token_usage": {"total_tokens": 7}})
+
+    def generate(self, messages):
+        return self._respond(messages)
+
+    async def agenerate(self, messages):
+        return self._respond(messages)
+
+
+def run_both(monkeypatch, texts):
+    outputs = []
+    for send in (lambda p, q: request_openai.request_to_chatgpt_4o(p, q),
+                 lambda p, q: asyncio.run(request_openai.arequest_to_chatgpt_4o(p, q))):
+        client = StubClient(texts)
+        monkeypatch.setattr(request_openai, "get_client_and_model", lambda: (client, "gpt-4o", None, None, None, None))
+        outputs.append((send([{"role": "user", "content": "table"}], "question"), client.sent))
+    return outputs
+
+
+def test_sync_and_async_requests_agree(monkeypatch):
+    (sync, sync_sent), (async_, async_sent) = run_both(monkeypatch, ["<<answer>>"])
+    assert sync == async_ == (True, "<<answer>>", 7, False)
+    assert sync_sent == async_sent == [[{"role": "user", "content": "table"}, {"role": "user", "content": "question"}]]
+
+
+def test_truncated_answers_are_continued(monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_OUTPUT_TOKENS", "30")
+    first = '[{"a": 1}, {"a": 2}, {"a": 3}, {"a": '
+    (sync, sync_sent), (async_, async_sent) = run_both(monkeypatch, [first, '[{"a": 4}]'])
+    assert sync == async_
+    assert sync[0] is True and sync[2] == 14 and sync[3] is True
+    assert sync_sent == async_sent and len(sync_sent) == 2
+    assert sync_sent[1][-2:] == [{"role": "assistant", "content": first},
+                                 {"role": "user", "content": request_openai.CONTINUE_PROMPT}]
+
+
+def test_request_errors(monkeypatch):
+    (sync, _), (async_, _) = run_both(monkeypatch, [RuntimeError("down")])
+    assert sync == async_ == (False, "down", None, None)
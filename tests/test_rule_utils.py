@@ -0,0 +1,65 @@
+import pytest
+from TabFuncFlow.utils.rule_utils import *
+
+
+MEAN_SD_MEDIAN_RANGE = find_statistics("Values are mean ± SD; tmax is median (range)")
+
+
+@pytest.mark.parametrize("cell, hints, expected", [
+    ("0.162 ± 0.090", [find_statistics("Cmax (ng/mL)"), MEAN_SD_MEDIAN_RANGE],
+     ["0.162", "Mean", "SD", "0.090", "N/A", "N/A", "N/A"]),
+    ("1.2 ± 0.3 (n = 16)", [find_statistics("Cmax (ng/mL)"), MEAN_SD_MEDIAN_RANGE],
+     ["1.2", "Mean", "SD", "0.3", "N/A", "N/A", "N/A"]),
+    ("12.96 (9.42–16.49)", [find_statistics("Tmax (h)"), MEAN_SD_MEDIAN_RANGE],
+     ["12.96", "Median", "N/A", "N/A", "Range", "9.42", "16.49"]),
+    ("3.1 [2.57, 3.63]", [find_statistics("Tmax (h)"), MEAN_SD_MEDIAN_RANGE],
+     ["3.1", "Median", "N/A", "N/A", "Range", "2.57", "3.63"]),
+    ("12.96 (9.42–16.49)", [find_statistics("AUC"), find_statistics("Values are geometric mean (90% CI)")],
+     ["12.96", "Geometric mean", "N/A", "N/A", "90% CI", "9.42", "16.49"]),
+    ("45 (CV 23%)", [find_statistics("AUC"), find_statistics("Data are geometric mean (CV%)")],
+     ["45", "Geometric mean", "CV%", "23", "N/A", "N/A", "N/A"]),
+    ("7.5", [find_statistics("Mean Cmax")], ["7.5", "Mean", "N/A", "N/A", "N/A", "N/A", "N/A"]),
+])
+def test_parse_value_cell(cell, hints, expected):
+    assert parse_value_cell(cell, hints) == expected
+
+
+@pytest.mark.parametrize("cell, hints", [
+    # Mean or median: the hints do not say which.
+    ("7.5", [MEAN_SD_MEDIAN_RANGE]),
+    ("12.96 (9.42–16.49)", [find_statistics("Values are mean (95% CI) or median (range)")]),
+    # A percentage in brackets is a CV only when the hints say so.
+    ("41 (68.3%)", [find_statistics("Cmax"), MEAN_SD_MEDIAN_RANGE]),
+    ("45 (CV 23%)", [find_statistics("Cmax"), MEAN_SD_MEDIAN_RANGE]),
+    ("5 (9–3)", [find_statistics("Tmax"), MEAN_SD_MEDIAN_RANGE]),
+    ("7.5", [find_statistics("")]),
+    ("BLQ", [find_statistics("Mean Cmax")]),
+])
+def test_parse_value_cell_leaves_ambiguous_cells_to_the_llm(cell, hints):
+    assert parse_value_cell(cell, hints) is None
+
+
+SPECIMENS = [
+    {"Drug name": "Lorazepam", "Analyte": "Lorazepam", "Specimen": "Plasma"},
+    {"Drug name": "Lorazepam", "Analyte": "Lorazepam", "Specimen": "Urine"},
+]
+
+
+def test_match_rows_by_labels_compares_the_distinguishing_columns():
+    rows = [
+        {"Parameter": "Cmax (plasma)", "Value": "1"},
+        {"Parameter": "Ae (urine)", "Value": "2"},
+        {"Parameter": "t1/2", "Value": "3"},
+        {"Parameter": "plasma/urine ratio", "Value": "4"},
+    ]
+    assert match_rows_by_labels(rows, SPECIMENS) == {0: 0, 1: 1}
+
+
+def test_match_rows_by_labels_matches_numbers_as_subject_counts_or_cells():
+    candidates = [{"Population": "Children", "N": "10"}, {"Population": "Children", "N": "12"}]
+    rows = [{"Group": "Children (n = 12)"}, {"Group": "Children"}, {"Group": "x", "N": "10"}, {"Group": "Day 10"}]
+    assert match_rows_by_labels(rows, candidates) == {0: 1, 2: 0}
+
+
+def test_match_rows_by_labels_needs_two_candidates():
+    assert match_rows_by_labels([{"Parameter": "Cmax (plasma)"}], SPECIMENS[:1]) == {}
@@ -0,0 +1,60 @@
+import os
+from TabFuncFlow.runners.run_batch import *
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<table></table>")
+
+
+def test_find_tables_keeps_sets_apart(tmp_path):
+    for path in ["set_a/123/1.html", "set_a/123/2.html", "set_b/123/1.html", "set_a/123/1.json"]:
+        touch(str(tmp_path / path))
+    tables = find_tables(str(tmp_path))
+    assert [t[:3] for t in tables] == [("set_a", "123", "1"), ("set_a", "123", "2"), ("set_b", "123", "1")]
+    assert [t[:3] for t in find_tables(str(tmp_path / "set_a"))] == [("", "123", "1"), ("", "123", "2")]
+    assert output_name("set_a", "123", "1") == "set_a_pmid123_table1"
+    assert output_name("", "123") == "pmid123"
+
+
+def test_queue_add_recover_resume_and_retry_failed(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    tables = [("s", "1", "1", "a.html"), ("s", "1", "2", "b.html"), ("s", "2", "1", "c.html")]
+    queue = BatchQueue(path)
+    assert queue.add(tables) == 3
+    assert queue.add(tables) == 0
+    assert [t[3] for t in queue.pending()] == ["a.html", "b.html", "c.html"]
+
+    # a.html finishes, b.html fails, c.html is still running when the run is killed.
+    for _, _, _, html_path in queue.pending():
+        queue.start(html_path)
+    queue.finish("a.html", 10, "a.csv", None)
+    queue.finish("b.html", 0, None, "RuntimeError: boom")
+    queue.close()
+
+    queue = BatchQueue(path)
+    assert queue.add(tables) == 0
+    assert queue.counts() == {"pending": 0, "running": 1, "done": 1, "failed": 1}
+    queue.recover()
+    assert [t[3] for t in queue.pending()] == ["c.html"]
+    assert queue.done_outputs() == [("s", "1", "a.csv", 10)]
+
+    queue.recover(retry_failed=True)
+    assert [t[3] for t in queue.pending()] == ["b.html", "c.html"]
+    queue.start("b.html")
+    assert queue.conn.execute("SELECT attempts FROM tasks WHERE html_path = 'b.html'").fetchone() == (2,)
+    queue.close()
+
+
+def test_merge_keeps_pmids_of_different_sets_apart(tmp_path):
+    outputs = []
+    for set_name, table_id, usage in [("set_a", "1", 5), ("set_a", "2", 7), ("set_b", "1", 11)]:
+        path = str(tmp_path / f"{output_name(set_name, '123', table_id)}_usage{usage}.csv")
+        pd.DataFrame({"Parameter value": [table_id]}).to_csv(path)
+        outputs.append((set_name, "123", path, usage))
+    merged_dir = tmp_path / "merged"
+    merge_csv_files(outputs, str(merged_dir))
+    assert sorted(os.listdir(merged_dir)) == ["set_a_pmid123_usage12.csv", "set_b_pmid123_usage11.csv"]
+    merge_csv_files(outputs[:1], str(merged_dir))
+    assert sorted(os.listdir(merged_dir)) == ["set_a_pmid123_usage5.csv", "set_b_pmid123_usage11.csv"]
@@ -0,0 +1,64 @@
+import pytest
+from TabFuncFlow.steps_pk_summary.s_pk_get_col_mapping import *
+from TabFuncFlow.utils.table_utils import Table
+
+
+NUMBERS = ["12.1", "140", "5.1 ± 1.0", "2001"]
+
+
+@pytest.mark.parametrize("header", ["Study", "Reference", "Ref.", "Year", "No.", "Ratio", "Collection time (min)"])
+def test_numeric_columns_under_non_value_headers_are_uncertain(header):
+    category, confidence, _ = classify_col_header(header, NUMBERS, pk_rows=True)
+    assert category == "Parameter value" and confidence < COL_MAPPING_RULE_CONFIDENCE
+
+
+@pytest.mark.parametrize("header", ["Range", "Group A", "Lorazepam"])
+def test_bare_numeric_columns_need_pk_rows(header):
+    category, confidence, _ = classify_col_header(header, NUMBERS)
+    assert category == "Parameter value" and confidence < COL_MAPPING_RULE_CONFIDENCE
+    category, confidence, _ = classify_col_header(header, NUMBERS, pk_rows=True)
+    assert category == "Parameter value" and confidence >= COL_MAPPING_RULE_CONFIDENCE
+
+
+@pytest.mark.parametrize("header", ["Cmax (ng/mL)", "Mean ± SD", "Patients with ARC.GM (95% CI)", "Cord blood (ng/ml)"])
+def test_pk_and_statistic_headers_are_confident(header):
+    category, confidence, _ = classify_col_header(header, NUMBERS)
+    assert category == "Parameter value" and confidence >= COL_MAPPING_RULE_CONFIDENCE
+
+
+def test_other_categories():
+    assert classify_col_header("Parameter type", ["Cmax"])[:2] == ("Parameter type", 1.0)
+    assert classify_col_header("P value*", ["0.03", "<0.001", "NS"])[:2] == ("P value", 1.0)
+    assert classify_col_header("Unit", ["ng/mL", "h"])[:2] == ("Parameter unit", 1.0)
+    assert classify_col_header("N", ["12", "10"])[:2] == ("Uncategorized", 0.95)
+    assert classify_col_header("Comment", ["see text", "n/a"])[0] == "Uncategorized"
+
+
+def test_rule_mapping_uses_the_parameter_type_rows():
+    pk_table = Table.from_cells(["Parameter type", "Children (n = 10)", "Adults (n = 12)", "P value"], [
+        ["Cmax (ng/mL)", "12.1 ± 3.2", "10.5 ± 2.1", "0.03"],
+        ["AUC0-∞ (ng·h/mL)", "140 ± 30", "120 ± 25", "0.2"],
+        ["t1/2 (h)", "5.1 ± 1.0", "6.2 ± 1.1", "NS"],
+    ])
+    mapping, confidence, reasoning = s_pk_get_col_mapping_rules(pk_table)
+    assert mapping == {"Parameter type": "Parameter type", "Children (n = 10)": "Parameter value",
+                       "Adults (n = 12)": "Parameter value", "P value": "P value"}
+    assert min(confidence.values()) >= COL_MAPPING_RULE_CONFIDENCE
+    assert "PK parameter rows" in reasoning
+
+    other_table = Table.from_cells(["Parameter type", "Study", "Group A"], [
+        ["Smith", "2001", "12"],
+        ["Jones", "2005", "14"],
+    ])
+    mapping, confidence, _ = s_pk_get_col_mapping_rules(other_table)
+    assert mapping["Study"] == mapping["Group A"] == "Parameter value"
+    assert confidence["Study"] < COL_MAPPING_RULE_CONFIDENCE
+    assert confidence["Group A"] < COL_MAPPING_RULE_CONFIDENCE
+
+
+def test_uncertain_mapping_asks_the_model(fake_llm):
+    table = Table.from_cells(["Parameter type", "Year"], [["Smith", "2001"], ["Jones", "2005"]])
+    fake_llm.answer = lambda model, messages: '<<{"Parameter type": "Parameter type", "Year": "Uncategorized"}>>'
+    mapping, res, _, usage, _ = s_pk_get_col_mapping(table, "fake")
+    assert (mapping, res, usage) == ({"Parameter type": "Parameter type", "Year": "Uncategorized"}, True, 10)
+    assert len(fake_llm.requests) == 1
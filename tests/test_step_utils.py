@@ -0,0 +1,119 @@
+import ast
+import pytest
+from TabFuncFlow.utils.step_utils import *
+
+
+def parse_list(content):
+    return ast.literal_eval(extract_answer(content, "No answer found."))
+
+
+def test_step_retries_with_feedback_until_the_answer_is_valid(fake_llm):
+    answers = iter(["<<[1]>>", "<<[1, 2]>>"])
+    fake_llm.answer = lambda model, messages: next(answers)
+    result, res, content, usage, truncated = run_llm_step(
+        ["prompt"], parse_list, "fake", max_retries=3, initial_wait=0, validators=[expect_rows(2)], name="test_step")
+    assert result == [1, 2]
+    assert (res, usage, truncated) == (True, 20, False)
+    assert "Attempt 1:\n<<[1]>>" in content and "Attempt 2:\n<<[1, 2]>>" in content
+    first, second = [messages for _, messages in fake_llm.requests]
+    assert first == ["prompt"]
+    assert second[0] == "prompt" and "Expected 2 rows" in second[1]
+
+
+def test_step_gives_up_after_max_retries(fake_llm):
+    fake_llm.answer = lambda model, messages: "no answer"
+    with pytest.raises(RuntimeError, match="All 2 attempts failed. Unable to test."):
+        run_llm_step(["prompt"], parse_list, "fake", max_retries=2, initial_wait=0,
+                     failure_message="Unable to test.", name="test_step")
+    assert len(fake_llm.requests) == 2
+
+
+def test_reconcile_rows_with_the_expected_count():
+    rows, unresolved = reconcile_rows([1, "x", 3], 3, check_row=lambda row: isinstance(row, int))
+    assert rows == {0: 1, 2: 3}
+    assert unresolved == [1]
+
+
+def test_reconcile_rows_lines_up_a_short_answer():
+    labels = ["a", "b", "c", "d"]
+    fits = lambda i, row: row == labels[i]
+    assert reconcile_rows(["a", "c", "d"], 4, fits=fits) == ({0: "a", 2: "c", 3: "d"}, [1])
+    assert reconcile_rows(["a", "c", "d"], 4) == ({}, [0, 1, 2, 3])
+    # An answer row fitting two table rows is not accepted.
+    assert reconcile_rows(["a", "a"], 3, fits=lambda i, row: i < 2) == ({}, [0, 1, 2])
+
+
+def test_reconcile_rows_drops_extra_answer_rows():
+    labels = ["a", "b"]
+    assert reconcile_rows(["a", "z", "b"], 2, fits=lambda i, row: row == labels[i]) == ({0: "a", 1: "b"}, [])
+
+
+def test_row_step_asks_again_for_the_unresolved_rows_only(fake_llm):
+    md_table = Table.from_cells(["Name"], [["a"], ["b"], ["c"], ["d"]])
+
+    def build(md_rows):
+        names = [row[0] for row in as_table(md_rows).rows]
+
+        def parse(content):
+            answer = parse_list(content)
+            rows, unresolved = reconcile_rows(answer, len(names), check_row=lambda row: row != "?")
+            if unresolved:
+                raise StepRowsError("Malformed rows.", retry_feedback("Malformed rows."), rows, unresolved)
+            return answer
+
+        return [f"Rows: {names}"], parse
+
+    def answer(model, messages):
+        names = ast.literal_eval(messages[0][len("Rows: "):])
+        return "<<" + repr([name.upper() if name != "c" or len(names) == 1 else "?" for name in names]) + ">>"
+
+    fake_llm.answer = answer
+    rows, res, content, usage, truncated = run_llm_row_step(
+        build, md_table, "fake", max_retries=2, initial_wait=0, finish=tuple, name="test_row_step")
+    assert rows == ("A", "B", "C", "D")
+    assert [messages for _, messages in fake_llm.requests] == [["Rows: ['a', 'b', 'c', 'd']"], ["Rows: ['c']"]]
+    assert "(rows [2] asked again)" in content
+    assert usage == 20
+
+
+def test_plan_chunks_covers_every_row_in_balanced_windows():
+    assert plan_chunks([10] * 5, max_tokens=100) == [(0, 5)]
+    assert plan_chunks([10] * 10, max_tokens=None) == [(0, 10)]
+    assert plan_chunks([10] * 10, max_tokens=30) == [(0, 3), (3, 5), (5, 8), (8, 10)]
+    assert plan_chunks([100, 1, 1, 1], max_tokens=50) == [(0, 1), (1, 2), (2, 4)]
+
+
+def test_run_chunks_merges_windows_in_order():
+    def run_chunk(start, end):
+        return list(range(start, end)), start != 2, f"rows {start}-{end}", end - start, end == 5
+
+    results, res, content, usage, truncated = run_chunks([(0, 2), (2, 4), (4, 5)], run_chunk, max_workers=3)
+    assert results == [[0, 1], [2, 3], [4]]
+    assert (res, usage, truncated) == (False, 5, True)
+    assert content.startswith("Answer split into 3 row windows: [(0, 2), (2, 4), (4, 5)]\n\n")
+    assert content.index("Window 1/3 (rows 0-1):\nrows 0-2") < content.index("Window 3/3 (rows 4-4):\nrows 4-5")
+
+
+def test_cascade_escalation_keeps_the_cache_for_the_step_model(monkeypatch):
+    import TabFuncFlow.utils.step_utils as step_utils
+    requests = []
+
+    def get_llm_response(messages, question, model, step, refresh, accept):
+        requests.append((model, refresh))
+        return True, "<<[1]>>" if model == "fake_cheap" else "<<[1, 2]>>", 10, False
+
+    monkeypatch.setattr(step_utils, "get_llm_response", get_llm_response)
+    cascades = dict(STEP_CASCADES)
+    monkeypatch.setitem(LLM_PROVIDERS, "fake_cheap", (None, None, lambda: {}))
+    configure_step_cascade({"test_cascade": ["fake_cheap"]})
+    reset_step_metrics()
+    try:
+        result = run_llm_step(["prompt"], parse_list, "fake", max_retries=2, initial_wait=0,
+                              validators=[expect_rows(2)], name="test_cascade")[0]
+    finally:
+        configure_step_cascade(cascades)
+    assert result == [1, 2]
+    assert requests == [("fake_cheap", False), ("fake", False)]
+    stats = get_step_metrics()["test_cascade"]
+    assert stats["prompt_tokens_by_attempt"] == [stats["prompt_tokens"]]
+    assert stats["cascade_prompt_tokens"] == stats["prompt_tokens"] > 0
@@ -0,0 +1,101 @@
+import glob
+import os
+import pytest
+from TabFuncFlow.utils.table_utils import *
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "html")
+
+HTML_TABLES = [
+    """<table>
+      <tr><th rowspan="2">Parameter</th><th colspan="2">Dose</th><th></th></tr>
+      <tr><th>5 mg<sup>a</sup></th><th>10 mg</th><th></th></tr>
+      <tr><td>Cmax (ng/mL)</td><td>1.2 ± 0.3</td><td>2.5 ± 0.4</td><td></td></tr>
+      <tr><td rowspan="2">AUC</td><td>10 | 12</td><td>20<script>x</script></td><td></td></tr>
+      <tr><td>11</td><td>21</td><td></td></tr>
+      <tr><td></td><td></td><td></td><td></td></tr>
+    </table>""",
+    """<table>
+      <thead><tr><th>Group</th><th>N</th><th>N</th><th></th></tr></thead>
+      <tbody><tr><td>Children</td><td>10</td><td>12</td><td>x</td></tr>
+      <tr><td colspan="3">Adults</td><td>y</td></tr></tbody>
+    </table>""",
+    "<table><tr><th>Only header</th></tr></table>",
+    r"<table><tr><th>A\n</th><th>B</th></tr><tr><td>a\|b</td><td>c\d</td></tr></table>",
+]
+
+
+def string_passes(html):
+    return deduplicate_headers(fill_empty_headers(
+        remove_empty_col_row(stack_md_table_headers(html_table_to_markdown(html)))))
+
+
+def assert_same_table(md_table, expected):
+    assert md_table == expected
+    assert as_table(md_table).columns == Table(expected).columns
+    assert as_table(md_table).rows == Table(expected).rows
+
+
+@pytest.mark.parametrize("html", HTML_TABLES)
+def test_normalize_html_table_matches_the_string_passes(html):
+    assert_same_table(normalize_html_table(html), string_passes(html))
+
+
+@pytest.mark.skipif(not os.path.isdir(DATA_DIR), reason="no data/html")
+def test_normalize_html_table_matches_the_string_passes_on_the_corpus():
+    paths = sorted(glob.glob(os.path.join(DATA_DIR, "*", "*", "*.html")))[:40]
+    assert paths
+    for path in paths:
+        html = get_html_content_from_file(path)
+        assert_same_table(normalize_html_table(html), string_passes(html))
+
+
+def test_single_table_is_enforced():
+    with pytest.raises(ValueError):
+        single_html_table_to_markdown(HTML_TABLES[0] + HTML_TABLES[1])
+    with pytest.raises(ValueError):
+        single_html_table_to_markdown("<p>No table</p>")
+    assert single_html_table_to_markdown(HTML_TABLES[1]) == string_passes(HTML_TABLES[1])
+
+
+STACKED_HTML = """<table>
+  <tr><th rowspan="2">Parameter</th><th colspan="2">Children</th><th>Adults</th><th rowspan="2">Unit</th></tr>
+  <tr><th>Mean</th><th>SD</th><th>Mean</th></tr>
+  <tr><td>Cmax</td><td>1.2</td><td>0.3</td><td>2.5</td><td>ng/mL</td></tr>
+  <tr><td>AUC</td><td>10</td><td>2</td><td>20</td><td>ng·h/mL</td></tr>
+  <tr><td>t1/2</td><td>5</td><td>1</td><td>6</td><td>h</td></tr>
+</table>"""
+
+
+def test_select_keeps_stacked_headers():
+    md_table = stack_md_table_headers(html_table_to_markdown(STACKED_HTML))
+    table = as_table(md_table)
+    assert table.columns == ["Parameter", "Children.Mean", "Children.SD", "Adults.Mean", "Unit"]
+    selected = table.select([0, 2], ["Parameter", "Children.SD", "Adults.Mean"])
+    assert isinstance(selected, Table)
+    assert selected.columns == ["Parameter", "Children.SD", "Adults.Mean"]
+    assert selected.rows == [["Cmax", "0.3", "2.5"], ["t1/2", "1", "6"]]
+    df_table = markdown_to_dataframe(md_table).iloc[[0, 2]][["Parameter", "Children.SD", "Adults.Mean"]]
+    assert selected == dataframe_to_markdown(df_table.reset_index(drop=True))
+    # A header that is the same on every level is not repeated.
+    assert table.select(None, ["Unit", "Parameter"]).rows == [["ng/mL", "Cmax"], ["ng·h/mL", "AUC"], ["h", "t1/2"]]
+
+
+def test_string_operations_return_plain_strings():
+    table = Table.from_cells(["A", "B"], [["1", "2"]])
+    for result in [table + "\n", "x" + table, table[:5], table.replace("1", "3"), table.strip(), table * 2]:
+        assert type(result) is str
+    replaced = as_table(table.replace("1", "3"))
+    assert replaced.rows == [["3", "2"]]
+    assert table.rows == [["1", "2"]]
+
+
+def test_as_table_round_trips_strings():
+    md_table = "| A | B |\n| --- | --- |\n| 1 | x \\| y |\n| 2 |  |"
+    table = as_table(md_table)
+    assert isinstance(table, Table) and table == md_table and str(table) == md_table
+    assert as_table(table) is table
+    assert table.columns == ["A", "B"]
+    assert table.rows == [["1", "x | y"], ["2", ""]]
+    assert dataframe_to_markdown(table.to_dataframe()) == md_table
+    assert as_table("") == "" and as_table("").shape == (0, 0)